@@ -1,35 +1,135 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, stream_template
 from routes.users.users import users_bp
 from routes.customers.customers import customers_bp
 from routes.products.products import products_bp
 from routes.orders.orders import orders_bp
-import pandas as pd
-
-EXCEL_FILE = "data_new.xlsx"
+from services.storage import configure_storage, get_storage, import_excel, SQLITE_FILE, SCHEMAS
+from services.pagination import page_args, paginate, iter_records
+from services.schema import records
+from services.dashboard import dashboard_metrics, PROFIT_MARGIN
+from services.reports import sales_reports, REPORTS, DEFAULT_TOP
+from services.credentials import credential_store, DEFAULT_HASH_METHOD
+from services.sheets import EXCEL_FILE
+from services.snapshot import rebuild_snapshot, snapshot_path
+from services.journal import JOURNAL_FILE, JOURNAL_SHEETS
+from services.inventory import inventory, INVENTORY_FILE
+from services.indexes import join
+from services.page_cache import page_cache, DEFAULT_MAX_BYTES
+from services.api import API_WORKERS, API_MAX_PENDING
+from services.jobs import jobs, task, JOBS_FILE, JOB_WORKERS
+from services.integrity import integrity, INTEGRITY_FILE, CHECK_DELAY
+from services.images import image_cache, IMAGE_CACHE_DIR, IMAGE_CACHE_BYTES, IMAGE_MAX_BYTES, THUMBNAIL_SIZE
+from services import metrics
+from services import sessions
+import os
+import click
 
 # ---------- Helper ----------
 def read_sheet(sheet_name):
-    """Read any Excel sheet and normalize column names"""
-    df = pd.read_excel(EXCEL_FILE, sheet_name=sheet_name)
-    df.columns = df.columns.str.strip().str.lower()
-    return df
-
-def read_users():
-    """Read users sheet specifically for login"""
-    df = pd.read_excel(EXCEL_FILE, sheet_name="users")
-    df.columns = df.columns.str.strip().str.lower()
-    return df
+    """Read any sheet (column names normalized) from the configured storage"""
+    with metrics.span(f"read_sheet {sheet_name}"):
+        return get_storage().read(sheet_name)
 
 # ---------- Flask App ----------
 app = Flask(__name__, template_folder="templates")
 app.secret_key = "your_secret_key"
 
+# ---------- Storage ----------
+# STORAGE_BACKEND is "excel" (default, whole-sheet rewrites) or "sqlite"
+app.config["STORAGE_BACKEND"] = os.environ.get("STORAGE_BACKEND", "excel")
+app.config["EXCEL_FILE"] = os.environ.get("EXCEL_FILE", EXCEL_FILE)
+app.config["SQLITE_FILE"] = os.environ.get("SQLITE_FILE", SQLITE_FILE)
+# Row changes to JOURNAL_SHEETS are journaled (and compacted in the
+# background) on the Excel backend; set JOURNAL_FILE to an empty string to
+# write them directly.
+app.config["JOURNAL_FILE"] = os.environ.get(
+    "JOURNAL_FILE", JOURNAL_FILE if app.config["STORAGE_BACKEND"] == "excel" else ""
+)
+app.config["JOURNAL_SHEETS"] = os.environ.get("JOURNAL_SHEETS", ",".join(JOURNAL_SHEETS))
+# Keep a parsed binary copy of the workbook next to it (data_new.xlsx.snapshot)
+# so restarts skip openpyxl; set EXCEL_SNAPSHOT=0 to always parse the .xlsx.
+app.config["EXCEL_SNAPSHOT"] = os.environ.get("EXCEL_SNAPSHOT", "1") != "0"
+# Workers map one shared copy of the parsed sheets (data_new.xlsx.shared/)
+# instead of each holding their own; EXCEL_SHARED=0 turns that off.
+app.config["EXCEL_SHARED"] = os.environ.get("EXCEL_SHARED", "1") != "0"
+# Live stock counters shared by every worker (memory-mapped file)
+app.config["INVENTORY_FILE"] = os.environ.get("INVENTORY_FILE", INVENTORY_FILE)
+inventory.configure(app.config["INVENTORY_FILE"])
+# Instrumentation: /metrics (guarded by METRICS_TOKEN when set) and, with
+# PROFILE_THRESHOLD_MS set, collapsed stacks of slower requests in PROFILE_DIR
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN", "")
+app.config["PROFILE_THRESHOLD_MS"] = os.environ.get("PROFILE_THRESHOLD_MS", "")
+app.config["PROFILE_DIR"] = os.environ.get("PROFILE_DIR", "profiles")
+metrics.init_app(app)
+# Memory budget of the rendered catalog pages (/products, /products/details)
+app.config["PAGE_CACHE_BYTES"] = int(os.environ.get("PAGE_CACHE_BYTES", DEFAULT_MAX_BYTES))
+page_cache.configure(app.config["PAGE_CACHE_BYTES"])
+# Read-only JSON API (asgi.py): worker threads and how many requests may wait
+app.config["API_WORKERS"] = int(os.environ.get("API_WORKERS", API_WORKERS))
+app.config["API_MAX_PENDING"] = int(os.environ.get("API_MAX_PENDING", API_MAX_PENDING))
+# Share of revenue reported as profit on the dashboard and in the reports
+app.config["PROFIT_MARGIN"] = float(os.environ.get("PROFIT_MARGIN", PROFIT_MARGIN))
+dashboard_metrics.margin = app.config["PROFIT_MARGIN"]
+# Sessions live server-side: SESSION_BACKEND is "sqlite" (shared by all
+# workers, SESSION_FILE), "memory" (single process) or "cookie" (Flask's
+# signed cookie). SESSION_TTL is in seconds.
+app.config["SESSION_BACKEND"] = os.environ.get("SESSION_BACKEND", "sqlite")
+app.config["SESSION_FILE"] = os.environ.get("SESSION_FILE", sessions.SESSION_FILE)
+app.config["SESSION_TTL"] = int(os.environ.get("SESSION_TTL", sessions.DEFAULT_TTL))
+sessions.init_app(app, app.config["SESSION_BACKEND"], app.config["SESSION_FILE"], app.config["SESSION_TTL"])
+# Background jobs: worker threads per process, and the file recording every
+# job's status so any worker can answer /jobs/<id>
+app.config["JOBS_FILE"] = os.environ.get("JOBS_FILE", JOBS_FILE)
+app.config["JOB_WORKERS"] = int(os.environ.get("JOB_WORKERS", JOB_WORKERS))
+jobs.configure(app.config["JOBS_FILE"], app.config["JOB_WORKERS"])
+# Integrity checks: state of the last run, whether to check at startup, and
+# how long after a change the background check runs (seconds)
+app.config["INTEGRITY_FILE"] = os.environ.get("INTEGRITY_FILE", INTEGRITY_FILE)
+app.config["INTEGRITY_CHECK"] = os.environ.get("INTEGRITY_CHECK", "1") != "0"
+app.config["INTEGRITY_DELAY"] = float(os.environ.get("INTEGRITY_DELAY", CHECK_DELAY))
+integrity.configure(app.config["INTEGRITY_FILE"], app.config["INTEGRITY_DELAY"])
+# Product thumbnails: cache directory and its disk budget, thumbnail box
+# size (px) and the largest source image accepted. IMAGE_LOCAL_SOURCES=1
+# also fetches file:// URLs and private hosts (development and tests only).
+app.config["IMAGE_CACHE_DIR"] = os.environ.get("IMAGE_CACHE_DIR", IMAGE_CACHE_DIR)
+app.config["IMAGE_CACHE_BYTES"] = int(os.environ.get("IMAGE_CACHE_BYTES", IMAGE_CACHE_BYTES))
+app.config["THUMBNAIL_SIZE"] = int(os.environ.get("THUMBNAIL_SIZE", THUMBNAIL_SIZE))
+app.config["IMAGE_MAX_BYTES"] = int(os.environ.get("IMAGE_MAX_BYTES", IMAGE_MAX_BYTES))
+app.config["IMAGE_LOCAL_SOURCES"] = os.environ.get("IMAGE_LOCAL_SOURCES", "0") == "1"
+image_cache.configure(
+    app.config["IMAGE_CACHE_DIR"],
+    max_bytes=app.config["IMAGE_CACHE_BYTES"],
+    size=app.config["THUMBNAIL_SIZE"],
+    max_source_bytes=app.config["IMAGE_MAX_BYTES"],
+    local_sources=app.config["IMAGE_LOCAL_SOURCES"],
+)
+# werkzeug hash method and cost, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"
+app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", DEFAULT_HASH_METHOD)
+credential_store.configure(app.config["PASSWORD_HASH_METHOD"])
+configure_storage(
+    app.config["STORAGE_BACKEND"],
+    excel_file=app.config["EXCEL_FILE"],
+    sqlite_file=app.config["SQLITE_FILE"],
+    journal_file=app.config["JOURNAL_FILE"],
+    journal_sheets=[s.strip() for s in app.config["JOURNAL_SHEETS"].split(",") if s.strip()],
+    excel_snapshot=app.config["EXCEL_SNAPSHOT"],
+    excel_shared=app.config["EXCEL_SHARED"],
+)
+
 # ---------- Register Blueprints ----------
 app.register_blueprint(users_bp, url_prefix="/users")
 app.register_blueprint(customers_bp)
 app.register_blueprint(products_bp)
 app.register_blueprint(orders_bp)
 
+if app.config["INTEGRITY_CHECK"]:
+    jobs.enqueue("integrity.check", key="integrity.check")
+# Thumbnails for products whose image changed while no process was running
+if image_cache.enabled:
+    jobs.enqueue("images.sync", key="images.sync")
+else:
+    app.logger.warning("Pillow is not installed: product thumbnails are off, pages use each image_url")
+
 # ---------- Home Route ----------
 @app.route("/")
 def home():
@@ -46,19 +146,13 @@ def login():
         if role not in ["customer", "seller", "admin"]:
             return "Invalid role!", 403
 
-        users_df = read_users()
-        user = users_df[
-            (users_df["username"].str.strip() == username) &
-            (users_df["password"].str.strip() == password) &
-            (users_df["role"].str.strip().str.lower() == role)
-        ]
+        user = credential_store.authenticate(username, password, role)
 
-        if user.empty:
+        if user is None:
             return "Invalid credentials or role!", 403
 
-        # Save session info
-        session["user_id"] = int(user.iloc[0]["id"])
-        session["role"] = role
+        # Save session info (the user record is cached with it)
+        sessions.login_user(user, role)
 
         # Redirect based on role
         if role == "customer":
@@ -78,7 +172,7 @@ def view_products():
    
 
     products_df = read_sheet("products")
-    return render_template("products/details.html", products=products_df.to_dict(orient="records"))
+    return render_template("products/details.html", products=records(products_df))
 
 # ---------- Seller Manage Products ----------
 @app.route("/products/manage")
@@ -87,7 +181,7 @@ def manage_products():
         return "Unauthorized", 403
 
     products_df = read_sheet("products")
-    return render_template("products/manage_products.html", products=products_df.to_dict(orient="records"))
+    return render_template("products/manage_products.html", products=records(products_df))
 
 # ---------- Admin Route: View All Data ----------
 @app.route("/admin/dashboard")
@@ -99,36 +193,217 @@ def view_admin_data():
     products_df = read_sheet("products")
     orders_df = read_sheet("orders")
 
-    # Merge orders with products to show product name + price
-    merged_df = pd.merge(
-        orders_df,
-        products_df,
-        left_on="productid",
-        right_on="id",
-        suffixes=("_order", "_product"),
-        how="left"
+    # Totals come from the running aggregates instead of a full join
+    totals = dashboard_metrics.totals()
+
+    # Only the visible page of each table is converted to dicts
+    customers, customers_pagination = paginate(
+        customers_df, *page_args("customers_"), prefix="customers_", anchor="customers"
+    )
+    products, products_pagination = paginate(
+        products_df, *page_args("products_"), prefix="products_", anchor="products"
+    )
+    orders, orders_pagination = paginate(
+        orders_df, *page_args("orders_"), prefix="orders_", anchor="orders"
     )
 
-    if not merged_df.empty:
-        merged_df["total_price"] = merged_df["quantity"].astype(float) * merged_df["price"].astype(float)
-        total_quantity = int(merged_df["quantity"].sum())
-        total_revenue = float(merged_df["total_price"].sum())
-        total_profit = round(total_revenue * 0.08, 2)
-    else:
-        total_quantity, total_revenue, total_profit = 0, 0, 0
+    # Attach product name + price to the visible orders via the id index
+    orders = join(orders, "products", "productid", suffixes=("_order", "_product"))
+    for row in orders:
+        quantity, price = row.get("quantity"), row.get("price")
+        row["total_price"] = float(quantity) * float(price) if quantity is not None and price is not None else float("nan")
+
+    # Sales reports for the analytics tab (cached until the data changes)
+    top = request.args.get("top", DEFAULT_TOP, type=int)
+    reports = {name: sales_reports.records(name, top) for name in REPORTS}
 
     context = {
-        "customers": customers_df.to_dict(orient="records"),
-        "products": products_df.to_dict(orient="records"),
-        "orders": merged_df.to_dict(orient="records"),
-        "total_quantity": total_quantity,
-        "total_revenue": total_revenue,
-        "total_profit": total_profit,
+        "customers": customers,
+        "products": products,
+        "orders": orders,
+        "customers_pagination": customers_pagination,
+        "products_pagination": products_pagination,
+        "orders_pagination": orders_pagination,
+        "total_quantity": totals["total_quantity"],
+        "total_revenue": totals["total_revenue"],
+        "total_profit": totals["total_profit"],
+        "profit_margin": dashboard_metrics.margin,
+        "reports": reports,
+        "top": top,
         "logged_in_user_id": session.get("user_id"),
     }
 
     return render_template("admin/data.html", **context)
 
+# ---------- Admin Route: Dashboard Figures (JSON) ----------
+@app.route("/admin/dashboard.json")
+def admin_dashboard_json():
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+
+    data = dashboard_metrics.totals()
+    if request.args.get("details"):
+        data.update(dashboard_metrics.breakdown())
+    return jsonify(data)
+
+# ---------- Admin Route: Sales Reports (JSON) ----------
+@app.route("/admin/reports/<name>.json")
+def admin_report_json(name):
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+    if name not in REPORTS:
+        return "Unknown report", 404
+
+    top = request.args.get("top", None, type=int)
+    return jsonify(sales_reports.records(name, top))
+
+@task("dashboard.rebuild")
+def rebuild_dashboard_job():
+    """Job: recompute the dashboard figures from scratch."""
+    dashboard_metrics.rebuild()
+    return dashboard_metrics.totals()
+
+@app.route("/admin/dashboard/rebuild", methods=["POST"])
+def rebuild_dashboard():
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+
+    job_id = jobs.enqueue("dashboard.rebuild", key="dashboard.rebuild", owner=session.get("user_id"))
+    return jsonify({"job": job_id, "status": url_for("job_status", job_id=job_id)}), 202
+
+# ---------- Admin Route: Full Sheet Export ----------
+@app.route("/admin/export/<sheet>")
+def export_sheet(sheet):
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+    if sheet not in SCHEMAS:
+        return "Unknown sheet", 404
+
+    df = read_sheet(sheet)
+    # Rows are rendered as they are produced, so memory stays bounded by
+    # the chunk size rather than the number of rows.
+    return app.response_class(stream_template(
+        "admin/export.html", sheet=sheet, columns=list(df.columns), rows=iter_records(df)
+    ))
+
+# ---------- Admin Route: Sessions ----------
+@app.route("/admin/sessions")
+def admin_sessions():
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+    if not isinstance(app.session_interface, sessions.ServerSideSessionInterface):
+        return "Sessions are stored in cookies", 404
+
+    user_id = request.args.get("user_id", None, type=int)
+    return jsonify([
+        {
+            "session": sid[:8],
+            "user_id": data.get("user_id"),
+            "username": data.get("username"),
+            "role": data.get("role"),
+            "expires": expires,
+        }
+        for sid, data, expires in app.session_interface.store.sessions(user_id)
+    ])
+
+@app.route("/admin/sessions/revoke/<int:user_id>", methods=["POST"])
+def revoke_sessions(user_id):
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+    if not isinstance(app.session_interface, sessions.ServerSideSessionInterface):
+        return "Sessions are stored in cookies", 404
+
+    return jsonify({"revoked": app.session_interface.store.revoke_user(user_id)})
+
+# ---------- Background Jobs ----------
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.status(job_id)
+    # A job that belongs to someone is only visible to them and to admins
+    if job is None or (job["owner"] is not None and job["owner"] != session.get("user_id")
+                       and session.get("role") != "admin"):
+        return "Job not found", 404
+    return jsonify(job)
+
+@app.route("/admin/jobs")
+def admin_jobs():
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+    return jsonify(jobs.stats())
+
+# ---------- Admin Route: Data Integrity ----------
+@app.route("/admin/integrity")
+def admin_integrity():
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+
+    limit = request.args.get("limit", 100, type=int)
+    issues = integrity.issues(request.args.get("sheet"))
+    return jsonify({"report": integrity.last_report, "total": len(issues), "issues": issues[:limit]})
+
+@app.route("/admin/integrity/check", methods=["POST"])
+def run_integrity_check():
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+
+    # No coalescing key: the background check queued by a change may be
+    # INTEGRITY_DELAY seconds away, and this run is wanted now
+    job_id = jobs.enqueue("integrity.check", owner=session.get("user_id"))
+    return jsonify({"job": job_id, "status": url_for("job_status", job_id=job_id)}), 202
+
+# ---------- Admin Route: Storage Cache Stats ----------
+@app.route("/admin/cache-stats")
+def cache_stats():
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+    return jsonify(dict(get_storage().stats(), inventory=inventory.stats(), pages=page_cache.stats(),
+                        reports=sales_reports.stats(), jobs=jobs.stats(), images=image_cache.stats(),
+                        sessions=getattr(app.session_interface, "stats", dict)()))
+
+# ---------- CLI: Excel -> SQLite ----------
+@app.cli.command("import-excel")
+@click.option("--excel", default=None, help="Workbook to import (defaults to EXCEL_FILE).")
+@click.option("--sqlite", default=None, help="Target database (defaults to SQLITE_FILE).")
+def import_excel_command(excel, sqlite):
+    """Copy every sheet of the workbook into the SQLite database."""
+    counts = import_excel(excel or app.config["EXCEL_FILE"], sqlite or app.config["SQLITE_FILE"])
+    for sheet, rows in counts.items():
+        click.echo(f"{sheet}: {rows} rows")
+
+# ---------- CLI: Rebuild Workbook Snapshot ----------
+@app.cli.command("rebuild-snapshot")
+@click.option("--excel", default=None, help="Workbook to snapshot (defaults to EXCEL_FILE).")
+def rebuild_snapshot_command(excel):
+    """Parse the workbook and rewrite its binary snapshot."""
+    path = excel or app.config["EXCEL_FILE"]
+    counts = rebuild_snapshot(path)
+    for sheet, rows in counts.items():
+        click.echo(f"{sheet}: {rows} rows")
+    click.echo(f"Snapshot written to {snapshot_path(path)}")
+
+# ---------- CLI: Hash Plaintext Passwords ----------
+@app.cli.command("migrate-passwords")
+def migrate_passwords_command():
+    """Replace every plaintext password in the users sheet with a hash."""
+    count = credential_store.migrate()
+    click.echo(f"{count} passwords hashed")
+
+# ---------- CLI: Data Integrity ----------
+@app.cli.command("check-integrity")
+@click.option("--full", is_flag=True, help="Check every row, not only those changed since the last run.")
+@click.option("--limit", default=50, help="Issues to list (0 for all).")
+def check_integrity_command(full, limit):
+    """Check references, ids and column schema; exit with status 1 on issues."""
+    report = integrity.check(full=full)
+    issues = integrity.issues(limit=limit or None)
+    for issue in issues:
+        where = f"{issue['sheet']} #{issue['id']}" if issue["id"] is not None else issue["sheet"]
+        click.echo(f"[{issue['check']}] {where}: {issue['message']}")
+    checked = sum(report["checked_rows"].values())
+    click.echo(f"{report['issues']} issues ({report['mode']} check of {checked} rows in {report['ms']} ms)")
+    if report["issues"]:
+        raise SystemExit(1)
+
 # ---------- Logout ----------
 @app.route("/logout")
 def logout():
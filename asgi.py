@@ -0,0 +1,10 @@
+"""ASGI entry point of the read-only JSON API (/api/...).
+
+Run it next to the Flask site with any ASGI server, e.g.
+
+    uvicorn asgi:api --workers 4
+"""
+from app import app
+from services.api import create_api
+
+api = create_api(app)
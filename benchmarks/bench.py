@@ -0,0 +1,344 @@
+"""Latency, throughput and memory benchmarks for the main routes.
+
+    python -m benchmarks.bench run --sizes 1000,10000,100000 -o results.json
+    python -m benchmarks.bench run --processes 4            # concurrent load
+    python -m benchmarks.bench compare old.json new.json    # flag regressions
+
+Every size gets a fresh generated workbook (see generate_data.py) in a
+temporary directory and a fresh interpreter, so the cold start and the peak
+RSS belong to that size alone. Requests go through Flask's test client;
+with ``--processes N`` the same scenario runs in N processes at once against
+the shared workbook, which also exercises the storage locks and the journal.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.generate_data import generate_workbook
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# ---------- Scenarios ----------
+def _customer(worker):
+    """Credentials of a generated customer reserved for ``worker``."""
+    id = 10 * worker + 2  # never a multiple of 10 (sellers) and never 1 (admin)
+    return f"user{id}", f"pw{id}"
+
+
+def _login(client, role, worker):
+    username, password = ("admin", "admin") if role == "admin" else _customer(worker)
+    client.get("/logout")
+    client.post("/login", data={"username": username, "password": password, "role": role})
+
+
+def _get_products(client, i, ctx):
+    return client.get("/products")
+
+
+def _add_order(client, i, ctx):
+    product_id = (i * 7919 + ctx["worker"]) % ctx["products"] + 1
+    return client.post("/orders/add", data={"product_id": str(product_id), "quantity": "1"})
+
+
+def _admin_dashboard(client, i, ctx):
+    return client.get("/admin/dashboard")
+
+
+def _post_login(client, i, ctx):
+    username, password = _customer(ctx["worker"])
+    return client.post("/login", data={"username": username, "password": password, "role": "customer"})
+
+
+def _register(client, i, ctx):
+    username = f"bench{ctx['run']}w{ctx['worker']}n{i}"
+    return client.post("/users/register", data={
+        "username": username, "password": "pw", "role": "customer",
+        "email": username + "@example.com", "phone": "9000000000", "address": "pune",
+    })
+
+
+# name -> (role to log in as first, request function)
+SCENARIOS = {
+    "GET /products": ("customer", _get_products),
+    "POST /orders/add": ("customer", _add_order),
+    "GET /admin/dashboard": ("admin", _admin_dashboard),
+    "POST /login": (None, _post_login),
+    "POST /users/register": (None, _register),
+}
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_scenario(client, name, requests, warmup, ctx, max_seconds=None, min_requests=5):
+    """Run one scenario in this process.
+
+    Returns ``(latencies in ms, errors, start, end)`` where start/end are
+    wall-clock bounds of the measured requests (login and warmup excluded).
+    After ``max_seconds`` the run stops early once ``min_requests`` are in,
+    so very slow endpoints at large sizes still finish.
+    """
+    role, request_fn = SCENARIOS[name]
+    if role:
+        _login(client, role, ctx["worker"])
+    for i in range(warmup):
+        request_fn(client, -1 - i, ctx)
+    latencies, errors = [], 0
+    start = time.time()
+    deadline = time.perf_counter() + max_seconds if max_seconds else None
+    for i in range(requests):
+        started = time.perf_counter()
+        response = request_fn(client, i, ctx)
+        finished = time.perf_counter()
+        latencies.append((finished - started) * 1000)
+        if response.status_code >= 400:
+            errors += 1
+        if deadline is not None and finished > deadline and i + 1 >= min_requests:
+            break
+    return latencies, errors, start, time.time()
+
+
+def summarize(name, latencies, errors, wall, peak_rss_mb):
+    values = np.asarray(latencies, dtype=np.float64)
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) if len(values) else (0.0, 0.0, 0.0)
+    return {
+        "endpoint": name,
+        "requests": len(values),
+        "errors": errors,
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(values.mean()), 3) if len(values) else 0.0,
+        "max_ms": round(float(values.max()), 3) if len(values) else 0.0,
+        "throughput_rps": round(len(values) / wall, 2) if wall else 0.0,
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+# ---------- Load-driver processes ----------
+_client = None
+
+
+def _init_load_worker():
+    global _client
+    sys.path.insert(0, REPO_ROOT)
+    import app as app_module
+    _client = app_module.app.test_client()
+
+
+def _load_task(name, requests, warmup, ctx, max_seconds):
+    return run_scenario(_client, name, requests, warmup, ctx, max_seconds) + (_peak_rss_mb(),)
+
+
+# ---------- One size (runs in its own interpreter) ----------
+def run_size(config):
+    """Benchmark the app against the workbook in the current directory."""
+    started = time.perf_counter()
+    sys.path.insert(0, REPO_ROOT)
+    import app as app_module
+    client = app_module.app.test_client()
+    client.get("/products")  # first page served, workbook loaded
+    cold_start = time.perf_counter() - started
+
+    processes = config["processes"]
+    results = []
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.get_context("spawn").Pool(processes, initializer=_init_load_worker)
+    try:
+        for name in config["endpoints"]:
+            ctx = {"products": config["rows"], "run": config["run"]}
+            if pool is None:
+                latencies, errors, start, end = run_scenario(
+                    client, name, config["requests"], config["warmup"], dict(ctx, worker=0), config["max_seconds"]
+                )
+                wall = end - start
+                peak = _peak_rss_mb()
+            else:
+                per_worker = max(config["requests"] // processes, 1)
+                tasks = [
+                    (name, per_worker, config["warmup"], dict(ctx, worker=w), config["max_seconds"])
+                    for w in range(processes)
+                ]
+                outcomes = pool.starmap(_load_task, tasks)
+                latencies = [ms for outcome in outcomes for ms in outcome[0]]
+                errors = sum(outcome[1] for outcome in outcomes)
+                wall = max(outcome[3] for outcome in outcomes) - min(outcome[2] for outcome in outcomes)
+                peaks = [outcome[4] for outcome in outcomes if outcome[4] is not None]
+                peak = max(peaks) if peaks else None
+            result = summarize(name, latencies, errors, wall, peak)
+            result.update(rows=config["rows"], processes=processes)
+            results.append(result)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return {"rows": config["rows"], "cold_start_s": round(cold_start, 3), "results": results}
+
+
+def _bench_size(rows, args, run_id):
+    with tempfile.TemporaryDirectory(prefix="bench-") as directory:
+        started = time.perf_counter()
+        generate_workbook(os.path.join(directory, "data_new.xlsx"), rows, rows, rows, seed=args.seed)
+        generated = time.perf_counter() - started
+        config = {
+            "rows": rows,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "max_seconds": args.max_seconds,
+            "processes": args.processes,
+            "endpoints": args.endpoints,
+            "run": run_id,
+        }
+        config_path = os.path.join(directory, "bench-config.json")
+        result_path = os.path.join(directory, "bench-result.json")
+        with open(config_path, "w") as f:
+            json.dump(config, f)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])))
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench", "worker", config_path, result_path],
+            cwd=directory, env=env, check=True,
+        )
+        with open(result_path) as f:
+            outcome = json.load(f)
+    outcome["generate_s"] = round(generated, 3)
+    return outcome
+
+
+# ---------- Reporting ----------
+def print_results(results):
+    header = f"{'rows':>8}  {'endpoint':<22}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'rss MB':>8}{'err':>5}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['rows']:>8}  {r['endpoint']:<22}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{r['throughput_rps']:>9.1f}{(r['peak_rss_mb'] or 0):>8.1f}{r['errors']:>5}")
+
+
+def compare(baseline, current, threshold=0.25, min_delta_ms=1.0):
+    """Return a list of regression messages between two result files."""
+    before = {(r["rows"], r["endpoint"], r.get("processes", 1)): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        old = before.get((r["rows"], r["endpoint"], r.get("processes", 1)))
+        if old is None:
+            continue
+        label = f"{r['endpoint']} @ {r['rows']} rows"
+        if r["p95_ms"] - old["p95_ms"] > min_delta_ms and r["p95_ms"] > old["p95_ms"] * (1 + threshold):
+            regressions.append(f"{label}: p95 {old['p95_ms']:.2f} -> {r['p95_ms']:.2f} ms")
+        if old["throughput_rps"] and r["throughput_rps"] < old["throughput_rps"] * (1 - threshold):
+            regressions.append(f"{label}: throughput {old['throughput_rps']:.1f} -> {r['throughput_rps']:.1f} req/s")
+        if r["errors"] > old["errors"]:
+            regressions.append(f"{label}: errors {old['errors']} -> {r['errors']}")
+    return regressions
+
+
+# ---------- Entry point ----------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Benchmark every endpoint at each size.")
+    run.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                     help="Comma-separated row counts (users = products = orders).")
+    run.add_argument("--requests", type=int, default=100, help="Measured requests per endpoint and size.")
+    run.add_argument("--warmup", type=int, default=3)
+    run.add_argument("--max-seconds", type=float, default=30.0,
+                     help="Stop an endpoint early after this long (0 = always run every request).")
+    run.add_argument("--processes", type=int, default=1, help="Run each scenario in N processes at once.")
+    run.add_argument("--endpoints", default=",".join(SCENARIOS), help="Comma-separated subset of: %(default)s")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("-o", "--output", default="bench-results.json")
+    run.add_argument("--baseline", help="Compare against an earlier results file; exit 1 on regressions.")
+    run.add_argument("--threshold", type=float, default=0.25)
+
+    cmp = commands.add_parser("compare", help="Compare two results files.")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--threshold", type=float, default=0.25)
+
+    worker = commands.add_parser("worker", help=argparse.SUPPRESS)
+    worker.add_argument("config")
+    worker.add_argument("result")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        with open(args.config) as f:
+            config = json.load(f)
+        outcome = run_size(config)
+        with open(args.result, "w") as f:
+            json.dump(outcome, f)
+        return 0
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        for message in regressions:
+            print("REGRESSION", message)
+        return 1 if regressions else 0
+
+    args.endpoints = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+    unknown = [name for name in args.endpoints if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)}")
+    run_id = time.strftime("%Y%m%d%H%M%S")
+    sizes, results = [], []
+    for rows in (int(size) for size in args.sizes.split(",")):
+        print(f"== {rows} rows ==", flush=True)
+        outcome = _bench_size(rows, args, run_id)
+        sizes.append({"rows": rows, "generate_s": outcome["generate_s"], "cold_start_s": outcome["cold_start_s"]})
+        results.extend(outcome["results"])
+        print(f"generated in {outcome['generate_s']}s, first page served after {outcome['cold_start_s']}s")
+
+    report = {
+        "meta": {
+            "run": run_id,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "requests": args.requests,
+            "processes": args.processes,
+        },
+        "sizes": sizes,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_results(results)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        for message in regressions:
+            print("REGRESSION", message)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
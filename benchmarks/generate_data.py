@@ -0,0 +1,97 @@
+"""Build synthetic workbooks shaped like data_new.xlsx.
+
+    python -m benchmarks.generate_data --users 10000 --products 10000 --orders 10000 -o big.xlsx
+
+User ``admin``/``admin`` is always id 1. The other users are ``user<id>``
+with password ``pw<id>``; every tenth one is a seller, the rest customers.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+CATEGORIES = ["Electronics", "Books", "Clothing", "Home", "Sports", "Toys", "Grocery", "Beauty"]
+WORDS = [
+    "apple", "samsung", "classic", "smart", "wireless", "cotton", "steel", "premium",
+    "portable", "organic", "deluxe", "mini", "pro", "ultra", "eco", "vintage",
+]
+
+
+def generate_frames(users=1000, products=1000, orders=1000, seed=0):
+    """Return {sheet: DataFrame} with the columns and dtypes the app expects."""
+    rng = np.random.default_rng(seed)
+    users = max(users, 2)
+
+    ids = np.arange(1, users + 1)
+    roles = np.where(ids % 10 == 0, "seller", "customer").astype(object)
+    roles[0] = "admin"
+    usernames = np.char.add("user", ids.astype(str)).astype(object)
+    passwords = np.char.add("pw", ids.astype(str)).astype(object)
+    usernames[0] = passwords[0] = "admin"
+    users_df = pd.DataFrame({"id": ids, "username": usernames, "password": passwords, "role": roles})
+
+    customers_df = pd.DataFrame({
+        "id": ids,
+        "name": usernames,
+        "email": np.char.add(usernames.astype(str), "@example.com"),
+        "phone": rng.integers(7_000_000_000, 9_999_999_999, size=users),
+        "address": rng.choice(["pune", "mumbai", "delhi", "kokan", "nagpur"], size=users),
+        "role": roles,
+    })
+
+    sellers = ids[roles == "seller"]
+    if len(sellers) == 0:
+        sellers = ids[:1]
+    product_ids = np.arange(1, products + 1)
+    first = rng.choice(WORDS, size=products)
+    second = rng.choice(WORDS, size=products)
+    names = [f"{a.title()} {b.title()} {i}" for a, b, i in zip(first, second, product_ids)]
+    products_df = pd.DataFrame({
+        "id": product_ids,
+        "name": names,
+        "price": rng.integers(100, 200_000, size=products),
+        "stock": rng.integers(0, 500, size=products),
+        "category": rng.choice(CATEGORIES, size=products),
+        "details": [f"{a} {b} edition" for a, b in zip(second, first)],
+        "rating": np.round(rng.uniform(1, 5, size=products), 1),
+        "image_url": np.nan,
+        "seller_id": rng.choice(sellers, size=products),
+        "role": np.nan,
+    })
+
+    customers = ids[roles == "customer"]
+    orders_df = pd.DataFrame({
+        "id": np.arange(1, orders + 1),
+        "customerid": rng.choice(customers, size=orders),
+        "productid": rng.integers(1, max(products, 1) + 1, size=orders),
+        "quantity": rng.integers(1, 6, size=orders),
+    })
+    return {"customers": customers_df, "products": products_df, "orders": orders_df, "users": users_df}
+
+
+def generate_workbook(path, users=1000, products=1000, orders=1000, seed=0):
+    frames = generate_frames(users, products, orders, seed)
+    with pd.ExcelWriter(path, engine="openpyxl") as writer:
+        for sheet, df in frames.items():
+            df.to_excel(writer, sheet_name=sheet, index=False)
+    return {sheet: len(df) for sheet, df in frames.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", default="data_bench.xlsx")
+    parser.add_argument("--rows", type=int, help="Shortcut for the same count of users, products and orders.")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.rows:
+        args.users = args.products = args.orders = args.rows
+    counts = generate_workbook(args.output, args.users, args.products, args.orders, args.seed)
+    for sheet, rows in counts.items():
+        print(f"{sheet}: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
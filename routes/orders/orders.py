@@ -1,32 +1,29 @@
-import pandas as pd
-from flask import Blueprint, request, redirect, url_for, render_template, session
-#
+from flask import Blueprint, request, redirect, url_for, render_template, session, jsonify
+from services.storage import get_storage
+from services.metrics import timed
+from services.schema import records
+from services.inventory import inventory
+from services.indexes import lookup, rows_by, order_history
+from services.bulk import ORDER_FIELDS, EXPORT_FORMATS, read_upload, coerce, check_references, insert_batches, export_response
 
-EXCEL_FILE = "data_new.xlsx"
 ORDERS_SHEET = "orders"
 PRODUCTS_SHEET = "products"
+CUSTOMERS_SHEET = "customers"
 
 orders_bp = Blueprint("orders", __name__, template_folder="../../templates/orders")
 
 # ---------- Helper ----------
-def read_sheet(sheet_name):
-    df = pd.read_excel(EXCEL_FILE, sheet_name=sheet_name)
-    df.columns = df.columns.str.strip().str.lower()
-    return df
-
+@timed("read_orders")
 def read_orders():
-    df = pd.read_excel(EXCEL_FILE, sheet_name=ORDERS_SHEET)
-    df.columns = df.columns.str.strip().str.lower()
-    return df
+    return get_storage().read(ORDERS_SHEET)
 
+@timed("write_orders")
 def write_orders(df):
-    with pd.ExcelWriter(EXCEL_FILE, mode="a", engine="openpyxl", if_sheet_exists="replace") as writer:
-        df.to_excel(writer, sheet_name=ORDERS_SHEET, index=False)
+    get_storage().write(ORDERS_SHEET, df)
 
+@timed("read_products")
 def read_products():
-    df = pd.read_excel(EXCEL_FILE, sheet_name=PRODUCTS_SHEET)
-    df.columns = df.columns.str.strip().str.lower()
-    return df
+    return get_storage().read(PRODUCTS_SHEET)
 
 # ---------- Display ----------
 @orders_bp.route("/orders/details")
@@ -34,12 +31,10 @@ def display_orders():
     if "user_id" not in session:
         return redirect(url_for("users.login"))
 
-    user_id = session["user_id"]
-    df = read_orders()
-    # Filter only orders belonging to the logged-in user
-    df_user = df[df["customerid"] == user_id]
+    # Only the orders belonging to the logged-in user, via the customerid index
+    orders = rows_by(ORDERS_SHEET, "customerid", session["user_id"])
 
-    return render_template("orders/details.html", orders=df_user.to_dict(orient="records"))
+    return render_template("orders/details.html", orders=orders)
 
 
 # ---------- Add ----------
@@ -49,17 +44,28 @@ def add_order():
         return redirect(url_for("users.login"))
 
     customer_id = session["user_id"]  # logged-in user
-    products = read_products().to_dict(orient="records")
+    products = records(read_products())
 
     if request.method=="POST":
         product_id = int(request.form["product_id"])
         quantity = int(request.form.get("quantity",1))
-
-        df = read_orders()
-        new_id = int(df["id"].max()) + 1 if not df.empty else 1
-        new_row = pd.DataFrame([[new_id, customer_id, product_id, quantity]], columns=df.columns)
-        df = pd.concat([df,new_row], ignore_index=True)
-        write_orders(df)
+        if quantity < 1:
+            return "Invalid quantity", 400
+        if lookup(PRODUCTS_SHEET, product_id) is None:
+            return "Product not found", 404
+
+        # Take the stock first; hand it back if the order cannot be saved
+        if not inventory.reserve(product_id, quantity):
+            return "Insufficient stock", 409
+        try:
+            get_storage().insert(ORDERS_SHEET, {
+                "customerid": customer_id,
+                "productid": product_id,
+                "quantity": quantity
+            })
+        except Exception:
+            inventory.release(product_id, quantity)
+            raise
 
         return redirect(url_for("orders.display_orders"))
 
@@ -68,39 +74,98 @@ def add_order():
 # ---------- Update ----------
 @orders_bp.route("/orders/update/<int:id>", methods=["GET","POST"])
 def update_order(id):
-    df = read_orders()
-    idx = df.index[df["id"]==id].tolist()
-    if not idx:
+    storage = get_storage()
+    order = lookup(ORDERS_SHEET, id)
+    if order is None:
         return "Order not found", 404
-    row_idx = idx[0]
 
     if request.method=="POST":
-        df.at[row_idx,"productid"]=int(request.form["product_id"])
-        df.at[row_idx,"quantity"]=int(request.form.get("quantity",1))
-        write_orders(df)
+        product_id = int(request.form["product_id"])
+        quantity = int(request.form.get("quantity",1))
+        if quantity < 1:
+            return "Invalid quantity", 400
+        if lookup(PRODUCTS_SHEET, product_id) is None:
+            return "Product not found", 404
+
+        with inventory.order(id):
+            order = lookup(ORDERS_SHEET, id)
+            if order is None:
+                return "Order not found", 404
+            if not inventory.adjust(order["productid"], order["quantity"], product_id, quantity):
+                return "Insufficient stock", 409
+            storage.update(ORDERS_SHEET, id, {"productid": product_id, "quantity": quantity})
         return redirect(url_for("orders.display_orders"))
 
-    order = df.loc[row_idx].to_dict()
-    products = read_products().to_dict(orient="records")
+    products = records(read_products())
     return render_template("orders/update.html", order=order, products=products)
 
 # ---------- Delete ----------
 @orders_bp.route("/orders/delete/<int:id>", methods=["POST"])
 def delete_order(id):
-    df = read_orders()
-    df = df[df["id"]!=id]
-    write_orders(df)
+    storage = get_storage()
+    with inventory.order(id):
+        order = lookup(ORDERS_SHEET, id)
+        if order is not None and storage.delete(ORDERS_SHEET, id):
+            inventory.release(order["productid"], order["quantity"])
     return redirect(url_for("orders.display_orders"))
 
+# ---------- Bulk Upload / Export (Admin) ----------
+@orders_bp.route("/orders/bulk", methods=["GET", "POST"])
+def bulk_orders():
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if upload is None or not upload.filename:
+            return jsonify(error="No file uploaded"), 400
+        try:
+            df = read_upload(upload, request.form.get("format"))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+
+        orders, errors = coerce(df, ORDER_FIELDS)
+        if not errors:
+            storage = get_storage()
+            check_references(orders, "customerid", storage.read(CUSTOMERS_SHEET)["id"], "customer", errors)
+            check_references(orders, "productid", storage.read(PRODUCTS_SHEET)["id"], "product", errors)
+        if errors:
+            return jsonify(error="Validation failed", errors=errors), 400
+
+        # Imported orders take stock like any other order, all or nothing
+        failed = inventory.reserve_many(orders.groupby("productid")["quantity"].sum().to_dict())
+        if failed:
+            return jsonify(error="Insufficient stock", products=[int(p) for p in failed]), 409
+        try:
+            ids = insert_batches(ORDERS_SHEET, orders)
+        except Exception:
+            for product_id, quantity in orders.groupby("productid")["quantity"].sum().items():
+                inventory.release(product_id, quantity)
+            raise
+        return jsonify(inserted=len(ids), first_id=ids[0] if ids else None, last_id=ids[-1] if ids else None)
+
+    return render_template(
+        "bulk_upload.html",
+        title="Orders",
+        columns=list(ORDER_FIELDS),
+        export_url=lambda fmt: url_for("orders.export_orders", fmt=fmt),
+    )
+
+@orders_bp.route("/orders/export.<fmt>")
+def export_orders(fmt):
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+    if fmt not in EXPORT_FORMATS:
+        return "Unknown format", 404
+
+    return export_response(read_orders(), fmt, "orders")
+
 @orders_bp.route("/my_orders")
 def my_orders():
     if session.get("role") != "customer":
         return "Unauthorized", 403
 
-    user_id = session.get("user_id")
-    orders_df = read_sheet("orders")
-
-    # filter only logged-in customer's orders
-    my_orders = orders_df[orders_df["customer_id"] == user_id]
+    # The customer's orders joined with product details through the indexes
+    orders = order_history(session.get("user_id"))
 
-    return render_template("orders.html", orders=my_orders.to_dict(orient="records"))
\ No newline at end of file
+    return render_template("orders.html", orders=orders)
\ No newline at end of file
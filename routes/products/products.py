@@ -1,16 +1,26 @@
 import pandas as pd
-from flask import Blueprint, request, redirect, url_for, render_template, session
+from flask import Blueprint, request, redirect, url_for, render_template, session, jsonify, send_file
+from services.storage import get_storage, _clean
+from services.metrics import timed
+from services.bulk import PRODUCT_FIELDS, EXPORT_FORMATS, read_upload, coerce, insert_batches, export_response
+from services.search import product_index
+from services.inventory import inventory
+from services.indexes import lookup, rows_by
+from services.page_cache import cached_page
+from services.images import image_cache
+from services.pagination import page_args, paginate, make_pagination
 
-EXCEL_FILE = "data_new.xlsx"
 PRODUCTS_SHEET = "products"
+# Thumbnail files never change (their name is their hash)
+THUMBNAIL_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 products_bp = Blueprint("products", __name__, template_folder="../../templates/products")
 
 # ---------- Helpers ----------
+@timed("read_products")
 def read_products():
     try:
-        df = pd.read_excel(EXCEL_FILE, sheet_name=PRODUCTS_SHEET)
-        df.columns = df.columns.str.strip().str.lower()
+        df = get_storage().read(PRODUCTS_SHEET)
     except:
         # If file or sheet doesn't exist, create empty DataFrame
         df = pd.DataFrame(columns=[
@@ -22,15 +32,17 @@ def read_products():
         df["seller_id"] = None
     return df
 
+@timed("write_products")
 def write_products(df):
-    with pd.ExcelWriter(EXCEL_FILE, mode="a", engine="openpyxl", if_sheet_exists="replace") as writer:
-        df.to_excel(writer, sheet_name=PRODUCTS_SHEET, index=False)
+    get_storage().write(PRODUCTS_SHEET, df)
 
 # ---------- Display All Products (Customer view) ----------
 @products_bp.route("/products/details")
+@cached_page(PRODUCTS_SHEET, versions=(image_cache.version,))
 def display_products():
     df = read_products()
-    return render_template("products/details.html", products=df.to_dict(orient="records"))
+    products, pagination = paginate(df, *page_args(default_size=24))
+    return render_template("products/details.html", products=products, pagination=pagination)
 
 # ---------- Add Product (Seller) ----------
 @products_bp.route("/products/add", methods=["GET", "POST"])
@@ -47,11 +59,7 @@ def add_product():
         rating = float(request.form.get("rating", 0))
         image_url = request.form.get("image_url", "").strip()
 
-        df = read_products()
-        new_id = df["id"].max() + 1 if not df.empty else 1
-
-        new_row = pd.DataFrame([{
-            "id": new_id,
+        get_storage().insert(PRODUCTS_SHEET, {
             "name": name,
             "price": price,
             "stock": stock,
@@ -60,9 +68,7 @@ def add_product():
             "rating": rating,
             "image_url": image_url,
             "seller_id": session["user_id"]
-        }])
-        df = pd.concat([df, new_row], ignore_index=True)
-        write_products(df)
+        })
         return redirect(url_for("products.manage_products"))
 
     return render_template("products/add.html")
@@ -70,72 +76,162 @@ def add_product():
 # ---------- Update Product (Seller) ----------
 @products_bp.route("/products/update/<int:id>", methods=["GET", "POST"])
 def update_product(id):
-    df = read_products()
-    idx_list = df.index[df["id"] == id].tolist()
-    if not idx_list:
+    storage = get_storage()
+    product = lookup(PRODUCTS_SHEET, id)
+    if product is None:
         return "Product not found", 404
-    row_idx = idx_list[0]
 
     # Only seller who owns the product can update
-    if df.at[row_idx, "seller_id"] != session.get("user_id"):
+    if product["seller_id"] != session.get("user_id"):
         return "Unauthorized", 403
 
     if request.method == "POST":
-        df.at[row_idx, "name"] = request.form["name"].strip()
-        df.at[row_idx, "price"] = float(request.form.get("price", 0))
-        df.at[row_idx, "stock"] = int(request.form.get("stock", 0))
-        df.at[row_idx, "category"] = request.form.get("category", "").strip()
-        df.at[row_idx, "details"] = request.form.get("details", "").strip()
-        df.at[row_idx, "rating"] = float(request.form.get("rating", 0))
-        df.at[row_idx, "image_url"] = request.form.get("image_url", "").strip()
-        write_products(df)
+        stock = int(request.form.get("stock", 0))
+        shown = request.form.get("stock_shown", type=int)
+        image_url = request.form.get("image_url", "").strip()
+        storage.update(PRODUCTS_SHEET, id, {
+            "name": request.form["name"].strip(),
+            "price": float(request.form.get("price", 0)),
+            "category": request.form.get("category", "").strip(),
+            "details": request.form.get("details", "").strip(),
+            "rating": float(request.form.get("rating", 0)),
+            "image_url": image_url
+        })
+        # Only the seller's change is applied to the live counter, so units
+        # checked out since the form was shown stay taken. The counter is
+        # copied into the stock sheet with the next flush.
+        if shown is None:
+            inventory.set_stock(id, stock)
+        elif stock != shown:
+            inventory.add_stock(id, stock - shown)
         return redirect(url_for("products.manage_products"))
 
-    product = df.loc[row_idx].to_dict()
     return render_template("products/update.html", product=product)
 
 # ---------- Delete Product (Seller) ----------
 @products_bp.route("/products/delete/<int:id>", methods=["POST"])
 def delete_product(id):
-    df = read_products()
-    idx_list = df.index[df["id"] == id].tolist()
-    if not idx_list:
+    storage = get_storage()
+    product = lookup(PRODUCTS_SHEET, id)
+    if product is None:
         return "Product not found", 404
-    row_idx = idx_list[0]
 
     # Only seller can delete their product
-    if df.at[row_idx, "seller_id"] != session.get("user_id"):
+    if product["seller_id"] != session.get("user_id"):
         return "Unauthorized", 403
 
-    df = df.drop(row_idx).reset_index(drop=True)
-    write_products(df)
+    storage.delete(PRODUCTS_SHEET, id)
     return redirect(url_for("products.manage_products"))
 
+# ---------- Bulk Upload / Export (Seller) ----------
+@products_bp.route("/products/bulk", methods=["GET", "POST"])
+def bulk_products():
+    if session.get("role") != "seller":
+        return "Unauthorized", 403
+
+    if request.method == "POST":
+        upload = request.files.get("file")
+        if upload is None or not upload.filename:
+            return jsonify(error="No file uploaded"), 400
+        try:
+            df = read_upload(upload, request.form.get("format"))
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+
+        products, errors = coerce(df, PRODUCT_FIELDS)
+        if errors:
+            return jsonify(error="Validation failed", errors=errors), 400
+
+        # Uploaded ids and seller ids are ignored: everything belongs to the
+        # logged-in seller and gets fresh ids.
+        products["seller_id"] = session["user_id"]
+        ids = insert_batches(PRODUCTS_SHEET, products)
+        return jsonify(inserted=len(ids), first_id=ids[0] if ids else None, last_id=ids[-1] if ids else None)
+
+    return render_template(
+        "bulk_upload.html",
+        title="Products",
+        columns=list(PRODUCT_FIELDS),
+        export_url=lambda fmt: url_for("products.export_products", fmt=fmt),
+    )
+
+@products_bp.route("/products/export.<fmt>")
+def export_products(fmt):
+    if session.get("role") != "seller":
+        return "Unauthorized", 403
+    if fmt not in EXPORT_FORMATS:
+        return "Unknown format", 404
+
+    df = read_products()
+    return export_response(df[df["seller_id"] == session.get("user_id")], fmt, "products")
+
+# ---------- Stock ----------
+@products_bp.app_template_global()
+def live_stock(product):
+    """Units left according to the live counters (the sheet holds the listed stock)."""
+    stock = inventory.available(product.get("id"))
+    return _clean(product.get("stock")) if stock is None else stock
+
+# ---------- Thumbnails ----------
+@products_bp.app_template_global()
+def thumbnail_url(product):
+    """URL of the product's cached thumbnail, else its own image URL (or None)."""
+    name = image_cache.thumbnail(product.get("id"))
+    if name is not None:
+        return url_for("products.thumbnail", name=name)
+    return _clean(product.get("image_url")) or None
+
+@products_bp.route("/products/thumbnails/<name>")
+def thumbnail(name):
+    path = image_cache.path(name)
+    if path is None:
+        return "Thumbnail not found", 404
+    response = send_file(path, mimetype=image_cache.content_type(name), etag=name.split(".")[0],
+                         conditional=True)
+    response.headers["Cache-Control"] = THUMBNAIL_CACHE_CONTROL
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    return response
+
 # ---------- Seller Manage Products ----------
 @products_bp.route("/products/manage")
 def manage_products():
     if session.get("role") != "seller":
         return "Unauthorized", 403
 
-    seller_id = session.get("user_id")
-    df = read_products()
-    my_products = df[df["seller_id"] == seller_id]
+    # The seller's own products, via the seller_id index
+    my_products = rows_by(PRODUCTS_SHEET, "seller_id", session.get("user_id"))
 
-    show_add_button = True if my_products.empty else False
+    show_add_button = True if not my_products else False
+    products, pagination = paginate(my_products, *page_args())
 
     return render_template(
         "products/manage_products.html",
-        products=my_products.to_dict(orient="records"),
+        products=products,
+        pagination=pagination,
         show_add_button=show_add_button
     )
 
 # ---------- List / Search Products (Customer) ----------
+def _float_arg(name):
+    try:
+        return float(request.args[name])
+    except (KeyError, ValueError):
+        return None
+
 @products_bp.route("/products")
+@cached_page(PRODUCTS_SHEET, versions=(image_cache.version,))
 def list_products():
-    q = request.args.get("q", "").lower()
-    df = read_products()
-    products = df.to_dict(orient="records")
-    if q:
-        products = [p for p in products if q in str(p["name"]).lower()]
-    return render_template("products/details.html", products=products)
-
+    q = request.args.get("q", "").strip()
+    category = request.args.get("category", "").strip()
+    page, page_size, _ = page_args(default_size=24)
+
+    products, total = product_index.search(
+        q=q,
+        category=category or None,
+        min_price=_float_arg("min_price"),
+        max_price=_float_arg("max_price"),
+        page=page,
+        page_size=page_size,
+    )
+    pagination = make_pagination(total, page, page_size)
+    return render_template("products/details.html", products=products, pagination=pagination)
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from werkzeug.wrappers import Request
+
+from services.dashboard import dashboard_metrics
+from services.indexes import lookup, order_history
+from services.inventory import inventory
+from services.metrics import registry
+from services.pagination import MAX_PAGE_SIZE
+from services.search import product_index
+from services.storage import _clean
+
+API_PREFIX = "/api"
+API_WORKERS = 8
+# Requests allowed to wait for a worker before new ones get 503
+API_MAX_PENDING = 256
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ApiRequest:
+    """What a handler sees: path parameters, query arguments and the session."""
+
+    def __init__(self, params, query, session):
+        self.params = params
+        self.query = query
+        self.session = session
+
+    def arg(self, name, default=None, type=str):
+        values = self.query.get(name)
+        if not values or values[0] == "":
+            return default
+        try:
+            return type(values[0])
+        except (TypeError, ValueError):
+            raise ApiError(400, f"Invalid value for {name!r}") from None
+
+
+def _record(row):
+    return {column: _clean(value) for column, value in row.items()}
+
+
+def _product(row):
+    """A product record with the live stock rather than the listed one."""
+    record = _record(row)
+    stock = inventory.available(record["id"])
+    if stock is not None:
+        record["stock"] = stock
+    return record
+
+
+# ---------- Handlers ----------
+ROUTES = []
+
+
+def route(pattern):
+    """Register a GET handler for ``pattern`` (a regex with named groups)."""
+    def decorate(handler):
+        ROUTES.append((re.compile(pattern + "$"), handler))
+        return handler
+    return decorate
+
+
+def _require(request, *roles):
+    if not request.session.get("user_id"):
+        raise ApiError(401, "Login required")
+    if roles and request.session.get("role") not in roles:
+        raise ApiError(403, "Unauthorized")
+
+
+@route(r"/products")
+def list_products(request):
+    page = max(request.arg("page", 1, int), 1)
+    page_size = min(max(request.arg("page_size", 24, int), 1), MAX_PAGE_SIZE)
+    products, total = product_index.search(
+        q=request.arg("q", ""),
+        category=request.arg("category"),
+        min_price=request.arg("min_price", None, float),
+        max_price=request.arg("max_price", None, float),
+        page=page,
+        page_size=page_size,
+    )
+    return {"products": [_product(p) for p in products], "total": total, "page": page, "page_size": page_size}
+
+
+@route(r"/products/(?P<id>\d+)")
+def product_detail(request):
+    product = lookup("products", int(request.params["id"]))
+    if product is None:
+        raise ApiError(404, "Product not found")
+    return _product(product)
+
+
+@route(r"/orders")
+def orders(request):
+    _require(request, "customer", "admin")
+    if request.session.get("role") == "customer":
+        customer_id = request.session["user_id"]
+    else:
+        customer_id = request.arg("customer_id", None, int)
+        if customer_id is None:
+            raise ApiError(400, "customer_id is required")
+    return {"customer_id": customer_id, "orders": [_record(o) for o in order_history(customer_id)]}
+
+
+@route(r"/dashboard")
+def dashboard(request):
+    _require(request, "admin")
+    data = dashboard_metrics.totals()
+    if request.arg("details"):
+        data.update(dashboard_metrics.breakdown())
+    return data
+
+
+# ---------- ASGI application ----------
+class JsonApi:
+    """Read-only JSON API as a plain ASGI application.
+
+    The event loop only parses requests and writes responses; session
+    loading and every handler (index lookups, sheet reads) run on a bounded
+    thread pool, so one process serves many slow or idle connections without
+    a thread each.
+    When ``max_pending`` requests are already waiting for a worker, new ones
+    are refused with 503 instead of queueing without limit. Handlers use the
+    same storage, indexes and Flask session cookie as the web app, and run in
+    the same process as its in-memory indexes (which is why the pool holds
+    threads rather than processes).
+    """
+
+    def __init__(self, flask_app, workers=API_WORKERS, max_pending=API_MAX_PENDING, prefix=API_PREFIX):
+        self.flask_app = flask_app
+        self.prefix = prefix
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self.pending = 0
+
+    def _session(self, headers):
+        # Whatever session interface the web app uses (signed cookie or
+        # server-side store) opens the session from the Cookie header.
+        app = self.flask_app
+        request = Request({"HTTP_COOKIE": headers.get(b"cookie", b"").decode("latin-1")})
+        return dict(app.session_interface.open_session(app, request) or {})
+
+    def _handle(self, handler, params, query, headers):
+        # Runs on a worker: a server-side session store may block on I/O
+        return handler(ApiRequest(params, query, self._session(headers)))
+
+    def _match(self, path):
+        if not path.startswith(self.prefix):
+            return None, None
+        path = path[len(self.prefix):].rstrip("/") or "/"
+        for pattern, handler in ROUTES:
+            match = pattern.match(path)
+            if match:
+                return handler, match.groupdict()
+        return None, None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        started = time.perf_counter()
+        handler, params = self._match(scope["path"])
+        name = handler.__name__ if handler else "unknown"
+        if handler is None:
+            status, payload = 404, {"error": "Not found"}
+        elif scope["method"] not in ("GET", "HEAD"):
+            status, payload = 405, {"error": "Method not allowed"}
+        elif self.pending >= self.max_pending:
+            status, payload = 503, {"error": "Server busy"}
+        else:
+            query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+            headers = dict(scope.get("headers") or ())
+            self.pending += 1
+            try:
+                status, payload = 200, await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self._handle, handler, params, query, headers)
+            except ApiError as e:
+                status, payload = e.status, {"error": e.message}
+            except Exception:
+                status, payload = 500, {"error": "Internal server error"}
+            finally:
+                self.pending -= 1
+
+        body = json.dumps(payload, default=_clean).encode("utf-8")
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        if status == 503:
+            headers.append((b"retry-after", b"1"))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+        labels = (("blueprint", "api"), ("endpoint", name))
+        registry.inc("app_requests_total", labels + (("status", status),))
+        registry.observe("app_request_duration_seconds", labels, time.perf_counter() - started)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_api(flask_app):
+    """Build the API for ``flask_app``, sized by its API_WORKERS / API_MAX_PENDING."""
+    return JsonApi(
+        flask_app,
+        workers=int(flask_app.config.get("API_WORKERS", API_WORKERS)),
+        max_pending=int(flask_app.config.get("API_MAX_PENDING", API_MAX_PENDING)),
+    )
@@ -0,0 +1,138 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+from flask import Response
+
+from services.storage import get_storage
+
+# Rows committed per storage write during a bulk upload
+BULK_BATCH_SIZE = 5000
+# Rows serialized at a time while streaming an export
+EXPORT_CHUNK = 1000
+# Validation errors reported back for a rejected upload
+MAX_REPORTED_ERRORS = 50
+
+EXPORT_FORMATS = {"csv": "text/csv", "json": "application/json"}
+
+# column -> kind ("text", "int" or "float"), required, default, min, max
+PRODUCT_FIELDS = {
+    "name": {"kind": "text", "required": True},
+    "price": {"kind": "float", "required": True, "min": 0},
+    "stock": {"kind": "int", "default": 0, "min": 0},
+    "category": {"kind": "text", "default": ""},
+    "details": {"kind": "text", "default": ""},
+    "rating": {"kind": "float", "default": 0.0, "min": 0, "max": 5},
+    "image_url": {"kind": "text", "default": ""},
+}
+
+ORDER_FIELDS = {
+    "customerid": {"kind": "int", "required": True},
+    "productid": {"kind": "int", "required": True},
+    "quantity": {"kind": "int", "default": 1, "min": 1},
+}
+
+
+# ---------- Parsing ----------
+def read_upload(file, fmt=None):
+    """Parse an uploaded CSV or JSON file (a list of objects) into a DataFrame.
+
+    The format comes from ``fmt`` or the file name's extension. CSV cells are
+    read as text so that validation sees exactly what was uploaded.
+    """
+    fmt = (fmt or file.filename.rsplit(".", 1)[-1]).lower()
+    if fmt == "csv":
+        df = pd.read_csv(file.stream, dtype=str, keep_default_na=False, skipinitialspace=True)
+    elif fmt == "json":
+        data = json.load(io.TextIOWrapper(file.stream, encoding="utf-8"))
+        if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+            raise ValueError("JSON upload must be a list of objects")
+        df = pd.DataFrame(data)
+    else:
+        raise ValueError(f"Unsupported format: {fmt!r} (use csv or json)")
+    df.columns = df.columns.astype(str).str.strip().str.lower()
+    return df
+
+
+# ---------- Validation ----------
+def _row_errors(mask, column, message, errors):
+    for position in np.flatnonzero(mask.to_numpy())[:MAX_REPORTED_ERRORS]:
+        errors.append({"row": int(position) + 1, "column": column, "error": message})
+
+
+def coerce(df, fields):
+    """Validate and type-convert every column of ``df`` at once.
+
+    Returns ``(clean, errors)``: ``clean`` holds exactly the columns of
+    ``fields`` with their target types, ``errors`` lists the offending rows
+    (1-based) as ``{"row", "column", "error"}`` dicts.
+    """
+    clean, errors = pd.DataFrame(index=df.index), []
+    for column, spec in fields.items():
+        raw = df[column] if column in df.columns else pd.Series(None, index=df.index, dtype=object)
+        text = raw.astype("string").str.strip()
+        blank = raw.isna() | text.isna() | (text == "")
+        if spec.get("required"):
+            _row_errors(blank, column, "required", errors)
+
+        if spec["kind"] == "text":
+            clean[column] = text.where(~blank, spec.get("default", "")).astype(object)
+            continue
+
+        numbers = pd.to_numeric(text.where(~blank), errors="coerce").astype("float64")
+        invalid = numbers.isna() & ~blank
+        if spec["kind"] == "int":
+            invalid |= numbers.notna() & (numbers % 1 != 0)
+        _row_errors(invalid, column, f"not a valid {spec['kind']}", errors)
+        if "min" in spec:
+            _row_errors(numbers < spec["min"], column, f"must be at least {spec['min']}", errors)
+        if "max" in spec:
+            _row_errors(numbers > spec["max"], column, f"must be at most {spec['max']}", errors)
+
+        numbers = numbers.fillna(spec.get("default", 0))
+        clean[column] = numbers.astype("int64") if spec["kind"] == "int" else numbers
+    errors.sort(key=lambda e: e["row"])
+    return clean, errors[:MAX_REPORTED_ERRORS]
+
+
+def check_references(df, column, valid_ids, label, errors):
+    """Report rows of ``df`` whose ``column`` is not one of ``valid_ids``."""
+    _row_errors(~df[column].isin(valid_ids), column, f"unknown {label}", errors)
+    errors.sort(key=lambda e: e["row"])
+    del errors[MAX_REPORTED_ERRORS:]
+
+
+# ---------- Writing ----------
+def insert_batches(sheet, df, batch_size=BULK_BATCH_SIZE):
+    """Insert ``df`` with one storage write per ``batch_size`` rows; return the new ids."""
+    storage = get_storage()
+    ids = []
+    for start in range(0, len(df), batch_size):
+        ids.extend(storage.insert_many(sheet, df.iloc[start:start + batch_size]))
+    return ids
+
+
+# ---------- Exporting ----------
+def _csv_chunks(df, chunk):
+    yield df.iloc[:0].to_csv(index=False)
+    for start in range(0, len(df), chunk):
+        yield df.iloc[start:start + chunk].to_csv(index=False, header=False)
+
+
+def _json_chunks(df, chunk):
+    yield "["
+    for start in range(0, len(df), chunk):
+        body = df.iloc[start:start + chunk].to_json(orient="records")[1:-1]
+        yield ("," if start else "") + body
+    yield "]"
+
+
+def export_response(df, fmt, name, chunk=EXPORT_CHUNK):
+    """Stream ``df`` as a CSV or JSON download, serializing ``chunk`` rows at a time."""
+    chunks = _csv_chunks(df, chunk) if fmt == "csv" else _json_chunks(df, chunk)
+    return Response(
+        chunks,
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={name}.{fmt}"},
+    )
@@ -0,0 +1,162 @@
+import hmac
+import threading
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from services.schema import records
+from services.storage import _clean, advance_version, get_storage, subscribe
+
+USERS_SHEET = "users"
+# werkzeug method string; raise the cost parameters to make hashing slower
+DEFAULT_HASH_METHOD = "scrypt:32768:8:1"
+_HASH_PREFIXES = ("scrypt:", "pbkdf2:")
+
+
+def _text(value):
+    value = _clean(value)
+    return "" if value is None else str(value).strip()
+
+
+def is_hashed(stored):
+    return stored.startswith(_HASH_PREFIXES) and stored.count("$") == 2
+
+
+class CredentialStore:
+    """(username, role) -> user index with salted, adaptive password hashes.
+
+    The users sheet is read once and then kept current from storage events,
+    so a login costs one dict lookup plus the hash check. Plaintext rows
+    left over from before hashing are accepted once and rehashed on the
+    spot; so are hashes made with an older method/cost.
+    """
+
+    def __init__(self, method=DEFAULT_HASH_METHOD):
+        self.method = method
+        self._lock = threading.RLock()
+        self._index = {}   # (username, role) -> entry
+        self._keys = {}    # user id -> (username, role)
+        self._version = None
+        self._dummy = None
+        self.rebuilds = 0
+        self.rehashes = 0
+
+    def configure(self, method):
+        with self._lock:
+            self.method = method
+            self._dummy = None
+
+    # ---------- Index ----------
+    @staticmethod
+    def _key(username, role):
+        return (_text(username), _text(role).lower())
+
+    def _entry(self, row):
+        return {"id": int(_clean(row["id"])), "username": _text(row.get("username")),
+                "role": _text(row.get("role")), "password": _text(row.get("password"))}
+
+    def _add(self, entry):
+        key = self._key(entry["username"], entry["role"])
+        if key not in self._index:
+            self._index[key] = entry
+            self._keys[entry["id"]] = key
+
+    def rebuild(self):
+        storage = get_storage()
+        with self._lock:
+            version = storage.version(USERS_SHEET)
+            self._index, self._keys = {}, {}
+            for row in records(storage.read(USERS_SHEET)):
+                if _clean(row.get("id")) is not None:
+                    self._add(self._entry(row))
+            self._version = version
+            self.rebuilds += 1
+
+    def ensure_current(self):
+        with self._lock:
+            if self._version is None or self._version != get_storage().version(USERS_SHEET):
+                self.rebuild()
+
+    def on_change(self, sheet, op, id, row):
+        """Storage listener: keep the index in step with the users sheet."""
+        if sheet != USERS_SHEET:
+            return
+        with self._lock:
+            version = advance_version(self._version)
+            if op == "write" or version is None:
+                # Also when another worker changed the sheet before this
+                # change: rebuild on the next lookup to pick its rows up
+                self._version = None
+                return
+            key = self._keys.pop(int(_clean(id)), None)
+            if key is not None:
+                del self._index[key]
+            if op != "delete" and row is not None:
+                self._add(self._entry(row))
+            self._version = version
+
+    # ---------- Passwords ----------
+    def hash_password(self, password):
+        return generate_password_hash(password, method=self.method)
+
+    def _dummy_hash(self):
+        if self._dummy is None:
+            self._dummy = self.hash_password("dummy-password")
+        return self._dummy
+
+    def needs_rehash(self, stored):
+        # werkzeug spells out the defaults ("scrypt" -> "scrypt:32768:8:1"),
+        # so compare with the method of a hash it actually made.
+        method = self._dummy_hash().split("$", 1)[0]
+        return not is_hashed(stored) or stored.split("$", 1)[0] != method
+
+    def _verify(self, stored, password):
+        if is_hashed(stored):
+            return check_password_hash(stored, password)
+        return hmac.compare_digest(stored.encode(), password.encode())
+
+    # ---------- Public API ----------
+    def lookup(self, username, role):
+        self.ensure_current()
+        with self._lock:
+            entry = self._index.get(self._key(username, role))
+            return dict(entry) if entry is not None else None
+
+    def exists(self, username, role):
+        return self.lookup(username, role) is not None
+
+    def authenticate(self, username, password, role):
+        """Return the user's index entry if the credentials match, else None."""
+        entry = self.lookup(username, role)
+        if entry is None:
+            # Verify against a throwaway hash so a miss costs as much as a
+            # hit and does not reveal which usernames exist.
+            check_password_hash(self._dummy_hash(), password)
+            return None
+        if not self._verify(entry["password"], password):
+            return None
+        if self.needs_rehash(entry["password"]):
+            new_hash = self.hash_password(password)
+            get_storage().update(USERS_SHEET, entry["id"], {"password": new_hash})
+            self.rehashes += 1
+        return entry
+
+    def migrate(self):
+        """Hash every plaintext password in the users sheet with one write."""
+        storage = get_storage()
+        df = storage.read(USERS_SHEET)
+        passwords = df["password"].map(_text)
+        plain = ~passwords.map(is_hashed)
+        count = int(plain.sum())
+        if count:
+            df["password"] = passwords
+            df.loc[plain, "password"] = passwords[plain].map(self.hash_password)
+            storage.write(USERS_SHEET, df)
+        return count
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._index), "rebuilds": self.rebuilds, "rehashes": self.rehashes}
+
+
+credential_store = CredentialStore()
+subscribe(credential_store.on_change)
@@ -0,0 +1,238 @@
+import threading
+
+import pandas as pd
+
+from services.metrics import span
+from services.storage import _clean, advance_version, get_storage, subscribe
+
+ORDERS_SHEET = "orders"
+PRODUCTS_SHEET = "products"
+# Share of revenue counted as profit (PROFIT_MARGIN in the app config)
+PROFIT_MARGIN = 0.08
+ROLLUP_COLUMNS = ["quantity", "revenue", "orders"]
+
+
+def _num(value):
+    value = _clean(value)
+    try:
+        return float(value) if value is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _key(value):
+    value = _clean(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _keys(values):
+    """``_key`` of every element, vectorized when they are all whole numbers."""
+    numbers = pd.to_numeric(values, errors="coerce")
+    if numbers.notna().all() and (numbers % 1 == 0).all():
+        return numbers.astype("int64").tolist()
+    return [_key(value) for value in values]
+
+
+class DashboardMetrics:
+    """Running totals for the admin dashboard.
+
+    Order and product changes arrive as storage events and adjust the totals
+    by their delta, so reading the figures never joins the sheets. A full
+    rebuild happens on demand, after a whole-sheet write, or when another
+    process changed the orders/products sheets (seen through their versions,
+    also when that happened just before one of our own changes).
+    """
+
+    def __init__(self, margin=PROFIT_MARGIN):
+        self.margin = margin
+        self._lock = threading.RLock()
+        self._versions = None
+        self.rebuilds = 0
+        self.deltas = 0
+        self._reset()
+
+    def _reset(self):
+        self._prices = {}       # product id -> price
+        self._orders = {}       # order id -> (customer id, product id, quantity)
+        self._qty = {}          # product id -> {customer id: quantity}
+        self._products = {}     # product id -> {"quantity", "revenue", "orders"}
+        self._customers = {}    # customer id -> {"quantity", "revenue", "orders"}
+        self._quantity = 0.0
+        self._revenue = 0.0
+
+    # ---------- Deltas ----------
+    def _apply_order(self, customer, product, quantity, sign):
+        revenue = quantity * self._prices.get(product, 0.0)
+        self._quantity += sign * quantity
+        self._revenue += sign * revenue
+        for table, key in ((self._products, product), (self._customers, customer)):
+            entry = table.setdefault(key, {"quantity": 0.0, "revenue": 0.0, "orders": 0})
+            entry["quantity"] += sign * quantity
+            entry["revenue"] += sign * revenue
+            entry["orders"] += sign
+            if entry["orders"] == 0:
+                del table[key]
+        by_customer = self._qty.setdefault(product, {})
+        by_customer[customer] = by_customer.get(customer, 0.0) + sign * quantity
+        if not by_customer[customer]:
+            del by_customer[customer]
+            if not by_customer:
+                del self._qty[product]
+
+    def _set_price(self, product, price):
+        delta = price - self._prices.get(product, 0.0)
+        if price:
+            self._prices[product] = price
+        else:
+            self._prices.pop(product, None)
+        if not delta:
+            return
+        for customer, quantity in self._qty.get(product, {}).items():
+            self._revenue += delta * quantity
+            self._customers[customer]["revenue"] += delta * quantity
+            self._products[product]["revenue"] += delta * quantity
+
+    def on_change(self, sheet, op, id, row):
+        """Storage listener: fold one order/product change into the totals."""
+        if sheet not in (ORDERS_SHEET, PRODUCTS_SHEET):
+            return
+        with self._lock:
+            versions = self._advance(sheet)
+            if op == "write" or versions is None:
+                self._versions = None  # rebuild lazily on the next read
+                return
+            id = _key(id)
+            if sheet == ORDERS_SHEET:
+                old = self._orders.pop(id, None)
+                if old is not None:
+                    self._apply_order(*old, sign=-1)
+                if op != "delete" and row is not None:
+                    new = (_key(row.get("customerid")), _key(row.get("productid")), _num(row.get("quantity")))
+                    self._orders[id] = new
+                    self._apply_order(*new, sign=1)
+            else:
+                # An order for a missing product contributes no revenue,
+                # exactly like the left join it replaces.
+                price = _num(row.get("price")) if op != "delete" and row is not None else 0.0
+                self._set_price(id, price)
+            self._versions = versions
+            self.deltas += 1
+
+    def _advance(self, sheet):
+        """Versions after applying this change, or None if the totals must be rebuilt.
+
+        The totals only stay exact if the changed sheet was at the version
+        they were built from just before this change and the other sheet
+        has not moved since (no other process wrote either of them).
+        """
+        if self._versions is None:
+            return None
+        orders, products = self._versions
+        if sheet == ORDERS_SHEET:
+            orders = advance_version(orders)
+            unchanged = get_storage().version(PRODUCTS_SHEET) == products
+        else:
+            products = advance_version(products)
+            unchanged = get_storage().version(ORDERS_SHEET) == orders
+        if orders is None or products is None or not unchanged:
+            return None
+        return (orders, products)
+
+    # ---------- Rebuild ----------
+    def _current_versions(self):
+        storage = get_storage()
+        return (storage.version(ORDERS_SHEET), storage.version(PRODUCTS_SHEET))
+
+    def rebuild(self):
+        """Recompute everything from the sheets (vectorized)."""
+        storage = get_storage()
+        with self._lock, span("dashboard.rebuild"):
+            versions = self._current_versions()
+            orders = storage.read(ORDERS_SHEET)
+            products = storage.read(PRODUCTS_SHEET)
+            self._reset()
+
+            prices = products.drop_duplicates("id").set_index("id")["price"]
+            prices = pd.to_numeric(prices, errors="coerce").fillna(0.0)
+            self._prices = {_key(k): float(v) for k, v in prices.items() if v}
+
+            quantity = pd.to_numeric(orders["quantity"], errors="coerce").fillna(0.0).astype("float64")
+            revenue = quantity * orders["productid"].map(prices).fillna(0.0)
+            frame = pd.DataFrame({
+                "id": orders["id"],
+                "customerid": orders["customerid"],
+                "productid": orders["productid"],
+                "quantity": quantity,
+                "revenue": revenue,
+            })
+            self._quantity = float(frame["quantity"].sum())
+            self._revenue = float(frame["revenue"].sum())
+            customers, products = _keys(frame["customerid"]), _keys(frame["productid"])
+            self._orders = dict(zip(
+                _keys(frame["id"]), zip(customers, products, frame["quantity"].tolist())
+            ))
+            for column, table in (("productid", self._products), ("customerid", self._customers)):
+                grouped = frame.groupby(column).agg(
+                    quantity=("quantity", "sum"), revenue=("revenue", "sum"), orders=("id", "count")
+                )
+                for key, quantity, revenue, orders in zip(
+                    _keys(grouped.index.to_series()), grouped["quantity"].tolist(),
+                    grouped["revenue"].tolist(), grouped["orders"].tolist(),
+                ):
+                    table[key] = {"quantity": quantity, "revenue": revenue, "orders": orders}
+            pairs = frame.groupby(["productid", "customerid"])["quantity"].sum()
+            pairs = pairs[pairs != 0]
+            for product, customer, qty in zip(
+                _keys(pairs.index.get_level_values(0).to_series()),
+                _keys(pairs.index.get_level_values(1).to_series()),
+                pairs.tolist(),
+            ):
+                self._qty.setdefault(product, {})[customer] = qty
+            self._versions = versions
+            self.rebuilds += 1
+
+    def ensure_current(self):
+        with self._lock:
+            if self._versions is None or self._versions != self._current_versions():
+                self.rebuild()
+
+    # ---------- Reads ----------
+    def totals(self):
+        self.ensure_current()
+        with self._lock:
+            revenue = round(self._revenue, 2)
+            return {
+                "total_quantity": int(round(self._quantity)),
+                "total_revenue": revenue,
+                "total_profit": round(revenue * self.margin, 2),
+                "order_count": len(self._orders),
+            }
+
+    def breakdown(self):
+        """Per-product and per-customer quantity/revenue/order counts."""
+        self.ensure_current()
+        with self._lock:
+            return {
+                "products": {str(k): dict(v) for k, v in self._products.items()},
+                "customers": {str(k): dict(v) for k, v in self._customers.items()},
+            }
+
+    def rollups(self):
+        """Per-product and per-customer figures as DataFrames indexed by id."""
+        self.ensure_current()
+        with self._lock:
+            return tuple(
+                pd.DataFrame.from_dict(table, orient="index", columns=ROLLUP_COLUMNS)
+                for table in (self._products, self._customers)
+            )
+
+    def stats(self):
+        with self._lock:
+            return {"rebuilds": self.rebuilds, "deltas": self.deltas}
+
+
+dashboard_metrics = DashboardMetrics()
+subscribe(dashboard_metrics.on_change)
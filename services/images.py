@@ -0,0 +1,505 @@
+import functools
+import hashlib
+import http.client
+import io
+import ipaddress
+import json
+import os
+import re
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlparse
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # no thumbnails: pages keep using each product's image_url
+    Image = None
+
+from services.indexes import lookup
+from services.jobs import JobError, jobs, task
+from services.locking import FileLock, atomic_replace
+from services.metrics import span
+from services.storage import _clean, get_storage, subscribe
+
+IMAGE_CACHE_DIR = "thumbnails"
+# Disk budget of the thumbnail cache; least recently served go first
+IMAGE_CACHE_BYTES = 256 * 1024 * 1024
+# Thumbnails fit in a THUMBNAIL_SIZE x THUMBNAIL_SIZE box
+THUMBNAIL_SIZE = 320
+# Source images larger than this are refused
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+# Seconds to wait for an image host
+IMAGE_FETCH_TIMEOUT = 5
+USER_AGENT = "ecommerce-app image fetch"
+# A served thumbnail's mtime (its "last used" time for eviction) is bumped
+# at most this often, so serving does not mean a write per request
+TOUCH_INTERVAL = 3600
+# Bump when the manifest layout changes so old manifests are ignored
+MANIFEST_FORMAT = 1
+
+PRODUCTS_SHEET = "products"
+
+# Leading bytes -> file extension of the formats we accept. Anything else
+# (SVG in particular, which can carry scripts) is refused.
+SIGNATURES = (
+    (b"\xff\xd8\xff", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+CONTENT_TYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+_NAME = re.compile(r"^([0-9a-f]{32})\.(jpg|png|gif|webp)$")
+
+
+def _address(host, port, public_only=True):
+    """Socket address to connect to for ``host``.
+
+    Sellers choose the URL, so it must not become a way to probe the
+    server's own network: with ``public_only`` every address ``host``
+    resolves to must be a public one, or JobError is raised.
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror:
+        raise JobError(f"Cannot resolve {host}") from None
+    if not infos or (public_only and not all(ipaddress.ip_address(info[4][0]).is_global for info in infos)):
+        raise JobError(f"Host is not publicly reachable: {host}")
+    return infos[0][4]
+
+
+def image_format(data):
+    """File extension matching the bytes of ``data``, or None if not a supported image."""
+    for signature, extension in SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def make_thumbnail(data, size=THUMBNAIL_SIZE):
+    """(bytes, extension) of the image ``data`` scaled down to fit ``size`` x ``size``."""
+    if Image is None:
+        raise JobError("Pillow is not installed")
+    if image_format(data) is None:
+        raise JobError("Not a JPEG, PNG, GIF or WebP image")
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("RGB", (size, size))  # JPEG: decode at a reduced scale
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((size, size))
+            out = io.BytesIO()
+            if image.mode in ("RGBA", "LA", "P"):
+                image.save(out, "PNG", optimize=True)
+                extension = "png"
+            else:
+                image.convert("RGB").save(out, "JPEG", quality=85, optimize=True, progressive=True)
+                extension = "jpg"
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise JobError(f"Cannot read image: {e}") from e
+    return out.getvalue(), extension
+
+
+class _CheckedHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection to the address that passed the check.
+
+    The host is resolved once and the socket connects to that address, so
+    a DNS server cannot answer the check with a public address and the
+    connection with a private one. The Host header (and, over TLS, SNI and
+    the certificate check) still use the URL's host name.
+    """
+
+    def __init__(self, *args, public_only=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.public_only = public_only
+
+    def connect(self):
+        address = _address(self.host, self.port, self.public_only)
+        self.sock = socket.create_connection(address[:2], self.timeout, self.source_address)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class _CheckedHTTPSConnection(_CheckedHTTPConnection, http.client.HTTPSConnection):
+    def connect(self):
+        super().connect()
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host)
+
+
+class _CheckedHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def http_open(self, req):
+        connection = functools.partial(_CheckedHTTPConnection, public_only=not self.cache.local_sources)
+        return self.do_open(connection, req)
+
+
+class _CheckedHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def https_open(self, req):
+        connection = functools.partial(_CheckedHTTPSConnection, public_only=not self.cache.local_sources)
+        return self.do_open(connection, req, context=self._context)
+
+
+class _CheckedRedirects(urllib.request.HTTPRedirectHandler):
+    """Follow a redirect only to a URL the image cache would fetch directly."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        self.cache.check_url(newurl, redirect=True)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+class ImageCache:
+    """Product thumbnails in a content-addressed, size-bounded disk cache.
+
+    Whenever a product's ``image_url`` changes, a background job fetches
+    the image once (http(s), or file:// with ``local_sources``), scales it
+    down to a thumbnail and stores it under ``directory`` as
+    ``<blake2b of the thumbnail>.<ext>``: identical images share one file
+    and a file never changes, so it can be served with a year-long cache
+    lifetime. ``manifest.json`` maps product ids and source URLs to their
+    thumbnail, so a URL already fetched for another product is not fetched
+    again; a URL that gives no image is remembered too, so it is not
+    fetched again on every update of the product. Once the files add up to
+    more than ``max_bytes`` the least recently served are evicted and the
+    products using them show their original URL until they next change.
+
+    Resizing needs Pillow. Without it the cache stays off (``enabled`` is
+    False) and pages show every product's own image URL.
+    """
+
+    enabled = Image is not None
+
+    def __init__(self, directory=IMAGE_CACHE_DIR):
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._manifest_version = None
+        self._size = None      # bytes on disk, estimated between scans
+        self._touched = {}     # name -> last mtime bump in this process
+        self.fetched = 0
+        self.reused = 0
+        self.stored = 0
+        self.evictions = 0
+        self.configure(directory)
+
+    def configure(self, directory=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_BYTES, size=THUMBNAIL_SIZE,
+                  max_source_bytes=IMAGE_MAX_BYTES, local_sources=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.max_source_bytes = max_source_bytes
+        # Allows file:// and private hosts: for development and tests only
+        self.local_sources = local_sources
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.file_lock = FileLock(os.path.join(directory, "cache.lock"))
+        # No proxies: the connection must go to the address that was checked
+        self._opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}), _CheckedHTTPHandler(self), _CheckedHTTPSHandler(self),
+            _CheckedRedirects(self),
+        )
+        with self._lock:
+            self._manifest = None
+            self._manifest_version = None
+            self._size = None
+
+    # ---------- Manifest ----------
+    @staticmethod
+    def _empty_manifest():
+        return {"format": MANIFEST_FORMAT, "products": {}, "sources": {}}
+
+    def version(self):
+        """Token that changes whenever any process changes the manifest."""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return self._empty_manifest()
+        if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+            return self._empty_manifest()
+        return manifest
+
+    def manifest(self):
+        """The current manifest (shared, do not modify)."""
+        version = self.version()
+        with self._lock:
+            if self._manifest is None or version != self._manifest_version:
+                self._manifest = self._load()
+                self._manifest_version = version
+            return self._manifest
+
+    def _update(self, change):
+        """Apply ``change(manifest)`` to the latest manifest and save it. Hold ``file_lock``."""
+        manifest = self._load()
+        change(manifest)
+
+        def write(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+
+        atomic_replace(self.manifest_path, write)
+        with self._lock:
+            self._manifest = manifest
+            self._manifest_version = self.version()
+
+    # ---------- Lookups ----------
+    def source(self, product_id):
+        """The image URL the product's thumbnail was made from, or None."""
+        entry = self.manifest()["products"].get(str(product_id))
+        return entry["source"] if entry else None
+
+    def thumbnail(self, product_id):
+        """File name of the product's thumbnail, or None if there is none (yet)."""
+        if not self.enabled:
+            return None
+        entry = self.manifest()["products"].get(str(product_id))
+        return entry["name"] if entry else None
+
+    def path(self, name):
+        """Absolute path of the cached file ``name``, or None if the name is invalid or evicted."""
+        if not name or not _NAME.match(name):
+            return None
+        path = os.path.abspath(os.path.join(self.directory, name[:2], name))
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - mtime > TOUCH_INTERVAL and now - self._touched.get(name, 0) > TOUCH_INTERVAL:
+            self._touched[name] = now
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return path
+
+    @staticmethod
+    def content_type(name):
+        return CONTENT_TYPES[name.rsplit(".", 1)[1]]
+
+    # ---------- Fetching ----------
+    def check_url(self, url, redirect=False):
+        """Raise JobError unless ``url`` is a source the cache may read.
+
+        Whether the host is public is checked when connecting to it (see
+        _CheckedHTTPConnection), against the address actually used.
+        """
+        parsed = urlparse(url)
+        if parsed.scheme == "file" and self.local_sources and not redirect:
+            return
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise JobError(f"Not an http(s) URL: {url}")
+
+    def fetch(self, url):
+        """Bytes of the image at ``url``. Network errors propagate, so the job is retried."""
+        self.check_url(url)
+        parsed = urlparse(url)
+        with span("images.fetch"):
+            if parsed.scheme == "file":
+                try:
+                    with open(urllib.request.url2pathname(parsed.path), "rb") as f:
+                        data = f.read(self.max_source_bytes + 1)
+                except OSError as e:
+                    raise JobError(f"Cannot read {url}: {e.strerror}") from e
+            else:
+                request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+                try:
+                    with self._opener.open(request, timeout=IMAGE_FETCH_TIMEOUT) as response:
+                        data = response.read(self.max_source_bytes + 1)
+                except urllib.error.HTTPError as e:
+                    if e.code >= 500:
+                        raise  # the host may recover: retry
+                    raise JobError(f"HTTP {e.code} from {parsed.hostname}") from e
+        if len(data) > self.max_source_bytes:
+            raise JobError(f"Image is larger than {self.max_source_bytes} bytes")
+        self.fetched += 1
+        return data
+
+    # ---------- Storing ----------
+    def _store(self, data, extension):
+        """Write ``data`` under its digest (if not there yet); return the file name."""
+        name = f"{hashlib.blake2b(data, digest_size=16).hexdigest()}.{extension}"
+        path = os.path.join(self.directory, name[:2], name)
+        if os.path.exists(path):
+            os.utime(path)
+            return name
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.chmod(tmp, 0o644)
+
+        atomic_replace(path, write)
+        self.stored += 1
+        if self._size is not None:
+            self._size += len(data)
+        return name
+
+    def _files(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and len(entry.name) == 2:
+                for file in os.scandir(entry.path):
+                    if _NAME.match(file.name):
+                        stat = file.stat()
+                        yield file.name, file.path, stat.st_size, stat.st_mtime
+
+    def _evict(self, keep):
+        """Remove the least recently used files beyond ``max_bytes`` (never ``keep``). Hold ``file_lock``."""
+        if self._size is not None and self._size <= self.max_bytes:
+            return []
+        files = sorted(self._files(), key=lambda file: file[3])
+        self._size = sum(file[2] for file in files)
+        evicted = []
+        for name, path, size, _ in files:
+            if self._size <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            evicted.append(name)
+        self.evictions += len(evicted)
+        return evicted
+
+    def build(self, product_id, url):
+        """Fetch ``url`` (unless already cached), store its thumbnail and link it to the product."""
+        key = str(product_id)
+        reused = self.manifest()["sources"].get(url)
+        if reused and self.path(reused):
+            name = reused
+            self.reused += 1
+        else:
+            data = self.fetch(url)
+            with span("images.thumbnail"):
+                thumbnail, extension = make_thumbnail(data, self.size)
+            name = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        with self.file_lock:
+            if name is None:
+                name = self._store(thumbnail, extension)
+            evicted = set(self._evict(keep=name))
+
+            def change(manifest):
+                manifest["sources"][url] = name
+                manifest["products"][key] = {"source": url, "name": name}
+                if evicted:
+                    manifest["sources"] = {
+                        source: file for source, file in manifest["sources"].items() if file not in evicted
+                    }
+                    manifest["products"] = {
+                        id: entry for id, entry in manifest["products"].items() if entry["name"] not in evicted
+                    }
+
+            self._update(change)
+        return {"product_id": product_id, "name": name, "evicted": len(evicted)}
+
+    def fail(self, product_id, url):
+        """Record that ``url`` gave no thumbnail: the product shows its own URL
+        and is not fetched again until the URL changes."""
+        key = str(product_id)
+        os.makedirs(self.directory, exist_ok=True)
+        with self.file_lock:
+            self._update(lambda manifest: manifest["products"].__setitem__(key, {"source": url, "name": None}))
+
+    def forget(self, product_id):
+        """Unlink the product from its thumbnail (the file stays until evicted)."""
+        key = str(product_id)
+        if key not in self.manifest()["products"]:
+            return
+        with self.file_lock:
+            self._update(lambda manifest: manifest["products"].pop(key, None))
+
+    # ---------- Events ----------
+    def on_change(self, sheet, op, id, row):
+        """Storage listener: (re)build the thumbnail of a product whose image changed."""
+        if sheet != PRODUCTS_SHEET or not self.enabled:
+            return
+        if op == "write":
+            jobs.enqueue("images.sync", key="images.sync")
+        elif op == "delete":
+            jobs.enqueue("images.thumbnail", _clean(id), key=f"thumbnail:{id}")
+        elif (_clean(row.get("image_url")) or None) != self.source(id):
+            jobs.enqueue("images.thumbnail", _clean(id), key=f"thumbnail:{id}")
+
+    def stats(self):
+        with self._lock:
+            products = sum(1 for entry in self._manifest["products"].values() if entry["name"]) \
+                if self._manifest else None
+        return {
+            "thumbnails": products,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "fetched": self.fetched,
+            "reused": self.reused,
+            "stored": self.stored,
+            "evictions": self.evictions,
+            "enabled": self.enabled,
+        }
+
+
+image_cache = ImageCache()
+subscribe(image_cache.on_change)
+
+
+@task("images.thumbnail")
+def build_thumbnail(product_id):
+    """Job: make the product's thumbnail from its current image URL."""
+    product = lookup(PRODUCTS_SHEET, product_id)
+    url = _clean(product.get("image_url")) if product else None
+    if not url:
+        image_cache.forget(product_id)
+        return {"product_id": product_id, "name": None}
+    name = image_cache.thumbnail(product_id)
+    if url == image_cache.source(product_id) and image_cache.path(name):
+        return {"product_id": product_id, "name": name}
+    try:
+        return image_cache.build(product_id, url)
+    except JobError:
+        image_cache.fail(product_id, url)
+        raise
+
+
+@task("images.sync")
+def sync_thumbnails():
+    """Job: queue a thumbnail for every product whose image URL is not the one cached."""
+    if not image_cache.enabled:
+        return {"queued": 0}
+    df = get_storage().read(PRODUCTS_SHEET)
+    if "id" not in df.columns or "image_url" not in df.columns:
+        return {"queued": 0}
+    products = image_cache.manifest()["products"]
+    wanted = {}
+    for id, url in zip(df["id"].tolist(), df["image_url"].tolist()):
+        id, url = _clean(id), _clean(url) or None
+        if id is not None:
+            wanted[str(id)] = (id, url)
+    queued = 0
+    for key, (id, url) in wanted.items():
+        entry = products.get(key)
+        if url != (entry["source"] if entry else None):
+            jobs.enqueue("images.thumbnail", id, key=f"thumbnail:{id}")
+            queued += 1
+    for key in products.keys() - wanted.keys():
+        image_cache.forget(key)
+    return {"queued": queued}
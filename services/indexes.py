@@ -0,0 +1,182 @@
+import threading
+
+from services.metrics import span
+from services.schema import records
+from services.storage import _clean, advance_version, get_storage, subscribe
+
+# sheet -> foreign-key columns indexed alongside the primary key ``id``
+INDEXED_SHEETS = {
+    "customers": (),
+    "products": ("seller_id",),
+    "orders": ("customerid", "productid"),
+}
+
+
+def _key(value):
+    value = _clean(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+class SheetIndex:
+    """Hash indexes over one sheet: ``id`` -> row and foreign key -> ids.
+
+    Row changes arrive as storage events and are applied in place; a
+    whole-sheet write, or a change made by another process (seen through
+    ``storage.version``, also when it lands just before one of ours),
+    rebuilds the indexes on the next lookup. As with
+    ``Storage.get``, the first row wins when an id appears twice.
+    """
+
+    def __init__(self, sheet, foreign_keys=()):
+        self.sheet = sheet
+        self.foreign_keys = tuple(foreign_keys)
+        self._lock = threading.RLock()
+        self._rows = {}       # id -> row (a record, or a dict once changed)
+        self._refs = {}       # column -> {value: {id: None}} (insertion ordered)
+        self.columns = []
+        self._version = None
+        self.rebuilds = 0
+        self.incremental_updates = 0
+
+    # ---------- Maintenance ----------
+    def _link(self, id, row):
+        for column in self.foreign_keys:
+            self._refs[column].setdefault(_key(row.get(column)), {})[id] = None
+
+    def _unlink(self, id, row):
+        for column in self.foreign_keys:
+            value = _key(row.get(column))
+            ids = self._refs[column].get(value)
+            if ids is not None:
+                ids.pop(id, None)
+                if not ids:
+                    del self._refs[column][value]
+
+    def rebuild(self):
+        storage = get_storage()
+        with self._lock, span(f"index.rebuild {self.sheet}"):
+            version = storage.version(self.sheet)
+            df = storage.read(self.sheet)
+            self._rows = {}
+            self._refs = {column: {} for column in self.foreign_keys}
+            self.columns = list(df.columns)
+            if "id" in df.columns:
+                df = df[df["id"].notna() & ~df["id"].duplicated()]
+                for row in records(df):
+                    id = _key(row["id"])
+                    self._rows[id] = row
+                    self._link(id, row)
+            self._version = version
+            self.rebuilds += 1
+
+    def ensure_current(self):
+        with self._lock:
+            if self._version is None or self._version != get_storage().version(self.sheet):
+                self.rebuild()
+
+    def on_change(self, sheet, op, id, row):
+        """Storage listener: apply one row change to the indexes."""
+        if sheet != self.sheet:
+            return
+        with self._lock:
+            version = advance_version(self._version)
+            if op == "write" or version is None:
+                # A whole-sheet write, or rows from another process that
+                # this event does not carry: rebuild lazily on the next lookup
+                self._version = None
+                return
+            id = _key(id)
+            old = self._rows.pop(id, None)
+            if old is not None:
+                self._unlink(id, old)
+            if op != "delete" and row is not None:
+                row = dict(row)
+                self.columns += [column for column in row if column not in self.columns]
+                self._rows[id] = row
+                self._link(id, row)
+            self._version = version
+            self.incremental_updates += 1
+
+    # ---------- Lookups ----------
+    def get(self, id):
+        """Row with primary key ``id`` (a copy), or None."""
+        self.ensure_current()
+        with self._lock:
+            row = self._rows.get(_key(id))
+            return dict(row) if row is not None else None
+
+    def rows_by(self, column, value):
+        """Every row whose ``column`` equals ``value``, in sheet order."""
+        self.ensure_current()
+        with self._lock:
+            ids = self._refs[column].get(_key(value), {})
+            return [dict(self._rows[id]) for id in ids]
+
+    def count_by(self, column, value):
+        self.ensure_current()
+        with self._lock:
+            return len(self._refs[column].get(_key(value), ()))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rows": len(self._rows),
+                "rebuilds": self.rebuilds,
+                "incremental_updates": self.incremental_updates,
+            }
+
+
+indexes = {sheet: SheetIndex(sheet, keys) for sheet, keys in INDEXED_SHEETS.items()}
+for _index in indexes.values():
+    subscribe(_index.on_change)
+
+
+# ---------- Public API ----------
+def lookup(sheet, id):
+    return indexes[sheet].get(id)
+
+
+def rows_by(sheet, column, value):
+    return indexes[sheet].rows_by(column, value)
+
+
+def join(rows, sheet, on, suffixes=("_x", "_y")):
+    """Left-join ``rows`` (dicts) to ``sheet`` on ``row[on] == sheet.id``.
+
+    Mirrors ``pd.merge(..., left_on=on, right_on="id", how="left")``,
+    including the suffixes on overlapping columns, but looks every match up
+    in the primary-key index instead of building and merging frames.
+    """
+    index = indexes[sheet]
+    index.ensure_current()
+    joined = []
+    with index._lock:
+        columns = list(index.columns)
+        for row in rows:
+            match = index._rows.get(_key(row.get(on))) or {}
+            result = {}
+            for column, value in row.items():
+                result[column + suffixes[0] if column in columns else column] = value
+            for column in columns:
+                result[column + suffixes[1] if column in row else column] = match.get(column)
+            joined.append(result)
+    return joined
+
+
+def order_history(customer_id):
+    """The customer's orders with product name, price and line total."""
+    history = []
+    for row in join(rows_by("orders", "customerid", customer_id), "products", "productid",
+                    suffixes=("", "_product")):
+        quantity, price = _clean(row.get("quantity")), _clean(row.get("price"))
+        row["product_name"] = row.get("name")
+        row["total_price"] = quantity * price if quantity is not None and price is not None else None
+        history.append(row)
+    return history
+
+
+def stats():
+    return {sheet: index.stats() for sheet, index in indexes.items()}
@@ -0,0 +1,247 @@
+import pickle
+import threading
+import time
+from collections import Counter
+
+import pandas as pd
+
+from services.jobs import jobs, task
+from services.locking import FileLock, atomic_replace
+from services.metrics import span
+from services.schema import DTYPES, matches_dtype
+from services.storage import SCHEMAS, _clean, get_storage, subscribe
+
+INTEGRITY_FILE = "integrity.state"
+# Bump when the state layout or the checks change so old files trigger a
+# full check
+INTEGRITY_FORMAT = 2
+# Seconds after a change before the background check runs; changes made
+# meanwhile are checked by the same run
+CHECK_DELAY = 30
+
+# (sheet, column, referenced sheet): every value of ``column`` must be an
+# id of the referenced sheet. Registration writes a customers row with the
+# same id as every users row; orders point at the customer, as the bulk
+# order import checks.
+REFERENCES = (
+    ("orders", "customerid", "customers"),
+    ("orders", "productid", "products"),
+    ("products", "seller_id", "users"),
+    ("users", "id", "customers"),
+    ("stock", "id", "products"),
+)
+SHEETS = tuple(SCHEMAS)
+
+_EMPTY = pd.Index([], dtype="int64")
+
+
+def _ids(series):
+    return pd.to_numeric(series, errors="coerce")
+
+
+def _signatures(df):
+    """One 64-bit hash per id summarizing its row(s); rows without an id are left out."""
+    if "id" not in df.columns:
+        return pd.Series([], index=_EMPTY, dtype="uint64")
+    ids = _ids(df["id"])
+    present = ids.notna()
+    hashes = pd.util.hash_pandas_object(df[present], index=False).to_numpy()
+    # Summing wraps around, so duplicate ids still give one signature that
+    # changes when any of their rows does.
+    return pd.Series(hashes, index=ids[present].astype("int64").to_numpy()).groupby(level=0).sum()
+
+
+def _shape(df):
+    """What the sheet-level checks look at: columns, dtypes and rows without an id."""
+    missing = int(_ids(df["id"]).isna().sum()) if "id" in df.columns else len(df)
+    return (tuple(df.columns), tuple(str(dtype) for dtype in df.dtypes), missing)
+
+
+def _issue(check, sheet, message, id=None, column=None, value=None):
+    return {"check": check, "sheet": sheet, "id": _clean(id), "column": column,
+            "value": _clean(value), "message": message}
+
+
+def _key(issue):
+    return (issue["check"], issue["sheet"], issue["id"], issue["column"])
+
+
+class IntegrityChecker:
+    """Referential integrity, duplicate/missing ids and column schema of every sheet.
+
+    A run compares a hash of every row (per id) with the one recorded by
+    the previous run in ``path`` and re-checks only the rows that changed,
+    plus the rows whose references point at ids that appeared or vanished.
+    Hashing is a single vectorized pass per sheet, so a run on a large,
+    mostly unchanged workbook costs a fraction of a full check. The
+    outstanding issues are kept in the same file, so the CLI, the startup
+    check and the background check all continue from one another.
+    """
+
+    def __init__(self, path=INTEGRITY_FILE):
+        self._lock = threading.Lock()
+        self.last_report = None
+        self.runs = 0
+        self.configure(path)
+
+    def configure(self, path=INTEGRITY_FILE, delay=CHECK_DELAY):
+        self.path = path
+        self.delay = delay
+        self.file_lock = FileLock(path + ".lock")
+
+    # ---------- State ----------
+    @staticmethod
+    def _empty_state():
+        return {"format": INTEGRITY_FORMAT, "signatures": {}, "shapes": {}, "issues": {}}
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return self._empty_state()
+        except Exception:
+            return self._empty_state()  # torn or foreign file: start over
+        if not isinstance(state, dict) or state.get("format") != INTEGRITY_FORMAT:
+            return self._empty_state()
+        return state
+
+    def _save(self, state):
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        atomic_replace(self.path, write)
+
+    # ---------- Checks ----------
+    @staticmethod
+    def _check_sheet(sheet, df):
+        """Sheet-level issues: missing columns, undeclared dtypes, rows without an id."""
+        found = []
+        for column in SCHEMAS[sheet]:
+            if column not in df.columns:
+                found.append(_issue("schema", sheet, f"Column '{column}' is missing", column=column))
+        for column, dtype in DTYPES.get(sheet, {}).items():
+            if column in df.columns and not matches_dtype(df[column], dtype):
+                found.append(_issue(
+                    "schema", sheet, f"Column '{column}' holds {df[column].dtype} values, expected {dtype}",
+                    column=column,
+                ))
+        if "id" in df.columns:
+            missing = int(_ids(df["id"]).isna().sum())
+            if missing:
+                found.append(_issue("missing_id", sheet, f"{missing} rows have no id", column="id", value=missing))
+        return found
+
+    @staticmethod
+    def _check_rows(sheet, df, ids, targets):
+        """Row-level issues of the rows of ``sheet`` whose id is in ``ids``."""
+        if not len(ids) or "id" not in df.columns:
+            return []
+        found = []
+        all_ids = _ids(df["id"])
+        rows = df[all_ids.isin(ids)]
+        row_ids = all_ids[rows.index]
+
+        counts = row_ids.value_counts()
+        for id, count in counts[counts > 1].items():
+            found.append(_issue("duplicate_id", sheet, f"id {int(id)} is used by {count} rows", id, "id", id))
+
+        for source, column, target in REFERENCES:
+            if source != sheet or column not in rows.columns:
+                continue
+            values = _ids(rows[column])
+            broken = ~values.isin(targets[target])
+            for id, value in zip(row_ids[broken], values[broken]):
+                if pd.isna(value):
+                    message = f"No {column}"
+                elif column == "id":
+                    message = f"No {target} row with id {int(value)}"
+                else:
+                    message = f"{column} {int(value)} does not exist in {target}"
+                found.append(_issue("reference", sheet, message, id, column, value))
+        return found
+
+    def check(self, full=False):
+        """Check what changed since the last run (everything with ``full``); return a report."""
+        started = time.perf_counter()
+        storage = get_storage()
+        with self._lock, self.file_lock, span("integrity.check"):
+            state = self._empty_state() if full else self._load()
+            mode = "incremental" if state["signatures"] else "full"
+            frames = {sheet: storage.read(sheet) for sheet in SHEETS}
+            signatures = {sheet: _signatures(df) for sheet, df in frames.items()}
+            shapes = {sheet: _shape(df) for sheet, df in frames.items()}
+
+            touched, flipped, gone = {}, {}, {}
+            for sheet in SHEETS:
+                new, old = signatures[sheet], state["signatures"].get(sheet)
+                if old is None:
+                    added, changed, deleted = new.index, _EMPTY, _EMPTY
+                else:
+                    common = new.index.intersection(old.index)
+                    changed = common[new[common].to_numpy() != old[common].to_numpy()]
+                    added, deleted = new.index.difference(old.index), old.index.difference(new.index)
+                touched[sheet] = added.union(changed)
+                flipped[sheet] = added.union(deleted)
+                gone[sheet] = deleted
+
+            # Rows pointing at an id that appeared or vanished need a new look
+            for sheet, column, target in REFERENCES:
+                df = frames[sheet]
+                if len(flipped[target]) and column in df.columns and "id" in df.columns:
+                    hit = _ids(df[column]).isin(flipped[target])
+                    touched[sheet] = touched[sheet].union(pd.Index(_ids(df["id"][hit]).dropna().astype("int64")))
+
+            issues = state["issues"]
+            targets = {sheet: signatures[sheet].index for sheet in SHEETS}
+            checked = {}
+            for sheet in SHEETS:
+                reshaped = state["shapes"].get(sheet) != shapes[sheet]
+                stale = set(touched[sheet]) | set(gone[sheet])
+                for key in [key for key in issues if key[1] == sheet]:
+                    if key[2] in stale or (reshaped and key[0] in ("schema", "missing_id")):
+                        del issues[key]
+                found = self._check_sheet(sheet, frames[sheet]) if reshaped else []
+                found += self._check_rows(sheet, frames[sheet], touched[sheet], targets)
+                issues.update((_key(issue), issue) for issue in found)
+                checked[sheet] = len(touched[sheet])
+
+            state.update(signatures=signatures, shapes=shapes, issues=issues)
+            self._save(state)
+
+            counts = Counter(issue["check"] for issue in issues.values())
+            self.runs += 1
+            self.last_report = {
+                "mode": mode,
+                "checked_rows": checked,
+                "issues": len(issues),
+                "by_check": dict(counts),
+                "ms": round((time.perf_counter() - started) * 1000, 2),
+                "finished": time.time(),
+            }
+            return self.last_report
+
+    def issues(self, sheet=None, limit=None):
+        """Outstanding issues as of the last run (in any process)."""
+        with self.file_lock:
+            issues = list(self._load()["issues"].values())
+        if sheet is not None:
+            issues = [issue for issue in issues if issue["sheet"] == sheet]
+        issues.sort(key=lambda issue: (issue["sheet"], issue["check"], issue["id"] is not None, issue["id"] or 0))
+        return issues[:limit] if limit else issues
+
+    def on_change(self, sheet, op, id, row):
+        """Storage listener: check the change a little later in the background."""
+        if sheet in SCHEMAS:
+            jobs.enqueue("integrity.check", key="integrity.check", delay=self.delay)
+
+
+integrity = IntegrityChecker()
+subscribe(integrity.on_change)
+
+
+@task("integrity.check")
+def check_integrity():
+    """Job: check the rows changed since the last run."""
+    return integrity.check()
@@ -0,0 +1,372 @@
+import atexit
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.locking import FileLock, StripedLock
+from services.storage import _clean, get_storage, subscribe
+
+INVENTORY_FILE = "stock.counters"
+PRODUCTS_SHEET = "products"
+# Persisted copy of the counters, one row per product id
+STOCK_SHEET = "stock"
+
+# One 16-byte slot per product id: whether it holds a value, and the stock
+SLOT = np.dtype([("set", "<i8"), ("stock", "<i8")])
+MIN_SLOTS = 1024
+
+
+def _stock(value):
+    value = _clean(value)
+    try:
+        return max(int(value), 0) if value is not None else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def _counts(df):
+    """(ids, stocks) of ``df`` as int64 arrays, skipping rows without a usable id."""
+    if df.empty or "id" not in df.columns:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    ids = pd.to_numeric(df["id"], errors="coerce")
+    # Blank, fractional or non-positive ids have no counter slot
+    usable = ids.notna() & (ids % 1 == 0) & (ids >= 1)
+    df, ids = df[usable], ids[usable].to_numpy(dtype=np.int64)
+    if "stock" in df.columns:
+        stocks = df["stock"].map(_stock).to_numpy(dtype=np.int64, copy=True)
+    else:
+        stocks = np.zeros(len(ids), dtype=np.int64)
+    return ids, stocks
+
+
+class CounterFile:
+    """Array of stock slots in a memory-mapped file, indexed by product id.
+
+    Every process maps the same file, so a change made under the product's
+    stripe lock is immediately visible to all workers. The file only grows.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._array = None
+        self._lock = threading.Lock()
+        self._grow_lock = FileLock(path + ".grow.lock")
+
+    def _remap(self):
+        size = os.fstat(self._fd).st_size
+        if size:
+            # Old maps are left to the garbage collector: other threads may
+            # still hold views of them, and they share the file's pages.
+            self._array = np.frombuffer(mmap.mmap(self._fd, size), dtype=SLOT)
+
+    def fits(self, id):
+        """Whether ``id`` has a slot in this process's current map."""
+        array = self._array
+        return array is not None and id < len(array)
+
+    def slots(self, id):
+        """Return the slot array, growing the file so that ``id`` fits."""
+        array = self._array
+        if array is not None and id < len(array):
+            return array
+        with self._lock:
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._remap()  # another process may already have grown it
+            if self._array is None or id >= len(self._array):
+                with self._grow_lock:
+                    current = os.fstat(self._fd).st_size // SLOT.itemsize
+                    wanted = max(id + 1, 2 * current, MIN_SLOTS)
+                    if wanted > current:
+                        os.ftruncate(self._fd, wanted * SLOT.itemsize)
+                self._remap()
+            return self._array
+
+
+class Inventory:
+    """Per-product stock counters with atomic reserve/release.
+
+    The live counters sit in a shared ``CounterFile``; each product is
+    guarded by one of ``stripes`` cross-process locks, so checkouts of
+    unrelated products never wait for each other and never rewrite a sheet.
+    A counter is seeded from the stock sheet the first time it is used, or
+    from the product's listed ``stock`` if it has no row there yet.
+    Changed counters are copied into the stock sheet in batches by a
+    background thread (and at exit); the counters stay the authority, the
+    sheet is their persisted copy. Keeping them out of the products sheet
+    means a flush never rewrites the catalog or invalidates its caches.
+    """
+
+    def __init__(self, path=INVENTORY_FILE, stripes=64, flush_interval=1.0, flush_batch=500):
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._dirty = set()
+        self._removed = set()
+        self._dirty_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._seeded = False
+        self.reservations = 0
+        self.rejections = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self.configure(path, stripes)
+        atexit.register(self.flush)
+
+    def configure(self, path=INVENTORY_FILE, stripes=64):
+        self.path = path
+        self.counters = CounterFile(path)
+        self.locks = StripedLock(path + ".lock", stripes)
+        # Serializes changes to one order so two edits never move its
+        # reservation from the same starting point.
+        self.order_locks = StripedLock(path + ".orders.lock", stripes)
+        # Taken by a flush, so two workers never both add a product's row
+        self.flush_lock = FileLock(path + ".flush.lock")
+        self._seeded = False
+
+    # ---------- Counters ----------
+    def _seed(self):
+        """Seed every unseeded counter from the stock and products sheets in one pass."""
+        storage = get_storage()
+        ids, stocks = _counts(storage.read(PRODUCTS_SHEET))
+        saved_ids, saved = _counts(storage.read(STOCK_SHEET))
+        if not len(ids):
+            self._seeded = True
+            return
+        # Saved counters win over the stock the product was listed with
+        known = np.isin(saved_ids, ids)
+        position = {int(id): n for n, id in enumerate(ids)}
+        stocks[[position[int(id)] for id in saved_ids[known]]] = saved[known]
+        array = self.counters.slots(int(ids.max()))
+        stripes = ids % self.locks.stripes
+        for stripe in np.unique(stripes):
+            members = stripes == stripe
+            with self.locks.hold(int(stripe)):
+                unset = array["set"][ids[members]] == 0
+                targets = ids[members][unset]
+                array["stock"][targets] = stocks[members][unset]
+                array["set"][targets] = 1
+        self._seeded = True
+
+    def _current(self, array, product_id):
+        """Counter for ``product_id`` (caller holds its stripe); None if unknown."""
+        if not array["set"][product_id]:
+            storage = get_storage()
+            product = storage.get(PRODUCTS_SHEET, product_id)
+            if product is None:
+                return None
+            saved = storage.get(STOCK_SHEET, product_id) or product
+            array["stock"][product_id] = _stock(saved.get("stock"))
+            array["set"][product_id] = 1
+        return int(array["stock"][product_id])
+
+    def _slots(self, product_id):
+        """Slot array holding ``product_id``; None if no product can have that id.
+
+        Ids below 1 would index the array from its end, and ids past it would
+        grow the file, so the latter must belong to an existing product.
+        """
+        if product_id < 1:
+            return None
+        if not self._seeded:
+            self._seed()
+        if not self.counters.fits(product_id) and get_storage().get(PRODUCTS_SHEET, product_id) is None:
+            return None
+        return self.counters.slots(product_id)
+
+    def _changed(self, product_id):
+        with self._dirty_lock:
+            self._dirty.add(product_id)
+            if len(self._dirty) >= self.flush_batch:
+                self._wake.set()
+        self._start()
+
+    # ---------- Public API ----------
+    def available(self, product_id):
+        product_id = int(product_id)
+        array = self._slots(product_id)
+        if array is None:
+            return None
+        with self.locks.hold(product_id):
+            return self._current(array, product_id)
+
+    def reserve(self, product_id, quantity):
+        """Take ``quantity`` units if that many are left; return True on success."""
+        product_id, quantity = int(product_id), int(quantity)
+        if quantity <= 0:
+            return False
+        array = self._slots(product_id)
+        if array is None:
+            self.rejections += 1
+            return False
+        with self.locks.hold(product_id):
+            current = self._current(array, product_id)
+            if current is None or current < quantity:
+                self.rejections += 1
+                return False
+            array["stock"][product_id] = current - quantity
+        self.reservations += 1
+        self._changed(product_id)
+        return True
+
+    def release(self, product_id, quantity):
+        """Give back ``quantity`` units (e.g. an order was cancelled)."""
+        product_id, quantity = int(product_id), int(quantity)
+        if quantity <= 0:
+            return
+        array = self._slots(product_id)
+        if array is None:
+            return  # no such product
+        with self.locks.hold(product_id):
+            current = self._current(array, product_id)
+            if current is None:
+                return  # the product is gone
+            array["stock"][product_id] = current + quantity
+        self._changed(product_id)
+
+    def adjust(self, old_product, old_quantity, new_product, new_quantity):
+        """Move a reservation when an order changes; False if the new one does not fit."""
+        old_product, old_quantity = int(old_product), int(old_quantity)
+        new_product, new_quantity = int(new_product), int(new_quantity)
+        if old_product == new_product:
+            delta = new_quantity - old_quantity
+            if delta > 0:
+                return self.reserve(new_product, delta)
+            self.release(old_product, -delta)
+            return True
+        if not self.reserve(new_product, new_quantity):
+            return False
+        self.release(old_product, old_quantity)
+        return True
+
+    def order(self, order_id):
+        """Context manager held while an order's reservation is changed."""
+        return self.order_locks.hold(order_id)
+
+    def reserve_many(self, quantities):
+        """Reserve {product_id: quantity} all or nothing; return the ids that did not fit."""
+        taken, failed = [], []
+        for product_id, quantity in quantities.items():
+            if self.reserve(product_id, quantity):
+                taken.append((product_id, quantity))
+            else:
+                failed.append(product_id)
+        if failed:
+            for product_id, quantity in taken:
+                self.release(product_id, quantity)
+        return failed
+
+    def add_stock(self, product_id, delta):
+        """Add ``delta`` units (negative to write some off), never going below 0.
+
+        Returns the new count, or None if there is no such product.
+        """
+        product_id, delta = int(product_id), int(delta)
+        array = self._slots(product_id)
+        if array is None:
+            return None
+        with self.locks.hold(product_id):
+            current = self._current(array, product_id)
+            if current is None:
+                return None
+            array["stock"][product_id] = max(current + delta, 0)
+            stock = int(array["stock"][product_id])
+        self._changed(product_id)
+        return stock
+
+    def set_stock(self, product_id, stock):
+        """Overwrite the counter, e.g. after a seller edits the product."""
+        product_id = int(product_id)
+        array = self._slots(product_id)
+        if array is None:
+            return  # no such product
+        with self.locks.hold(product_id):
+            array["stock"][product_id] = _stock(stock)
+            array["set"][product_id] = 1
+        self._changed(product_id)
+
+    def on_change(self, sheet, op, id, row):
+        """Storage listener: forget the counter (and saved row) of a deleted product."""
+        if sheet != PRODUCTS_SHEET or op != "delete":
+            return
+        product_id = int(id)
+        if product_id < 1:
+            return
+        array = self.counters.slots(product_id)
+        with self.locks.hold(product_id):
+            array["set"][product_id] = 0
+        with self._dirty_lock:
+            self._dirty.discard(product_id)
+            self._removed.add(product_id)
+        self._start()
+
+    # ---------- Persistence ----------
+    def flush(self):
+        """Copy every changed counter into the stock sheet in one batch."""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+            removed, self._removed = self._removed, set()
+        if not dirty and not removed:
+            return 0
+        started = time.perf_counter()
+        counts = {}
+        if dirty:
+            array = self.counters.slots(max(dirty))
+            counts = {id: int(array["stock"][id]) for id in dirty if array["set"][id]}
+        storage = get_storage()
+        try:
+            with self.flush_lock:
+                saved = set(_counts(storage.read(STOCK_SHEET))[0].tolist())
+                storage.update_many(STOCK_SHEET, {id: {"stock": n} for id, n in counts.items() if id in saved})
+                # A product's first flush adds its row, keyed by the product id
+                for id, n in counts.items():
+                    if id not in saved:
+                        storage.insert(STOCK_SHEET, {"id": id, "stock": n})
+                for id in removed & saved:
+                    storage.delete(STOCK_SHEET, id)
+        except Exception:
+            with self._dirty_lock:
+                # Retried on the next pass
+                self._dirty |= dirty
+                self._removed |= removed
+            raise
+        self.flushes += 1
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        return len(counts)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def _start(self):
+        if self._thread is None:
+            with self._dirty_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="inventory-flusher", daemon=True)
+                    self._thread.start()
+
+    def stats(self):
+        with self._dirty_lock:
+            pending = len(self._dirty)
+        return {
+            "reservations": self.reservations,
+            "rejections": self.rejections,
+            "pending_flush": pending,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "locks": self.locks.stats(),
+        }
+
+
+inventory = Inventory()
+subscribe(inventory.on_change)
@@ -0,0 +1,258 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from services.locking import FileLock, atomic_replace
+from services.metrics import registry, span
+
+JOBS_FILE = "jobs.journal"
+JOB_WORKERS = 2
+MAX_ATTEMPTS = 3
+# Seconds before the first retry; doubled for every further attempt
+RETRY_DELAY = 1.0
+# Finished jobs remembered (in memory and in the file) for status lookups
+KEEP_FINISHED = 1000
+# What the status file records of a job (never its arguments)
+STATUS_FIELDS = ("id", "task", "status", "attempts", "error", "result", "owner", "pid", "created", "updated")
+
+# Status of a job: queued -> running -> done | failed (or back to queued
+# with a delay while attempts remain)
+UNFINISHED = ("queued", "running")
+
+TASKS = {}
+
+
+def task(name, max_attempts=MAX_ATTEMPTS):
+    """Register ``fn`` as the task ``name``; its arguments must be JSON-serializable."""
+    def decorate(fn):
+        TASKS[name] = (fn, max_attempts)
+        return fn
+    return decorate
+
+
+class JobError(Exception):
+    """Raised by a task to fail its job without further attempts."""
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # exists, owned by someone else
+    return True
+
+
+class JobQueue:
+    """In-process job queue served by a small pool of worker threads.
+
+    Views hand slow work to ``enqueue`` and return at once; a failed attempt
+    is retried with exponential backoff up to the task's ``max_attempts``.
+    Jobs only live in memory: everything queued is derived work that is
+    redone after a restart. Every state change is also appended to the
+    status file ``path``, so any worker process can answer a status query
+    for a job another one runs. A ``key`` coalesces requests: while a job
+    with that key is still queued, enqueueing again returns the same job,
+    so with a ``delay`` a burst of changes is handled by a single run.
+    """
+
+    def __init__(self, path=JOBS_FILE, workers=JOB_WORKERS):
+        self._cond = threading.Condition()
+        self._heap = []            # (run at, sequence, job id)
+        self._sequence = itertools.count()
+        self._jobs = {}            # job id -> job (unfinished)
+        self._finished = OrderedDict()
+        self._keys = {}            # key -> queued job id
+        self._threads = []
+        self._records = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.configure(path, workers)
+
+    def configure(self, path=JOBS_FILE, workers=JOB_WORKERS):
+        self.path = path
+        self.workers = workers
+        self.lock = FileLock(path + ".lock")
+
+    # ---------- Status file ----------
+    def _persist(self, job):
+        record = {key: job[key] for key in STATUS_FIELDS}
+        line = (json.dumps(record, default=str) + "\n").encode("utf-8")
+        with self.lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        self._records += 1
+        if self._records > 4 * KEEP_FINISHED:
+            self.compact()
+
+    def _read(self):
+        """Latest state of every job in the file, in order of first appearance."""
+        jobs = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        job = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line
+                    jobs[job["id"]] = job
+        except FileNotFoundError:
+            pass
+        return jobs
+
+    def compact(self):
+        """Rewrite the file with the live unfinished jobs and the latest finished ones."""
+        with self.lock:
+            jobs = list(self._read().values())
+            finished = [job for job in jobs if job["status"] not in UNFINISHED][-KEEP_FINISHED:]
+            keep = [job for job in jobs if job["status"] in UNFINISHED and _alive(job["pid"])] + finished
+
+            def write(tmp):
+                with open(tmp, "w", encoding="utf-8") as f:
+                    for job in keep:
+                        f.write(json.dumps(job, default=str) + "\n")
+
+            atomic_replace(self.path, write)
+            self._records = len(keep)
+
+    # ---------- Scheduling ----------
+    def _schedule(self, job, run_at):
+        with self._cond:
+            self._jobs[job["id"]] = job
+            heapq.heappush(self._heap, (run_at, next(self._sequence), job["id"]))
+            self._cond.notify()
+        self._start()
+
+    def enqueue(self, name, *args, key=None, owner=None, delay=0):
+        """Queue task ``name`` with ``args`` to run in ``delay`` seconds; return the job id."""
+        if name not in TASKS:
+            raise KeyError(f"Unknown task: {name}")
+        with self._cond:
+            if key is not None and key in self._keys:
+                return self._keys[key]
+            now = time.time()
+            job = {
+                "id": uuid.uuid4().hex, "task": name, "args": list(args), "key": key,
+                "owner": owner, "pid": os.getpid(), "status": "queued",
+                "attempts": 0, "error": None, "result": None, "created": now, "updated": now,
+            }
+            if key is not None:
+                self._keys[key] = job["id"]
+        self._persist(job)
+        self._schedule(job, now + delay)
+        registry.inc("app_jobs_total", (("task", name), ("event", "queued")))
+        return job["id"]
+
+    def _next(self):
+        with self._cond:
+            while True:
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    job = self._jobs[heapq.heappop(self._heap)[2]]
+                    if self._keys.get(job["key"]) == job["id"]:
+                        del self._keys[job["key"]]
+                    job.update(status="running", attempts=job["attempts"] + 1, updated=now)
+                    return job
+                self._cond.wait(self._heap[0][0] - now if self._heap else None)
+
+    def _execute(self, job):
+        fn, max_attempts = TASKS[job["task"]]
+        try:
+            with span(f"job {job['task']}"):
+                result = fn(*job["args"])
+        except Exception as e:
+            job["error"] = f"{type(e).__name__}: {e}"
+            if isinstance(e, JobError) or job["attempts"] >= max_attempts:
+                self._finish(job, "failed")
+                return
+            delay = RETRY_DELAY * 2 ** (job["attempts"] - 1)
+            job.update(status="queued", updated=time.time())
+            self._persist(job)
+            self.retried += 1
+            registry.inc("app_jobs_total", (("task", job["task"]), ("event", "retried")))
+            self._schedule(job, time.time() + delay)
+            return
+        job.update(result=result, error=None)
+        self._finish(job, "done")
+
+    def _finish(self, job, status):
+        # The arguments are never needed again
+        job.update(status=status, args=[], updated=time.time())
+        self._persist(job)
+        with self._cond:
+            self._jobs.pop(job["id"], None)
+            self._finished[job["id"]] = job
+            while len(self._finished) > KEEP_FINISHED:
+                self._finished.popitem(last=False)
+            self._cond.notify_all()
+        if status == "done":
+            self.completed += 1
+        else:
+            self.failed += 1
+        registry.inc("app_jobs_total", (("task", job["task"]), ("event", status)))
+
+    def _run(self):
+        while True:
+            job = self._next()
+            self._persist(job)
+            self._execute(job)
+
+    def _start(self):
+        if len(self._threads) < self.workers:
+            with self._cond:
+                while len(self._threads) < self.workers:
+                    thread = threading.Thread(target=self._run, name=f"job-worker-{len(self._threads)}", daemon=True)
+                    self._threads.append(thread)
+                    thread.start()
+
+    # ---------- Status ----------
+    def status(self, job_id):
+        """Public view of a job (no arguments), or None if unknown."""
+        with self._cond:
+            job = self._jobs.get(job_id) or self._finished.get(job_id)
+        if job is None:
+            # Queued by another worker process
+            job = self._read().get(job_id)
+            if job is None:
+                return None
+            # Not ours any more (an earlier process with our pid) or its process is gone
+            if job["status"] in UNFINISHED and (job["pid"] == os.getpid() or not _alive(job["pid"])):
+                job = dict(job, status="failed", error="The worker process running it exited")
+        return {key: job[key] for key in STATUS_FIELDS if key != "pid"}
+
+    def wait(self, job_id, timeout=None):
+        """Block until the job has finished; return its status."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while job_id in self._jobs:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        return self.status(job_id)
+
+    def stats(self):
+        with self._cond:
+            queued = sum(1 for job in self._jobs.values() if job["status"] == "queued")
+            running = len(self._jobs) - queued
+        return {
+            "workers": self.workers,
+            "queued": queued,
+            "running": running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+jobs = JobQueue()
@@ -0,0 +1,384 @@
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+
+import pandas as pd
+
+from services.jobs import jobs, task
+from services.locking import FileLock, atomic_replace
+from services.metrics import count_bytes, span
+from services.schema import apply_dtypes
+from services.storage import Storage, _clean, last_change_versions
+
+JOURNAL_FILE = "sheets.journal"
+JOURNAL_SHEETS = ("orders", "users", "customers", "stock")
+
+# Open journals by path, for the compaction job
+_journals = weakref.WeakValueDictionary()
+
+
+class JournaledStorage(Storage):
+    """Wraps another backend and journals row changes for some sheets.
+
+    ``insert``/``update``/``delete`` on a journaled sheet append one fsync'd
+    JSON line to the journal and return straight away. Reads overlay the
+    pending records on the last snapshot of the sheet, and a coalesced
+    background job folds them into the wrapped backend in batches, at most
+    ``interval`` seconds after the first append. Every record is
+    idempotent (inserts are upserts by id), so replaying a journal that was
+    partly compacted before a crash gives the same result.
+
+    Several processes may share one journal: appends and truncation happen
+    under a lock file, and each process picks up the others' records by
+    tailing the file (or reloading it after another process compacted it).
+    """
+
+    def __init__(self, inner, path=JOURNAL_FILE, sheets=JOURNAL_SHEETS, batch_size=500, interval=2.0):
+        self.inner = inner
+        self.path = path
+        self.sheets = set(sheets)
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(path + ".lock")
+        self._compact_lock = FileLock(path + ".compact.lock")
+        self._closed = False
+        self._pending = []
+        self._last = {}  # sheet -> seq of its last pending record
+        self._offset = 0
+        self._first_line = b""
+        self.appended = 0
+        self.compactions = 0
+        self.last_compaction_ms = 0.0
+        with self._lock:
+            self._sync()
+        self.replayed = len(self._pending)
+        _journals[path] = self
+        if self._pending:
+            self._schedule()
+        atexit.register(self.close)
+
+    # ---------- Journal file ----------
+    def _sync(self):
+        """Bring ``_pending`` in line with the journal on disk.
+
+        On first use this replays the uncompacted tail left by a previous run.
+        Afterwards it reads records other processes appended, or reloads the
+        file when another process compacted (and so replaced) it. Compaction
+        starts every new file with a unique generation line, so comparing the
+        first line tells a replaced file apart from a grown one.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            self._pending, self._last, self._offset, self._first_line = [], {}, 0, b""
+            return
+        if size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            if self._offset and (size < self._offset or f.readline() != self._first_line):
+                self._pending, self._last, self._offset = [], {}, 0
+            f.seek(self._offset)
+            chunk = f.read()
+        # Only consume complete lines; a torn or in-progress write is left
+        # for the next sync.
+        end = chunk.rfind(b"\n") + 1
+        if self._offset == 0:
+            self._first_line = chunk[:chunk.find(b"\n") + 1]
+        for line in chunk[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "generation" not in record:
+                self._pending.append(record)
+                self._last[record["sheet"]] = record["seq"]
+        self._offset += end
+
+    def _version(self, sheet, inner):
+        """Version of journaled ``sheet`` given the wrapped backend's version.
+
+        Only the sheet's own pending records count, so appends to other
+        sheets leave it unchanged; a new file (after compaction) is a new
+        version while the sheet has records in it.
+        """
+        seq = self._last.get(sheet)
+        return (inner, None, None) if seq is None else (inner, self._first_line, seq)
+
+    def _last_seq(self):
+        return self._pending[-1]["seq"] if self._pending else 0
+
+    def _append(self, sheet, *records):
+        """Append ``records`` (all of ``sheet``) with one write and one fsync.
+
+        Returns the sheet's (before, after) versions around the append.
+        """
+        with self._lock, self._file_lock:
+            self._sync()
+            # Read once: the wrapped backend may change (a compaction) while
+            # we append, and then the next version() must differ from ``after``
+            inner = self.inner.version(sheet)
+            before = self._version(sheet, inner)
+            seq = self._last_seq()
+            lines = []
+            for record in records:
+                seq += 1
+                record["seq"] = seq
+                lines.append(json.dumps(record) + "\n")
+            data = "".join(lines).encode("utf-8")
+            with span("journal.append"), open(self.path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            count_bytes("written", "journal", len(data))
+            self._sync()
+            self.appended += len(records)
+            self._schedule()
+            return (before, self._version(sheet, inner))
+
+    def _truncate(self, upto_seq, sheets=None):
+        """Drop compacted records (seq <= upto_seq) from memory and from disk."""
+        with self._lock, self._file_lock:
+            self._sync()
+            keep = [
+                r for r in self._pending
+                if r["seq"] > upto_seq or (sheets is not None and r["sheet"] not in sheets)
+            ]
+
+            def write(tmp):
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write(json.dumps({"generation": uuid.uuid4().hex}) + "\n")
+                    for record in keep:
+                        f.write(json.dumps(record) + "\n")
+
+            atomic_replace(self.path, write)
+            self._sync()
+
+    def _last_seq_synced(self):
+        with self._lock:
+            self._sync()
+            return self._last_seq()
+
+    def _snapshot(self):
+        with self._lock:
+            self._sync()
+            return list(self._pending)
+
+    # ---------- Overlay ----------
+    def _changes(self, sheet, records):
+        """Collapse ``records`` into id -> ("row", values) / ("patch", values) / ("delete", None)."""
+        changes = {}
+        for r in records:
+            if r["sheet"] != sheet:
+                continue
+            id, op = r["id"], r["op"]
+            if op == "insert":
+                changes[id] = ("row", dict(r["values"]))
+            elif op == "update":
+                kind, values = changes.get(id, ("patch", {}))
+                if kind == "delete":
+                    continue
+                changes[id] = (kind, {**values, **r["values"]})
+            elif op == "delete":
+                changes[id] = ("delete", None)
+        return changes
+
+    def _overlay(self, df, changes):
+        if not changes:
+            return df
+        deleted = {id for id, (kind, _) in changes.items() if kind == "delete"}
+        rows = {id: values for id, (kind, values) in changes.items() if kind == "row"}
+        patches = {id: values for id, (kind, values) in changes.items() if kind == "patch"}
+        # Upserts replace any existing row with the same id
+        drop = deleted | set(rows)
+        if drop and "id" in df.columns:
+            df = df[~df["id"].isin(drop)]
+        for id, values in patches.items():
+            idx = df.index[df["id"] == id]
+            for col, value in values.items():
+                if col not in df.columns:
+                    df[col] = None
+                try:
+                    df.loc[idx, col] = value
+                except (TypeError, ValueError):
+                    df[col] = df[col].astype(object)
+                    df.loc[idx, col] = value
+        if rows:
+            new_rows = pd.DataFrame(list(rows.values()))
+            df = pd.concat([df, new_rows], ignore_index=True) if not df.empty else new_rows
+        return df.reset_index(drop=True)
+
+    # ---------- Storage API ----------
+    def read(self, sheet):
+        if sheet not in self.sheets:
+            return self.inner.read(sheet)
+        records = self._snapshot()
+        return apply_dtypes(sheet, self._overlay(self.inner.read(sheet), self._changes(sheet, records)))
+
+    def version(self, sheet):
+        if sheet not in self.sheets:
+            return self.inner.version(sheet)
+        with self._lock:
+            self._sync()
+            return self._version(sheet, self.inner.version(sheet))
+
+    def write(self, sheet, df):
+        if sheet not in self.sheets:
+            self.inner.write(sheet, df)
+        else:
+            # A whole-sheet write supersedes everything journaled for the sheet
+            with self._compact_lock:
+                upto = self._last_seq_synced()
+                self.inner.write(sheet, df)
+                self._truncate(upto, sheets={sheet})
+        self._emit(sheet, "write")
+
+    def get(self, sheet, id):
+        if sheet not in self.sheets:
+            return self.inner.get(sheet, id)
+        change = self._changes(sheet, self._snapshot()).get(id)
+        if change is None:
+            return self.inner.get(sheet, id)
+        kind, values = change
+        if kind == "delete":
+            return None
+        if kind == "row":
+            return dict(values)
+        row = self.inner.get(sheet, id)
+        return {**row, **values} if row is not None else None
+
+    def insert(self, sheet, row):
+        if sheet not in self.sheets:
+            id = self.inner.insert(sheet, row)
+            self._emit(sheet, "insert", id, {**row, "id": id}, last_change_versions())
+            return id
+        values = {k: _clean(v) for k, v in row.items()}
+        if values.get("id") is None:
+            values["id"] = self.allocate_ids(sheet)
+        versions = self._append(sheet, {"sheet": sheet, "op": "insert", "id": values["id"], "values": values})
+        self._emit(sheet, "insert", values["id"], values, versions)
+        return values["id"]
+
+    def insert_many(self, sheet, rows):
+        if sheet not in self.sheets:
+            ids = self.inner.insert_many(sheet, rows)
+        else:
+            if rows.empty:
+                return []
+            rows = rows.drop(columns=["id"], errors="ignore")
+            first = self.allocate_ids(sheet, len(rows))
+            ids = list(range(first, first + len(rows)))
+            records = []
+            for id, row in zip(ids, rows.to_dict(orient="records")):
+                values = {"id": id, **{k: _clean(v) for k, v in row.items()}}
+                records.append({"sheet": sheet, "op": "insert", "id": id, "values": values})
+            self._append(sheet, *records)
+        self._emit(sheet, "write")
+        return ids
+
+    def allocate_ids(self, sheet, count=1):
+        # Journaled ids come from the wrapped backend's sequence, which only
+        # moves forward, so they never collide with rows still in the journal.
+        return self.inner.allocate_ids(sheet, count)
+
+    def update(self, sheet, id, values):
+        if sheet not in self.sheets:
+            if not self.inner.update(sheet, id, values):
+                return False
+            versions = last_change_versions()
+        else:
+            if self.get(sheet, id) is None:
+                return False
+            values = {k: _clean(v) for k, v in values.items()}
+            versions = self._append(sheet, {"sheet": sheet, "op": "update", "id": id, "values": values})
+        if self.listeners:
+            self._emit(sheet, "update", id, self.get(sheet, id), versions)
+        return True
+
+    def update_many(self, sheet, updates):
+        if sheet not in self.sheets:
+            rows = self.inner.update_many(sheet, updates)
+            versions = last_change_versions() if rows else None
+        else:
+            changes = self._changes(sheet, self._snapshot())
+            existing = set(self.inner.read(sheet)["id"])
+            records = []
+            for id, values in updates.items():
+                kind = changes.get(id, (None,))[0]
+                if kind == "delete" or (kind is None and id not in existing):
+                    continue
+                values = {k: _clean(v) for k, v in values.items()}
+                records.append({"sheet": sheet, "op": "update", "id": id, "values": values})
+            versions = self._append(sheet, *records) if records else None
+            rows = {r["id"]: self.get(sheet, r["id"]) for r in records}
+        self._emit_rows(sheet, "update", rows, versions)
+        return rows
+
+    def delete(self, sheet, id):
+        if sheet not in self.sheets:
+            if not self.inner.delete(sheet, id):
+                return False
+            versions = last_change_versions()
+        else:
+            if self.get(sheet, id) is None:
+                return False
+            versions = self._append(sheet, {"sheet": sheet, "op": "delete", "id": id, "values": {}})
+        self._emit(sheet, "delete", id, versions=versions)
+        return True
+
+    # ---------- Compaction ----------
+    def compact(self):
+        """Fold every pending record into the wrapped backend."""
+        with self._compact_lock:
+            records = self._snapshot()
+            if not records:
+                return 0
+            started = time.perf_counter()
+            upto = records[-1]["seq"]
+            for sheet in sorted({r["sheet"] for r in records}):
+                df = self._overlay(self.inner.read(sheet), self._changes(sheet, records))
+                self.inner.write(sheet, df)
+            self._truncate(upto)
+            self.compactions += 1
+            self.last_compaction_ms = (time.perf_counter() - started) * 1000
+            return len(records)
+
+    def _schedule(self):
+        """Queue a compaction ``interval`` seconds out, or at once past ``batch_size`` records."""
+        if self._closed:
+            return
+        # Separate keys: a full batch must not wait behind the delayed run
+        if len(self._pending) >= self.batch_size:
+            jobs.enqueue("journal.compact", self.path, key=f"journal:{self.path}:full")
+        else:
+            jobs.enqueue("journal.compact", self.path, key=f"journal:{self.path}", delay=self.interval)
+
+    def close(self):
+        """Fold whatever is still pending (at exit)."""
+        if self._closed:
+            return
+        self._closed = True
+        self.compact()
+
+    def stats(self):
+        with self._lock:
+            journal = {
+                "pending": len(self._pending),
+                "lock": self._file_lock.stats(),
+                "appended": self.appended,
+                "replayed": self.replayed,
+                "compactions": self.compactions,
+                "last_compaction_ms": round(self.last_compaction_ms, 2),
+            }
+        return dict(self.inner.stats(), journal=journal)
+
+
+@task("journal.compact")
+def compact_journal(path):
+    """Job: fold the journal at ``path`` into its backend (records stay on failure)."""
+    journal = _journals.get(path)
+    return journal.compact() if journal is not None else 0
@@ -0,0 +1,246 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Cross-process exclusive lock on ``path`` (re-entrant within a process).
+
+    Gunicorn workers serialize their read-modify-write cycles through it.
+    Time spent waiting for the lock is recorded so contention is visible.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._stats_lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _lock_file(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.01)
+
+    def _unlock_file(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def acquire(self):
+        started = time.perf_counter()
+        self._local.acquire()
+        if self._depth == 0:
+            try:
+                self._lock_file()
+            except BaseException:
+                self._local.release()
+                raise
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.acquisitions += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                if waited > 0.001:
+                    self.contended += 1
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            self._unlock_file()
+        self._local.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "acquisitions": self.acquisitions,
+                "contended": self.contended,
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "wait_avg_ms": round(self.wait_total * 1000 / self.acquisitions, 3)
+                if self.acquisitions else 0.0,
+            }
+
+
+class StripedLock:
+    """``stripes`` independent cross-process locks for integer keys.
+
+    Key ``k`` maps to stripe ``k % stripes``. A stripe is a thread lock plus
+    a record lock on byte ``stripe`` of ``path``, so callers working on keys
+    in different stripes never wait for each other, in this process or any
+    other. Stripes are not re-entrant; never hold two at once.
+    """
+
+    def __init__(self, path, stripes=64):
+        self.path = path
+        self.stripes = stripes
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._fd = None
+        self._fd_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _file(self):
+        if self._fd is None:
+            with self._fd_lock:
+                if self._fd is None:
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        return self._fd
+
+    def _lock_range(self, stripe):
+        fd = self._file()
+        if fcntl is not None:
+            fcntl.lockf(fd, fcntl.LOCK_EX, 1, stripe)
+            return
+        # msvcrt locks from the current position, which all stripes share
+        while True:
+            with self._fd_lock:
+                os.lseek(fd, stripe, os.SEEK_SET)
+                try:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                    return
+                except OSError:
+                    pass
+            time.sleep(0.001)
+
+    def _unlock_range(self, stripe):
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+        else:
+            with self._fd_lock:
+                os.lseek(self._fd, stripe, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    def stripe(self, key):
+        return int(key) % self.stripes
+
+    @contextmanager
+    def hold(self, key):
+        stripe = self.stripe(key)
+        started = time.perf_counter()
+        with self._locks[stripe]:
+            self._lock_range(stripe)
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.acquisitions += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+                if waited > 0.001:
+                    self.contended += 1
+            try:
+                yield stripe
+            finally:
+                self._unlock_range(stripe)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "stripes": self.stripes,
+                "acquisitions": self.acquisitions,
+                "contended": self.contended,
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+def stage_file(path, write):
+    """Call ``write(tmp_path)`` on a new file next to ``path`` and fsync it.
+
+    Returns the temporary path, ready to be renamed onto ``path``.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    suffix = os.path.splitext(path)[1]
+    fd, tmp = tempfile.mkstemp(prefix=".tmp-", suffix=suffix, dir=directory)
+    os.close(fd)
+    try:
+        write(tmp)
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return tmp
+
+
+def atomic_replace(path, write):
+    """Call ``write(tmp_path)`` and atomically rename the result onto ``path``.
+
+    The temporary file lives in the same directory so ``os.replace`` never
+    crosses filesystems; readers see either the old file or the new one.
+    """
+    tmp = stage_file(path, write)
+    try:
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class IdSequence:
+    """Per-sheet high-water marks persisted next to the data file.
+
+    Callers must hold the matching FileLock. Ids only move forward, so an
+    id freed by deleting the newest row is never handed out again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def allocate(self, sheet, current_max, count=1):
+        """Reserve ``count`` consecutive ids above both the sheet and the mark."""
+        marks = self._load()
+        first = max(int(marks.get(sheet, 0)), int(current_max)) + 1
+        marks[sheet] = first + count - 1
+
+        def write(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(marks, f)
+
+        atomic_replace(self.path, write)
+        return first
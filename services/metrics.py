@@ -0,0 +1,288 @@
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import Response, before_render_template, g, has_request_context, request, template_rendered
+
+# Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "app_requests_total": ("counter", "Requests served, by endpoint and status."),
+    "app_request_duration_seconds": ("histogram", "Wall time of each request."),
+    "app_span_duration_seconds": ("histogram", "Time spent in a named phase of a request."),
+    "app_rows_read_total": ("counter", "Rows read from a sheet."),
+    "app_rows_written_total": ("counter", "Rows written to a sheet."),
+    "app_bytes_read_total": ("counter", "Bytes read from data files."),
+    "app_bytes_written_total": ("counter", "Bytes written to data files."),
+    "app_profiles_written_total": ("counter", "Slow-request profiles dumped."),
+}
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Registry:
+    """Process-wide counters and histograms keyed by (metric, labels)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            key = (name, labels)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            key = (name, labels)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            snapshot = [(key, list(h.buckets), h.sum, h.count) for key, h in histograms]
+        seen = set()
+
+        def header(name):
+            if name not in seen:
+                seen.add(name)
+                kind, text = HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), buckets, total, count in snapshot:
+            header(name)
+            cumulative = 0
+            for bound, hits in zip(BUCKETS, buckets):
+                cumulative += hits
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+# ---------- Spans ----------
+def _labels():
+    if has_request_context():
+        return (("blueprint", request.blueprint or "app"), ("endpoint", request.endpoint or "unknown"))
+    return (("blueprint", "-"), ("endpoint", "background"))
+
+
+def _record(name, elapsed):
+    registry.observe("app_span_duration_seconds", _labels() + (("span", name),), elapsed)
+    if has_request_context():
+        timings = g.setdefault("_metrics_timings", {})
+        timings[name] = timings.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as phase ``name`` of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """Decorator form of ``span``."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count_rows(direction, sheet, rows):
+    registry.inc(f"app_rows_{direction}_total", _labels() + (("sheet", sheet),), rows)
+
+
+def count_bytes(direction, source, size):
+    registry.inc(f"app_bytes_{direction}_total", _labels() + (("source", source),), size)
+
+
+# ---------- Sampling profiler ----------
+class SamplingProfiler:
+    """Samples the stacks of in-flight requests and dumps the slow ones.
+
+    A single background thread walks ``sys._current_frames()`` every
+    ``interval`` seconds for the threads currently serving a request. When a
+    request took at least ``threshold_ms`` its samples are written to
+    ``directory`` as collapsed stacks ("frame;frame;frame count" per line),
+    which flamegraph.pl and speedscope read directly.
+    """
+
+    def __init__(self, threshold_ms, directory="profiles", interval=0.005):
+        self.threshold_ms = threshold_ms
+        self.directory = directory
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active = {}  # thread id -> Counter of stacks
+        self._thread = None
+        self.dumped = 0
+
+    @staticmethod
+    def _stack(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            stacks = {
+                ident: self._stack(frames[ident])
+                for ident in active if ident != me and ident in frames
+            }
+            with self._lock:
+                for ident, stack in stacks.items():
+                    samples = self._active.get(ident)
+                    if samples is not None:
+                        samples[stack] += 1
+
+    def begin(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+
+    def end(self, elapsed_ms, endpoint):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if not samples or elapsed_ms < self.threshold_ms:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{int(time.time() * 1000)}-{endpoint}-{int(elapsed_ms)}ms.folded"
+        path = os.path.join(self.directory, name)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.dumped += 1
+        registry.inc("app_profiles_written_total", (("endpoint", endpoint),))
+        return path
+
+
+# ---------- Flask integration ----------
+def _render_started(sender, template, context, **extra):
+    g.setdefault("_metrics_renders", []).append(time.perf_counter())
+
+
+def _render_finished(sender, template, context, **extra):
+    starts = g.get("_metrics_renders")
+    if starts:
+        _record(f"render {template.name}", time.perf_counter() - starts.pop())
+
+
+def init_app(app):
+    """Time every request of ``app`` and serve the figures at /metrics.
+
+    ``METRICS_TOKEN`` (optional) must then be sent as a bearer token.
+    ``PROFILE_THRESHOLD_MS`` turns the sampling profiler on; stacks of slower
+    requests go to ``PROFILE_DIR``.
+    """
+    threshold = app.config.get("PROFILE_THRESHOLD_MS")
+    profiler = None
+    if threshold not in (None, ""):
+        profiler = SamplingProfiler(
+            float(threshold),
+            app.config.get("PROFILE_DIR", "profiles"),
+            float(app.config.get("PROFILE_INTERVAL_MS", 5)) / 1000,
+        )
+    app.extensions["metrics"] = {"registry": registry, "profiler": profiler}
+
+    @app.before_request
+    def _start_request():
+        g._metrics_started = time.perf_counter()
+        if profiler is not None:
+            profiler.begin()
+
+    @app.after_request
+    def _server_timing(response):
+        timings = g.get("_metrics_timings", {})
+        total = time.perf_counter() - g.get("_metrics_started", time.perf_counter())
+        entries = [
+            f'span{i};desc="{name}";dur={seconds * 1000:.2f}'
+            for i, (name, seconds) in enumerate(timings.items())
+        ]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+        g._metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        started = g.pop("_metrics_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        labels = _labels()
+        status = g.pop("_metrics_status", 500)
+        registry.inc("app_requests_total", labels + (("status", status),))
+        registry.observe("app_request_duration_seconds", labels, elapsed)
+        if profiler is not None:
+            profiler.end(elapsed * 1000, request.endpoint or "unknown")
+
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+
+    @app.route("/metrics")
+    def metrics():
+        token = app.config.get("METRICS_TOKEN")
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            return "Unauthorized", 403
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
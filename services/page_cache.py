@@ -0,0 +1,161 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import make_response, request, session
+
+from services.metrics import span
+from services.storage import get_storage, subscribe
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+# Sent with every cached page: browsers may keep it but must revalidate
+# (cheaply, via If-None-Match) before reusing it.
+CACHE_CONTROL = "private, no-cache"
+
+
+class CachedPage:
+    __slots__ = ("body", "mimetype", "etag", "sheets")
+
+    def __init__(self, body, mimetype, sheets):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.sheets = sheets
+
+
+class PageCache:
+    """Rendered pages keyed by endpoint, visitor kind, query string and data version.
+
+    Because the key holds ``storage.version`` of every sheet the page reads,
+    a write from any process makes the old entries unreachable; writes seen
+    in this process also drop them at once so they stop taking up memory.
+    Entries are evicted least recently used first once their bodies add up
+    to more than ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> CachedPage
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def configure(self, max_bytes=DEFAULT_MAX_BYTES):
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._entries:
+            _, page = self._entries.popitem(last=False)
+            self.size -= len(page.body)
+            self.evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key, page):
+        if len(page.body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self._entries[key] = page
+            self.size += len(page.body)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def on_change(self, sheet, op, id, row):
+        """Storage listener: drop every page built from ``sheet``."""
+        with self._lock:
+            stale = [key for key, page in self._entries.items() if sheet in page.sheets]
+            for key in stale:
+                self.size -= len(self._entries.pop(key).body)
+            self.invalidations += len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+page_cache = PageCache()
+subscribe(page_cache.on_change)
+
+
+def _visitor():
+    # The pages only differ by whether someone is logged in and their role
+    return session.get("role") if session.get("user_id") else None
+
+
+def _respond(page):
+    response = make_response(page.body)
+    response.mimetype = page.mimetype
+    response.set_etag(page.etag)
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    response.vary.add("Cookie")
+    response = response.make_conditional(request)
+    if response.status_code == 304:
+        page_cache.not_modified += 1
+    return response
+
+
+def cached_page(*sheets, versions=()):
+    """Serve a GET view from ``page_cache`` while ``sheets`` are unchanged.
+
+    ``versions`` are callables returning a token for any other data the
+    page shows; a new token renders the page again.
+
+    Responses carry a strong ETag (a hash of the body) and are answered with
+    304 Not Modified when the client already holds that version.
+    """
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            storage = get_storage()
+            # Read the versions before rendering: a write racing the render
+            # then leaves an entry under the old key, never a stale hit.
+            key = (
+                request.endpoint,
+                tuple(sorted((request.view_args or {}).items())),
+                tuple(sorted(request.args.items(multi=True))),
+                _visitor(),
+                tuple(storage.version(sheet) for sheet in sheets),
+                tuple(version() for version in versions),
+            )
+            page = page_cache.get(key)
+            if page is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                with span("page_cache.store"):
+                    page = CachedPage(response.get_data(), response.mimetype, sheets)
+                    page_cache.put(key, page)
+            return _respond(page)
+        return wrapper
+    return decorate
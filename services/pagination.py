@@ -0,0 +1,105 @@
+from flask import request, url_for
+
+from services.metrics import span
+from services.schema import records
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Rows converted to dicts at a time when streaming an export
+STREAM_CHUNK = 1000
+
+
+def page_args(prefix="", default_size=DEFAULT_PAGE_SIZE):
+    """Read ``page``/``page_size``/``after`` (optionally prefixed) from the query string.
+
+    ``after`` is a cursor: the last ``id`` seen on the previous page.
+    """
+    page = max(request.args.get(prefix + "page", 1, type=int), 1)
+    page_size = request.args.get(prefix + "page_size", default_size, type=int)
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+    after = request.args.get(prefix + "after", None, type=int)
+    return page, page_size, after
+
+
+def _page_url(prefix, anchor, **changes):
+    """URL of the current view with some (prefixed) query arguments changed."""
+    args = request.args.to_dict()
+    for key, value in changes.items():
+        if value is None:
+            args.pop(prefix + key, None)
+        else:
+            args[prefix + key] = value
+    return url_for(request.endpoint, _anchor=anchor, **(request.view_args or {}), **args)
+
+
+def make_pagination(total, page, page_size, after=None, next_cursor=None, prefix="", anchor=None):
+    """Everything ``pagination.html`` needs to render the page links."""
+    pages = max((total + page_size - 1) // page_size, 1)
+    pagination = {
+        "page": page,
+        "page_size": page_size,
+        "total": total,
+        "pages": pages,
+        "after": after,
+        "next_cursor": next_cursor,
+        "prev_url": None,
+        "next_url": None,
+        "first_url": None,
+    }
+    if after is not None:
+        pagination["first_url"] = _page_url(prefix, anchor, after=None, page=None)
+        if next_cursor is not None:
+            pagination["next_url"] = _page_url(prefix, anchor, after=next_cursor)
+    else:
+        if page > 1:
+            pagination["prev_url"] = _page_url(prefix, anchor, page=page - 1)
+        if page < pages:
+            pagination["next_url"] = _page_url(prefix, anchor, page=page + 1)
+    return pagination
+
+
+def paginate(df, page=1, page_size=DEFAULT_PAGE_SIZE, after=None, prefix="", anchor=None, key="id"):
+    """Slice one page out of ``df`` and return it as lazy records (``services.schema``).
+
+    ``df`` may also be a list of records (e.g. from ``services.indexes``).
+    With a cursor (``after``) the page holds the rows whose ``key`` is
+    greater than it, in key order, and ``page`` is ignored.
+    """
+    if isinstance(df, list):
+        return _paginate_records(df, page, page_size, after, prefix, anchor, key)
+    with span("paginate"):
+        return _paginate_frame(df, page, page_size, after, prefix, anchor, key)
+
+
+def _paginate_frame(df, page, page_size, after, prefix, anchor, key):
+    total = len(df)
+    next_cursor = None
+    if after is not None:
+        df = df[df[key] > after].sort_values(key, kind="stable")
+        rows = df.iloc[:page_size]
+        if len(df) > page_size:
+            next_cursor = int(rows[key].iloc[-1])
+    else:
+        start = (page - 1) * page_size
+        rows = df.iloc[start:start + page_size]
+    pagination = make_pagination(total, page, page_size, after, next_cursor, prefix, anchor)
+    return records(rows), pagination
+
+
+def _paginate_records(records, page, page_size, after, prefix, anchor, key):
+    total = len(records)
+    next_cursor = None
+    if after is not None:
+        records = sorted((r for r in records if r[key] > after), key=lambda r: r[key])
+        rows = records[:page_size]
+        if len(records) > page_size:
+            next_cursor = int(rows[-1][key])
+    else:
+        start = (page - 1) * page_size
+        rows = records[start:start + page_size]
+    return rows, make_pagination(total, page, page_size, after, next_cursor, prefix, anchor)
+
+
+def iter_records(df, chunk=STREAM_CHUNK):
+    """Yield the rows of ``df`` as records, converting ``chunk`` rows at a time."""
+    return iter(records(df, chunk))
@@ -0,0 +1,130 @@
+import threading
+
+import pandas as pd
+
+from services.dashboard import dashboard_metrics
+from services.jobs import jobs, task
+from services.metrics import span
+from services.storage import get_storage, subscribe
+
+ORDERS_SHEET = "orders"
+PRODUCTS_SHEET = "products"
+USERS_SHEET = "users"
+
+REPORTS = ("products", "categories", "sellers", "customers")
+DEFAULT_TOP = 10
+
+FIGURES = {"quantity": "sum", "revenue": "sum", "profit": "sum", "orders": "sum"}
+
+
+def _ids(series):
+    return pd.to_numeric(series, errors="coerce").astype("Int64")
+
+
+class SalesReports:
+    """Revenue by product, category and seller, and customer lifetime value.
+
+    Orders are never rescanned here: the per-product and per-customer
+    rollups kept current by ``dashboard_metrics`` are joined with the
+    product and user sheets, and everything coarser is a group-by over that
+    product-level frame (one row per product, not per order). The finished
+    reports are cached until the orders, products or users sheet, or the
+    margin, changes; a change to those sheets queues a background rebuild,
+    so the next request usually finds them ready.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._reports = {}
+        self.builds = 0
+        self.hits = 0
+
+    def _current_key(self):
+        storage = get_storage()
+        versions = tuple(storage.version(sheet) for sheet in (ORDERS_SHEET, PRODUCTS_SHEET, USERS_SHEET))
+        return versions + (dashboard_metrics.margin,)
+
+    def _build(self):
+        storage = get_storage()
+        margin = dashboard_metrics.margin
+        sales, customers = dashboard_metrics.rollups()
+
+        users = storage.read(USERS_SHEET)
+        users = users[users["id"].notna() & ~users["id"].duplicated()]
+        names = pd.Series(users["username"].to_numpy(), index=_ids(users["id"]))
+
+        products = storage.read(PRODUCTS_SHEET)
+        products = products[products["id"].notna() & ~products["id"].duplicated()]
+        by_product = pd.DataFrame({
+            "product_id": _ids(products["id"]).to_numpy(),
+            "name": products["name"].to_numpy(),
+            "category": products["category"].astype(object).fillna("Uncategorized").to_numpy(),
+            "seller_id": _ids(products["seller_id"]).to_numpy(),
+            "price": pd.to_numeric(products["price"], errors="coerce").to_numpy(),
+        })
+        # Orders for products that no longer exist carry no price, hence no
+        # revenue, so joining from the product side loses nothing.
+        by_product = by_product.join(sales, on="product_id")
+        by_product[["quantity", "revenue", "orders"]] = by_product[["quantity", "revenue", "orders"]].fillna(0)
+        by_product["orders"] = by_product["orders"].astype("int64")
+        by_product["profit"] = by_product["revenue"] * margin
+        by_product = by_product.sort_values(["revenue", "product_id"], ascending=[False, True], ignore_index=True)
+
+        def grouped(column):
+            report = by_product.groupby(column, dropna=False).agg(
+                products=("product_id", "count"), **{name: (name, how) for name, how in FIGURES.items()}
+            )
+            return report.sort_values("revenue", ascending=False).reset_index()
+
+        by_category = grouped("category")
+        by_seller = grouped("seller_id")
+        by_seller.insert(1, "seller", by_seller["seller_id"].map(names))
+
+        ltv = customers.rename_axis("customer_id").reset_index()
+        ltv["customer_id"] = _ids(ltv["customer_id"])
+        ltv.insert(1, "customer", ltv["customer_id"].map(names))
+        ltv["orders"] = ltv["orders"].astype("int64")
+        ltv["profit"] = ltv["revenue"] * margin
+        ltv["average_order"] = (ltv["revenue"] / ltv["orders"].where(ltv["orders"] > 0)).fillna(0.0)
+        ltv = ltv.sort_values(["revenue", "customer_id"], ascending=[False, True], ignore_index=True)
+
+        return {"products": by_product, "categories": by_category, "sellers": by_seller, "customers": ltv}
+
+    def report(self, name, top=None):
+        """Report ``name`` (one of ``REPORTS``) as a DataFrame, best first."""
+        key = self._current_key()
+        with self._lock:
+            if key != self._key:
+                with span("reports.build"):
+                    self._reports = self._build()
+                self._key = key
+                self.builds += 1
+            else:
+                self.hits += 1
+            df = self._reports[name]
+        return df.head(top) if top else df
+
+    def records(self, name, top=None):
+        df = self.report(name, top).round(2).astype(object)
+        return df.where(df.notna(), None).to_dict(orient="records")
+
+    def on_change(self, sheet, op, id, row):
+        """Storage listener: recompute the reports off the request thread."""
+        if sheet in (ORDERS_SHEET, PRODUCTS_SHEET, USERS_SHEET):
+            jobs.enqueue("reports.refresh", key="reports.refresh")
+
+    def stats(self):
+        with self._lock:
+            return {"builds": self.builds, "hits": self.hits}
+
+
+sales_reports = SalesReports()
+subscribe(sales_reports.on_change)
+
+
+@task("reports.refresh")
+def refresh_reports():
+    """Job: bring the cached reports up to date."""
+    sales_reports.report(REPORTS[0])
+    return sales_reports.stats()
@@ -0,0 +1,205 @@
+import keyword
+from collections import namedtuple
+from collections.abc import Sequence
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# In-memory dtype of every declared column. IDs and counts are int32 (a
+# column with gaps stays float64 so missing values keep their NaN), prices
+# and ratings float64, low-cardinality labels categorical and free text
+# pandas strings. Columns a sheet does not declare keep whatever was read.
+DTYPES = {
+    "users": {
+        "id": "int32", "username": "str", "password": "str", "role": "category",
+    },
+    "customers": {
+        "id": "int32", "name": "str", "email": "str", "phone": "str",
+        "address": "str", "role": "category",
+    },
+    "products": {
+        "id": "int32", "name": "str", "price": "float64", "stock": "int32",
+        "category": "category", "details": "str", "rating": "float64",
+        "image_url": "str", "seller_id": "int32", "role": "category",
+    },
+    "orders": {
+        "id": "int32", "customerid": "int32", "productid": "int32",
+        "quantity": "int32",
+    },
+    "stock": {
+        "id": "int32", "stock": "int32",
+    },
+}
+
+# Rows converted to records at a time when iterating lazily
+RECORD_CHUNK = 1000
+
+_INT32 = np.iinfo(np.int32)
+
+
+# ---------- Dtypes ----------
+def _numbers(column):
+    """``column`` as numbers, or None if that would lose any value."""
+    numbers = pd.to_numeric(column, errors="coerce")
+    if numbers.isna().sum() != column.isna().sum():
+        return None
+    return numbers
+
+
+def _as_int32(column):
+    numbers = _numbers(column)
+    if numbers is None:
+        return column
+    if numbers.isna().any() or not numbers.between(_INT32.min, _INT32.max).all() or (numbers % 1 != 0).any():
+        return numbers
+    return numbers.astype("int32")
+
+
+def _as_float64(column):
+    numbers = _numbers(column)
+    return column if numbers is None else numbers.astype("float64")
+
+
+def _as_category(column):
+    return column.astype("category")
+
+
+def _as_str(column):
+    if column.dtype == object and pd.api.types.infer_dtype(column, skipna=True) not in ("string", "empty"):
+        return column  # mixed values: leave them as they are
+    if pd.api.types.is_float_dtype(column.dtype):
+        present = column.dropna()
+        if (present % 1 == 0).all():
+            column = column.astype("Int64")  # 9876543210.0 -> "9876543210"
+    return column.astype("str").where(column.notna())
+
+
+CONVERTERS = {"int32": _as_int32, "float64": _as_float64, "category": _as_category, "str": _as_str}
+
+
+def matches_dtype(column, dtype):
+    if dtype == "category":
+        return isinstance(column.dtype, pd.CategoricalDtype)
+    if dtype == "str":
+        return pd.api.types.is_string_dtype(column.dtype) and column.dtype != object
+    return column.dtype == dtype
+
+
+def apply_dtypes(sheet, df):
+    """``df`` with ``sheet``'s declared columns converted to their dtypes.
+
+    Conversions never lose data: a column that does not fit its dtype (text
+    in an id column, say) is left as it was.
+    """
+    dtypes = DTYPES.get(sheet)
+    if not dtypes or df.columns.has_duplicates:
+        return df
+    pending = [(column, dtype) for column, dtype in dtypes.items()
+               if column in df.columns and not matches_dtype(df[column], dtype)]
+    if not pending:
+        return df
+    df = df.copy(deep=False)
+    for column, dtype in pending:
+        df[column] = CONVERTERS[dtype](df[column])
+    return df
+
+
+# ---------- Records ----------
+class Record:
+    """Mapping-style access on top of a namedtuple row.
+
+    Row types are namedtuples (``__slots__ = ()``): the values sit in one
+    tuple, with no per-row ``__dict__`` and shared field names, so a row
+    costs a fraction of a dict. Templates read them as ``row.name``,
+    ``row["name"]``, ``row.values()`` or ``row.items()``, just like dicts.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self._fields else default
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def to_dict(self):
+        return dict(zip(self._fields, self))
+
+
+_RESERVED = set(dir(Record)) | set(dir(tuple))
+
+
+@lru_cache(maxsize=64)
+def record_type(columns):
+    """Record class for a tuple of column names, or None if they cannot be fields."""
+    for column in columns:
+        if (not isinstance(column, str) or not column.isidentifier() or keyword.iskeyword(column)
+                or column.startswith("_") or column in _RESERVED):
+            return None
+    if len(set(columns)) != len(columns):
+        return None
+    return type("Record", (Record, namedtuple("Row", columns)), {"__slots__": ()})
+
+
+class Records(Sequence):
+    """The rows of a DataFrame as records, converted only when read.
+
+    Iterating converts ``chunk`` rows at a time, so rendering a large
+    catalog never holds more than one chunk of Python objects on top of
+    the frame itself. Values are plain Python scalars, as with
+    ``DataFrame.to_dict(orient="records")``; frames whose column names
+    cannot be record fields fall back to dicts.
+    """
+
+    def __init__(self, df, chunk=RECORD_CHUNK):
+        self.df = df
+        self.chunk = chunk
+        self.columns = tuple(df.columns)
+        self.type = record_type(self.columns)
+
+    def __len__(self):
+        return len(self.df)
+
+    def _convert(self, rows):
+        values = zip(*(rows.iloc[:, position].tolist() for position in range(rows.shape[1])))
+        if self.type is not None:
+            return map(self.type._make, values)
+        return (dict(zip(self.columns, row)) for row in values)
+
+    def __iter__(self):
+        for start in range(0, len(self.df), self.chunk):
+            yield from self._convert(self.df.iloc[start:start + self.chunk])
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return Records(self.df.iloc[position], self.chunk)
+        if position < 0:
+            position += len(self.df)
+        if not 0 <= position < len(self.df):
+            raise IndexError(position)
+        return next(iter(self._convert(self.df.iloc[position:position + 1])))
+
+    def to_list(self):
+        return list(self)
+
+
+def records(df, chunk=RECORD_CHUNK):
+    return Records(df, chunk)
@@ -0,0 +1,227 @@
+import bisect
+import re
+import threading
+
+import numpy as np
+
+from services.metrics import timed
+from services.schema import records
+from services.storage import _clean, advance_version, get_storage, subscribe
+
+PRODUCTS_SHEET = "products"
+
+# Weight of a token depending on the field it came from
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "details": 1.0}
+# A query token that only matches as a prefix scores this fraction
+PREFIX_FACTOR = 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    if text is None:
+        return []
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def _number(value, default=0.0):
+    value = _clean(value)
+    try:
+        return float(value) if value is not None else default
+    except (TypeError, ValueError):
+        return default
+
+
+class ProductSearchIndex:
+    """Inverted index over product name, category and details.
+
+    Postings are kept per token and updated row by row from storage change
+    events; a whole-sheet write (or a change made by another process, seen
+    through ``storage.version``) triggers a full rebuild on the next search.
+    Category and price filters use a per-category id set and price/rating
+    sorted numpy arrays, rebuilt lazily after changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rows = {}        # id -> product dict
+        self._tokens = {}      # id -> {token: weight}
+        self._postings = {}    # token -> {id: weight}
+        self._vocab = []       # sorted tokens, for prefix lookups
+        self._categories = {}  # lowercase category -> set(ids)
+        self._columns = None   # lazily built numpy arrays, see _arrays()
+        self._version = None
+        self.rebuilds = 0
+        self.incremental_updates = 0
+
+    # ---------- Maintenance ----------
+    def _doc_tokens(self, row):
+        weights = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(row.get(field)):
+                weights[token] = max(weights.get(token, 0.0), weight)
+        return weights
+
+    def _add(self, id, row):
+        self._rows[id] = row
+        tokens = self._doc_tokens(row)
+        self._tokens[id] = tokens
+        for token, weight in tokens.items():
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                bisect.insort(self._vocab, token)
+            posting[id] = weight
+        category = str(_clean(row.get("category")) or "").strip().lower()
+        self._categories.setdefault(category, set()).add(id)
+
+    def _remove(self, id):
+        row = self._rows.pop(id, None)
+        if row is None:
+            return
+        for token in self._tokens.pop(id, {}):
+            posting = self._postings.get(token)
+            posting.pop(id, None)
+            if not posting:
+                del self._postings[token]
+                del self._vocab[bisect.bisect_left(self._vocab, token)]
+        category = str(_clean(row.get("category")) or "").strip().lower()
+        ids = self._categories.get(category)
+        if ids is not None:
+            ids.discard(id)
+            if not ids:
+                del self._categories[category]
+
+    @timed("search.rebuild")
+    def rebuild(self, storage=None):
+        storage = storage or get_storage()
+        with self._lock:
+            version = storage.version(PRODUCTS_SHEET)
+            df = storage.read(PRODUCTS_SHEET)
+            self._rows, self._tokens, self._postings = {}, {}, {}
+            self._vocab, self._categories = [], {}
+            for row in records(df):
+                id = _clean(row.get("id"))
+                if id is not None:
+                    self._add(int(id), row)
+            self._columns = None
+            self._version = version
+            self.rebuilds += 1
+
+    def on_change(self, sheet, op, id, row):
+        """Storage listener: apply one product change to the index."""
+        if sheet != PRODUCTS_SHEET:
+            return
+        with self._lock:
+            version = advance_version(self._version)
+            if op == "write" or version is None:
+                # Also when another worker changed products before this
+                # change: rebuild lazily on the next search
+                self._version = None
+                return
+            id = int(id)
+            self._remove(id)
+            if op != "delete" and row is not None:
+                self._add(id, dict(row))
+            self._columns = None
+            self._version = version
+            self.incremental_updates += 1
+
+    def ensure_current(self, storage=None):
+        storage = storage or get_storage()
+        with self._lock:
+            if self._version is None or self._version != storage.version(PRODUCTS_SHEET):
+                self.rebuild(storage)
+
+    def _arrays(self):
+        """Columnar view of the catalog: ids sorted by price and by rating."""
+        if self._columns is None:
+            ids = np.fromiter(self._rows.keys(), dtype=np.int64, count=len(self._rows))
+            prices = np.array([_number(r.get("price")) for r in self._rows.values()], dtype=np.float64)
+            ratings = np.array([_number(r.get("rating")) for r in self._rows.values()], dtype=np.float64)
+            by_price = np.argsort(prices, kind="stable")
+            by_rating = np.lexsort((ids, -ratings))
+            self._columns = {
+                "price_ids": ids[by_price],
+                "prices": prices[by_price],
+                "rating_ids": ids[by_rating],
+            }
+        return self._columns
+
+    # ---------- Queries ----------
+    def _match(self, token):
+        """Return {id: score} for docs containing ``token`` exactly or as a prefix."""
+        scores = {}
+        vocab = self._vocab
+        for i in range(bisect.bisect_left(vocab, token), len(vocab)):
+            vocab_token = vocab[i]
+            if not vocab_token.startswith(token):
+                break
+            factor = 1.0 if vocab_token == token else PREFIX_FACTOR
+            for id, weight in self._postings[vocab_token].items():
+                score = weight * factor
+                if score > scores.get(id, 0.0):
+                    scores[id] = score
+        return scores
+
+    @timed("search")
+    def search(self, q="", category=None, min_price=None, max_price=None, page=1, page_size=20):
+        """Return ``(products, total)`` for one page of ranked results.
+
+        Every query token must match (exactly or as a prefix). Results are
+        ordered by text relevance boosted by rating; without a query they are
+        ordered by rating alone.
+        """
+        self.ensure_current()
+        with self._lock:
+            candidates = None
+            if category:
+                candidates = set(self._categories.get(category.strip().lower(), ()))
+            if min_price is not None or max_price is not None:
+                columns = self._arrays()
+                prices = columns["prices"]
+                lo = np.searchsorted(prices, min_price, side="left") if min_price is not None else 0
+                hi = np.searchsorted(prices, max_price, side="right") if max_price is not None else len(prices)
+                in_range = set(columns["price_ids"][lo:hi].tolist())
+                candidates = in_range if candidates is None else candidates & in_range
+
+            tokens = tokenize(q)
+            if tokens:
+                scores = None
+                for token in dict.fromkeys(tokens):
+                    matched = self._match(token)
+                    if scores is None:
+                        scores = matched
+                    else:
+                        scores = {id: s + matched[id] for id, s in scores.items() if id in matched}
+                    if not scores:
+                        break
+                scores = scores or {}
+                if candidates is not None:
+                    scores = {id: s for id, s in scores.items() if id in candidates}
+                ranked = sorted(
+                    scores,
+                    key=lambda id: (-scores[id] * (1 + _number(self._rows[id].get("rating")) / 10), id),
+                )
+            else:
+                ranked = self._arrays()["rating_ids"]
+                if candidates is not None:
+                    ranked = ranked[np.isin(ranked, np.fromiter(candidates, dtype=np.int64))]
+
+            total = len(ranked)
+            start = max(page - 1, 0) * page_size
+            page_ids = [int(id) for id in ranked[start:start + page_size]]
+            return [dict(self._rows[id]) for id in page_ids], total
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._rows),
+                "tokens": len(self._vocab),
+                "rebuilds": self.rebuilds,
+                "incremental_updates": self.incremental_updates,
+            }
+
+
+product_index = ProductSearchIndex()
+subscribe(product_index.on_change)
@@ -0,0 +1,347 @@
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import session
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from services.storage import _clean, get_storage, subscribe
+
+USERS_SHEET = "users"
+SESSION_FILE = "sessions.db"
+DEFAULT_TTL = 24 * 3600
+# A session's expiry is pushed back at most once per this many seconds
+REFRESH_INTERVAL = 60
+PURGE_INTERVAL = 60
+MAX_MEMORY_SESSIONS = 100_000
+
+
+def _role(value):
+    value = _clean(value)
+    return "" if value is None else str(value).strip().lower()
+
+
+# ---------- Stores ----------
+class SessionStore:
+    """Session data by id, each with an absolute expiry time (epoch seconds).
+
+    ``sessions(user_id)`` and ``revoke`` make bulk revocation and auditing
+    possible without any cookie in hand.
+    """
+
+    def load(self, sid):
+        """Return ``(data, expires)`` for a live session, else None."""
+        raise NotImplementedError
+
+    def save(self, sid, data, expires):
+        raise NotImplementedError
+
+    def delete(self, sid):
+        self.revoke([sid])
+
+    def revoke(self, sids):
+        raise NotImplementedError
+
+    def sessions(self, user_id=None):
+        """``[(sid, data, expires)]`` of live sessions, optionally of one user."""
+        raise NotImplementedError
+
+    def purge_expired(self):
+        raise NotImplementedError
+
+    def revoke_user(self, user_id):
+        sids = [sid for sid, _, _ in self.sessions(user_id)]
+        self.revoke(sids)
+        return len(sids)
+
+    def sync_user(self, user_id, user):
+        """Apply a change to ``user_id``'s row: revoke the sessions if the user
+        is gone or no longer has their role."""
+        revoked = [
+            sid for sid, data, _ in self.sessions(user_id)
+            if user is None or _role(user.get("role")) != _role(data.get("role"))
+        ]
+        self.revoke(revoked)
+        return len(revoked)
+
+    def on_change(self, sheet, op, id, row):
+        """Storage listener: keep sessions in step with the users sheet."""
+        if sheet != USERS_SHEET:
+            return
+        if op == "write":
+            existing = set(get_storage().read(USERS_SHEET)["id"].map(_clean))
+            stale = [sid for sid, data, _ in self.sessions() if data.get("user_id") not in existing]
+            self.revoke(stale)
+        elif op in ("update", "delete"):
+            self.sync_user(_clean(id), row if op == "update" else None)
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions of a single process, least recently used dropped past ``max_sessions``."""
+
+    def __init__(self, max_sessions=MAX_MEMORY_SESSIONS):
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # sid -> (data, expires)
+        self._by_user = {}              # user id -> {sid: None}
+
+    def _unlink(self, sid):
+        entry = self._sessions.pop(sid, None)
+        if entry is not None:
+            sids = self._by_user.get(entry[0].get("user_id"))
+            if sids is not None:
+                sids.pop(sid, None)
+                if not sids:
+                    del self._by_user[entry[0].get("user_id")]
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self._unlink(sid)
+                return None
+            self._sessions.move_to_end(sid)
+            return dict(entry[0]), entry[1]
+
+    def save(self, sid, data, expires):
+        with self._lock:
+            self._unlink(sid)
+            self._sessions[sid] = (dict(data), expires)
+            self._by_user.setdefault(data.get("user_id"), {})[sid] = None
+            while len(self._sessions) > self.max_sessions:
+                self._unlink(next(iter(self._sessions)))
+
+    def revoke(self, sids):
+        with self._lock:
+            for sid in sids:
+                self._unlink(sid)
+
+    def sessions(self, user_id=None):
+        now = time.time()
+        with self._lock:
+            sids = list(self._by_user.get(user_id, ())) if user_id is not None else list(self._sessions)
+            return [
+                (sid, dict(self._sessions[sid][0]), self._sessions[sid][1])
+                for sid in sids if self._sessions[sid][1] > now
+            ]
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (_, expires) in self._sessions.items() if expires <= now]
+            for sid in expired:
+                self._unlink(sid)
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._sessions), "users": len(self._by_user)}
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path=SESSION_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS "sessions" '
+                "(sid TEXT PRIMARY KEY, user_id INTEGER, data TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS "idx_sessions_user_id" ON "sessions" (user_id)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS "idx_sessions_expires" ON "sessions" (expires)')
+
+    def load(self, sid):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data, expires FROM "sessions" WHERE sid = ? AND expires > ?', (sid, time.time())
+            ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def save(self, sid, data, expires):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO "sessions" (sid, user_id, data, expires) VALUES (?, ?, ?, ?)',
+                (sid, data.get("user_id"), json.dumps(data, default=_clean), expires),
+            )
+
+    def revoke(self, sids):
+        if not sids:
+            return
+        with self._lock:
+            self._conn.executemany('DELETE FROM "sessions" WHERE sid = ?', [(sid,) for sid in sids])
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            return self._conn.execute('DELETE FROM "sessions" WHERE user_id = ?', (user_id,)).rowcount
+
+    def sessions(self, user_id=None):
+        query, args = 'SELECT sid, data, expires FROM "sessions" WHERE expires > ?', [time.time()]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            args.append(user_id)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [(sid, json.loads(data), expires) for sid, data, expires in rows]
+
+    def purge_expired(self):
+        with self._lock:
+            return self._conn.execute('DELETE FROM "sessions" WHERE expires <= ?', (time.time(),)).rowcount
+
+    def stats(self):
+        with self._lock:
+            count, users = self._conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT user_id) FROM "sessions" WHERE expires > ?', (time.time(),)
+            ).fetchone()
+        return {"backend": "sqlite", "sessions": count, "users": users}
+
+
+# ---------- Flask integration ----------
+class ServerSession(CallbackDict, SessionMixin):
+    """Session whose data lives in a store; the cookie only carries its id."""
+
+    def __init__(self, initial=None, sid=None, expires=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires = expires
+        # The user the id was issued to; logging in as someone else gets a new id
+        self.owner = (initial or {}).get("user_id")
+        self.modified = False
+        self.accessed = False
+
+    # Reading marks the session accessed, like Flask's cookie session, so
+    # responses that depend on it get "Vary: Cookie".
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps sessions in ``store`` and sends only a signed random id.
+
+    Expired sessions are dropped when looked up and swept from the store
+    every ``purge_interval`` seconds by a background thread.
+    """
+
+    session_class = ServerSession
+    salt = "session-id"
+
+    def __init__(self, store, ttl=DEFAULT_TTL, purge_interval=PURGE_INTERVAL):
+        self.store = store
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.purged = 0
+        self._thread = None
+        subscribe(store.on_change)
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def _purge(self):
+        while True:
+            time.sleep(self.purge_interval)
+            try:
+                self.purged += self.store.purge_expired()
+            except Exception:
+                pass
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._purge, name="session-purger", daemon=True)
+            self._thread.start()
+
+    def open_session(self, app, request):
+        self._start()
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            entry = self.store.load(sid) if sid else None
+            if entry is not None:
+                return self.session_class(entry[0], sid=sid, expires=entry[1])
+        return self.session_class()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain, path = self.get_cookie_domain(app), self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if not session:
+            if session.sid is not None:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        rotated = session.sid is None or session.get("user_id") != session.owner
+        if rotated:
+            # A new id on every login, so an id known before it is worthless
+            if session.sid is not None:
+                self.store.delete(session.sid)
+            session.sid, session.owner = secrets.token_urlsafe(32), session.get("user_id")
+        now = time.time()
+        if rotated or session.modified or session.expires - now < self.ttl - REFRESH_INTERVAL:
+            session.expires = now + self.ttl
+            self.store.save(session.sid, dict(session), session.expires)
+        if rotated or self.should_set_cookie(app, session):
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode(),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+                domain=domain,
+                path=path,
+            )
+
+    def stats(self):
+        return dict(self.store.stats(), ttl=self.ttl, purged=self.purged)
+
+
+def init_app(app, backend="sqlite", path=SESSION_FILE, ttl=DEFAULT_TTL):
+    """Store ``app``'s sessions server-side ("memory" or "sqlite"); "cookie" keeps Flask's default."""
+    if backend == "cookie":
+        return None
+    if backend == "memory":
+        store = MemorySessionStore()
+    elif backend == "sqlite":
+        store = SQLiteSessionStore(path)
+    else:
+        raise ValueError(f"Unknown session backend: {backend}")
+    app.session_interface = ServerSideSessionInterface(store, ttl=ttl)
+    return app.session_interface
+
+
+# ---------- Helpers ----------
+def login_user(user, role):
+    """Start ``user``'s session (the index entry or row that authenticated)."""
+    session["user_id"] = user["id"]
+    session["username"] = user.get("username")
+    session["role"] = role
+
@@ -0,0 +1,201 @@
+import json
+import mmap
+import os
+import pickle
+import re
+import shutil
+import struct
+import threading
+
+import numpy as np
+import pandas as pd
+
+from services.locking import FileLock, atomic_replace
+
+SHARED_SUFFIX = ".shared"
+MANIFEST_FILE = "manifest.json"
+GENERATION_FILE = "generation"
+FRAME_FILE = "frame.pkl"
+# Bump when the on-disk layout changes so old directories are republished
+SHARED_FORMAT = 2
+# Column dtypes stored as raw .npy files and mapped instead of unpickled
+MAPPED_KINDS = "biufcmM"
+
+
+def shared_path(path):
+    return path + SHARED_SUFFIX
+
+
+class SharedFrames:
+    """Sheets published as memory-mapped column files that every worker shares.
+
+    Each published version of a sheet is a directory holding one ``.npy``
+    file per numeric/boolean/datetime column (and for the codes of each
+    categorical one) and a small pickle with the column names, the index,
+    the categories and the remaining (text) columns. Workers map
+    the ``.npy`` files copy-on-write, so those columns live once in the page
+    cache however many workers there are; text columns are still unpickled
+    per worker, since pandas keeps strings as Python objects.
+
+    ``manifest.json`` names the current directory of every sheet and the
+    workbook signature it was built from. A 64-bit generation counter in a
+    mapped file is bumped after each publish; comparing it with the last
+    value seen is a plain memory read, so workers notice another worker's
+    write on their next access and remap only the sheets that changed.
+    Publishing happens under ``lock``.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = FileLock(os.path.join(directory, "publish.lock"))
+        self._map_lock = threading.Lock()
+        self._counter = None
+        self._manifest = None
+        self._manifest_generation = None
+        self.publishes = 0
+        self.maps = 0
+
+    # ---------- Generation counter ----------
+    def _counter_map(self):
+        if self._counter is None:
+            with self._map_lock:
+                if self._counter is None:
+                    fd = os.open(os.path.join(self.directory, GENERATION_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+                    try:
+                        if os.fstat(fd).st_size < 8:
+                            os.ftruncate(fd, 8)
+                        self._counter = mmap.mmap(fd, 8)
+                    finally:
+                        os.close(fd)
+        return self._counter
+
+    def generation(self):
+        return struct.unpack_from("<q", self._counter_map())[0]
+
+    def _bump(self):
+        counter = self._counter_map()
+        generation = struct.unpack_from("<q", counter)[0] + 1
+        struct.pack_into("<q", counter, 0, generation)
+        return generation
+
+    # ---------- Manifest ----------
+    def manifest(self):
+        """Return ``(generation, manifest)``; the manifest is None if nothing is published."""
+        generation = self.generation()
+        if self._manifest_generation != generation:
+            try:
+                with open(os.path.join(self.directory, MANIFEST_FILE), encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (FileNotFoundError, ValueError):
+                manifest = None
+            if manifest is not None and manifest.get("format") != SHARED_FORMAT:
+                manifest = None
+            self._manifest, self._manifest_generation = manifest, generation
+        return generation, self._manifest
+
+    def forget(self):
+        """Re-read the manifest on the next call (e.g. a directory vanished)."""
+        self._manifest_generation = None
+
+    # ---------- Publishing (caller holds ``lock``) ----------
+    def _write_frame(self, name, version, df):
+        folder = f"{name}.v{version}"
+        target = os.path.join(self.directory, folder)
+        tmp = f"{target}.tmp{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        data = []
+        for position in range(df.shape[1]):
+            column = df.iloc[:, position].reset_index(drop=True)
+            dtype = column.dtype
+            if isinstance(dtype, np.dtype) and dtype.kind in MAPPED_KINDS and len(column):
+                file = f"{position}.npy"
+                np.save(os.path.join(tmp, file), column.to_numpy())
+                data.append(("mapped", file))
+            elif isinstance(dtype, pd.CategoricalDtype) and len(column):
+                file = f"{position}.npy"
+                np.save(os.path.join(tmp, file), column.cat.codes.to_numpy())
+                data.append(("categorical", (file, dtype)))
+            else:
+                data.append(("inline", column))
+        meta = {"columns": list(df.columns), "index": df.index, "data": data}
+        with open(os.path.join(tmp, FRAME_FILE), "wb") as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+        shutil.rmtree(target, ignore_errors=True)
+        os.rename(tmp, target)
+        return folder
+
+    def _prune(self, name, keep):
+        """Remove old versions of ``name`` except the directories in ``keep``.
+
+        The previous version stays on disk so a worker that read the old
+        manifest a moment ago can still map it.
+        """
+        pattern = re.compile(re.escape(name) + r"\.v\d+(\.tmp\d+)?$")
+        for entry in os.listdir(self.directory):
+            if pattern.match(entry) and entry not in keep:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+    def publish(self, frames, workbook, replace=False, unchanged=None):
+        """Publish ``frames`` ({sheet: df}) as built from the workbook with signature ``workbook``.
+
+        With ``replace`` the sheets not in ``frames`` are dropped. Sheets for
+        which ``unchanged(name, entry)`` is true keep their current version.
+        Returns the new ``(generation, manifest)``.
+        """
+        _, current = self.manifest()
+        old = dict(current["sheets"]) if current else {}
+        sheets = {} if replace else dict(old)
+        version = self.generation() + 1
+        for name, df in frames.items():
+            entry = old.get(name)
+            if entry is not None and unchanged is not None and unchanged(name, entry):
+                sheets[name] = entry
+                continue
+            sheets[name] = {"version": version, "dir": self._write_frame(name, version, df)}
+
+        manifest = {
+            "format": SHARED_FORMAT,
+            "workbook": list(workbook) if workbook is not None else None,
+            "sheets": sheets,
+        }
+
+        def write(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+
+        atomic_replace(os.path.join(self.directory, MANIFEST_FILE), write)
+        generation = self._bump()
+        self._manifest, self._manifest_generation = manifest, generation
+        self.publishes += 1
+        for name in set(old) | set(sheets):
+            keep = {entry["dir"] for entry in (old.get(name), sheets.get(name)) if entry}
+            self._prune(name, keep)
+        return generation, manifest
+
+    # ---------- Mapping ----------
+    def load(self, entry):
+        """DataFrame for a manifest entry, its numeric columns mapped from disk."""
+        folder = os.path.join(self.directory, entry["dir"])
+        with open(os.path.join(folder, FRAME_FILE), "rb") as f:
+            meta = pickle.load(f)
+        data = {}
+        for position, (kind, value) in enumerate(meta["data"]):
+            # "c" maps copy-on-write: pages stay shared until this process
+            # writes to them, and such writes never reach the file.
+            if kind == "mapped":
+                data[position] = np.load(os.path.join(folder, value), mmap_mode="c")
+            elif kind == "categorical":
+                codes = np.load(os.path.join(folder, value[0]), mmap_mode="c")
+                data[position] = pd.Categorical.from_codes(codes, dtype=value[1], validate=False)
+            else:
+                data[position] = value
+        df = pd.DataFrame(data, index=pd.RangeIndex(len(meta["index"])), copy=False)
+        df.columns = meta["columns"]
+        df.index = meta["index"]
+        self.maps += 1
+        return df
+
+    def stats(self):
+        return {"generation": self.generation(), "publishes": self.publishes, "maps": self.maps}
@@ -0,0 +1,292 @@
+import os
+import shutil
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+
+import pandas as pd
+
+from services.jobs import jobs, task
+from services.locking import stage_file
+from services.metrics import count_bytes, count_rows, span
+from services.schema import apply_dtypes
+from services.shared_frames import SharedFrames, shared_path
+from services.snapshot import file_checksum, load_snapshot, parse_workbook, save_snapshot
+
+EXCEL_FILE = "data_new.xlsx"
+
+# Live caches by workbook path, for the background snapshot job
+_caches = weakref.WeakValueDictionary()
+
+
+class SheetCache:
+    """Keeps every sheet of the workbook parsed in memory.
+
+    The whole workbook is parsed in one go on the first read and again only
+    when the file's inode/mtime/size changes behind our back. Writes made
+    through the cache update the stored copy directly, so they never cause a
+    reload. Writes go to a copy of the workbook that is then renamed over the
+    original, so a crash mid-write never leaves a half-written .xlsx behind.
+
+    With ``snapshot`` on, the parsed sheets are also kept in a binary sidecar
+    (see ``services.snapshot``) tagged with the workbook's checksum. A cold
+    start loads that instead of parsing the workbook whenever the checksum
+    still matches, and a background job refreshes it after writes through
+    the cache.
+
+    With ``shared`` on, the sheets are published once to a
+    ``services.shared_frames`` directory next to the workbook and every
+    worker maps them from there instead of holding its own parsed copy.
+    Versions then come from that directory's manifest, so they agree across
+    workers, and a write by any worker is picked up on the next access.
+    """
+
+    def __init__(self, path, snapshot=True, shared=False):
+        self.path = path
+        self.snapshot = snapshot
+        self.shared = SharedFrames(shared_path(path)) if shared else None
+        self._lock = threading.RLock()
+        self._frames = {}
+        self._versions = {}
+        self._signature = None
+        self._generation = None
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.snapshot_loads = 0
+        self.parses = 0
+        self.last_load_ms = 0.0
+        _caches[path] = self
+
+    # ---------- Helpers ----------
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _load(self, signature):
+        started = time.perf_counter()
+        if not self.snapshot:
+            frames = self._parse(signature)
+        else:
+            checksum = file_checksum(self.path)
+            with span("snapshot.load"):
+                frames = load_snapshot(self.path, checksum)
+            if frames is not None:
+                self.snapshot_loads += 1
+            else:
+                frames = self._parse(signature)
+                # Only trust the checksum if the file did not change while
+                # we were parsing it.
+                if self._stat() == signature:
+                    self._save_snapshot(frames, checksum)
+        self.last_load_ms = (time.perf_counter() - started) * 1000
+        return frames
+
+    def _parse(self, signature):
+        with span("excel.parse"):
+            frames = parse_workbook(self.path)
+        self.parses += 1
+        count_bytes("read", "xlsx", signature[2])
+        return frames
+
+    def _save_snapshot(self, frames, checksum=None):
+        try:
+            save_snapshot(self.path, frames, checksum or file_checksum(self.path))
+        except OSError:
+            # The snapshot is only an accelerator; the workbook stays authoritative
+            pass
+
+    def _ensure_fresh(self):
+        if self.shared is not None:
+            return self._ensure_shared()
+        signature = self._stat()
+        if self._signature is not None and signature == self._signature:
+            return True
+        if self._signature is not None:
+            self.reloads += 1
+        frames = self._load(signature) if signature is not None else {}
+        # Only sheets whose content actually differs get a new version, so
+        # another process writing "orders" does not invalidate "products".
+        for name in set(frames) | set(self._frames):
+            old, new = self._frames.get(name), frames.get(name)
+            if old is None or new is None or not old.equals(new):
+                self._versions[name] = self._versions.get(name, 0) + 1
+        self._frames = frames
+        self._signature = signature
+        return False
+
+    def _ensure_shared(self):
+        generation, signature = self.shared.generation(), self._stat()
+        if self._generation == generation and self._signature == signature:
+            return True
+        for _ in range(3):
+            generation, manifest = self.shared.manifest()
+            if manifest is None or manifest["workbook"] != (list(signature) if signature else None):
+                generation, manifest = self._publish_workbook()
+            try:
+                self._map(manifest)
+                break
+            except FileNotFoundError:
+                # Another worker pruned a version between our manifest read
+                # and the mapping; look again.
+                self.shared.forget()
+        else:
+            raise RuntimeError(f"Could not map the shared sheets of {self.path}")
+        if self._signature is not None:
+            self.reloads += 1
+        self._generation = generation
+        self._signature = tuple(manifest["workbook"]) if manifest["workbook"] else None
+        return False
+
+    def _publish_workbook(self):
+        """Load the workbook (snapshot or parse) and publish every sheet of it."""
+        with self.shared.lock:
+            # Someone else may have published it while we waited
+            generation, manifest = self.shared.manifest()
+            signature = self._stat()
+            if manifest is not None and manifest["workbook"] == (list(signature) if signature else None):
+                return generation, manifest
+            frames = self._load(signature) if signature is not None else {}
+
+            def unchanged(name, entry):
+                old = self._frames.get(name) if self._versions.get(name) == entry["version"] else None
+                if old is None:
+                    old = self.shared.load(entry)
+                return old.equals(frames[name])
+
+            return self.shared.publish(frames, signature, replace=True, unchanged=unchanged)
+
+    def _map(self, manifest):
+        frames, versions = {}, {}
+        for name, entry in manifest["sheets"].items():
+            if self._versions.get(name) == entry["version"] and name in self._frames:
+                frames[name] = self._frames[name]
+            else:
+                frames[name] = self.shared.load(entry)
+            versions[name] = entry["version"]
+        self._frames, self._versions = frames, versions
+
+    # ---------- Public API ----------
+    def read(self, sheet_name):
+        """Return a private copy of ``sheet_name`` (raises KeyError if missing)."""
+        with self._lock:
+            if self._ensure_fresh():
+                self.hits += 1
+            else:
+                self.misses += 1
+            if sheet_name not in self._frames:
+                raise KeyError(sheet_name)
+            df = self._frames[sheet_name]
+            count_rows("read", sheet_name, len(df))
+            # Copy-on-write: the caller's frame shares our columns (mapped or
+            # not) until either side changes them.
+            return df.copy(deep=False)
+
+    def _stage(self, sheet_name, df, exists):
+        """Build the workbook with ``sheet_name`` replaced in a temporary file."""
+
+        def write(tmp):
+            mode = "w"
+            kwargs = {}
+            if exists:
+                shutil.copyfile(self.path, tmp)
+                mode, kwargs = "a", {"if_sheet_exists": "replace"}
+            with pd.ExcelWriter(tmp, mode=mode, engine="openpyxl", **kwargs) as writer:
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+        with span("excel.write"):
+            return stage_file(self.path, write)
+
+    def write(self, sheet_name, df):
+        """Replace ``sheet_name`` in the workbook and in the cache.
+
+        Callers serialize writes (ExcelStorage holds its file lock). The new
+        workbook is built without holding ``_lock``, so reads of the cached
+        sheets carry on meanwhile; only swapping it in holds the lock.
+        """
+        with self._lock:
+            # Make sure the other cached sheets are current before we adopt
+            # the post-write signature for them.
+            self._ensure_fresh()
+            base = self._signature
+        staged = self._stage(sheet_name, df, base is not None)
+        publishing = self.shared.lock if self.shared is not None else nullcontext()
+        with self._lock, publishing:
+            try:
+                if self._stat() != base:
+                    # Changed behind our back (not through a cache): rebuild
+                    # from the current file, this time under the lock.
+                    os.remove(staged)
+                    self._ensure_fresh()
+                    staged = self._stage(sheet_name, df, self._signature is not None)
+                os.replace(staged, self.path)
+            except BaseException:
+                if os.path.exists(staged):
+                    os.remove(staged)
+                raise
+            count_rows("written", sheet_name, len(df))
+            stored = df.copy()
+            stored.columns = stored.columns.astype(str).str.strip().str.lower()
+            stored = apply_dtypes(sheet_name, stored)
+            self._signature = self._stat()
+            count_bytes("written", "xlsx", self._signature[2])
+            if self.shared is not None:
+                with span("shared.publish"):
+                    self._generation, manifest = self.shared.publish({sheet_name: stored}, self._signature)
+                self._map(manifest)
+            else:
+                self._frames[sheet_name] = stored
+                self._versions[sheet_name] = self._versions.get(sheet_name, 0) + 1
+            if self.snapshot:
+                # Pickling every sheet is as slow as the write itself; a
+                # burst of writes is coalesced into a single background save.
+                jobs.enqueue("sheets.save_snapshot", self.path, key=f"snapshot:{self.path}")
+
+    def save_snapshot(self):
+        """Write the snapshot of the cached sheets if they still match the workbook."""
+        with self._lock:
+            frames, signature = dict(self._frames), self._signature
+        if signature is None or self._stat() != signature:
+            return False  # changed by another process; its loader saves a fresh one
+        checksum = file_checksum(self.path)
+        if self._stat() != signature:
+            return False
+        with span("snapshot.save"):
+            self._save_snapshot(frames, checksum)
+        return True
+
+    def version(self, sheet_name):
+        """Counter that changes whenever ``sheet_name``'s content may have changed."""
+        with self._lock:
+            self._ensure_fresh()
+            return self._versions.get(sheet_name, 0)
+
+    def invalidate(self):
+        with self._lock:
+            self._frames = {}
+            self._signature = None
+            self._generation = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "snapshot_loads": self.snapshot_loads,
+                "parses": self.parses,
+                "last_load_ms": round(self.last_load_ms, 2),
+                "sheets": sorted(self._frames),
+                "shared": self.shared.stats() if self.shared is not None else None,
+            }
+
+
+@task("sheets.save_snapshot")
+def save_snapshot_job(path):
+    """Job: refresh the snapshot of the workbook at ``path`` after writes."""
+    cache = _caches.get(path)
+    return cache.save_snapshot() if cache is not None else False
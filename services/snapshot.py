@@ -0,0 +1,82 @@
+import hashlib
+import os
+import pickle
+
+import pandas as pd
+
+from services.locking import atomic_replace
+from services.schema import apply_dtypes
+
+SNAPSHOT_SUFFIX = ".snapshot"
+# Bump when the snapshot layout changes so old files are ignored
+SNAPSHOT_FORMAT = 2
+
+
+def snapshot_path(path):
+    return path + SNAPSHOT_SUFFIX
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """blake2b of the file's bytes (much cheaper than parsing the workbook)."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_workbook(path):
+    """Parse every sheet of the workbook with lower-cased, stripped column
+    names and the declared dtypes (see ``services.schema``)."""
+    frames = pd.read_excel(path, sheet_name=None)
+    for df in frames.values():
+        df.columns = df.columns.astype(str).str.strip().str.lower()
+    return {name: apply_dtypes(name, df) for name, df in frames.items()}
+
+
+def load_snapshot(path, checksum):
+    """Return the sheets stored next to ``path`` if they match ``checksum``, else None.
+
+    The sidecar holds the parsed frames column for column (dtypes included),
+    so loading it skips openpyxl entirely. It is only ever written by this
+    module, next to the workbook it describes.
+    """
+    try:
+        with open(snapshot_path(path), "rb") as f:
+            payload = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Torn, foreign or stale-format file: fall back to the workbook
+        return None
+    if not isinstance(payload, dict) or payload.get("format") != SNAPSHOT_FORMAT:
+        return None
+    if payload.get("checksum") != checksum:
+        return None
+    return payload["frames"]
+
+
+def save_snapshot(path, frames, checksum):
+    """Write ``frames`` as the snapshot of the workbook whose bytes hash to ``checksum``."""
+    payload = {"format": SNAPSHOT_FORMAT, "checksum": checksum, "frames": frames}
+
+    def write(tmp):
+        with open(tmp, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    atomic_replace(snapshot_path(path), write)
+
+
+def rebuild_snapshot(path):
+    """Parse the workbook and rewrite its snapshot; returns {sheet: rows}."""
+    checksum = file_checksum(path)
+    frames = parse_workbook(path)
+    save_snapshot(path, frames, checksum)
+    return {name: len(df) for name, df in frames.items()}
+
+
+def remove_snapshot(path):
+    try:
+        os.remove(snapshot_path(path))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,670 @@
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from services.locking import FileLock, IdSequence
+from services.metrics import count_rows, span
+from services.schema import apply_dtypes
+from services.sheets import EXCEL_FILE, SheetCache
+
+SQLITE_FILE = "data.db"
+
+# Column layout of every sheet. The SQLite backend uses the declared types;
+# the Excel backend only uses the column order when a sheet is missing.
+# In-memory dtypes are declared in services.schema.DTYPES.
+SCHEMAS = {
+    "users": {
+        "id": "INTEGER", "username": "TEXT", "password": "TEXT", "role": "TEXT",
+    },
+    "customers": {
+        "id": "INTEGER", "name": "TEXT", "email": "TEXT", "phone": "TEXT",
+        "address": "TEXT", "role": "TEXT",
+    },
+    "products": {
+        "id": "INTEGER", "name": "TEXT", "price": "REAL", "stock": "INTEGER",
+        "category": "TEXT", "details": "TEXT", "rating": "REAL",
+        "image_url": "TEXT", "seller_id": "INTEGER", "role": "TEXT",
+    },
+    "orders": {
+        "id": "INTEGER", "customerid": "INTEGER", "productid": "INTEGER",
+        "quantity": "INTEGER",
+    },
+    # Live stock of each product, saved by services.inventory (id = product id)
+    "stock": {
+        "id": "INTEGER", "stock": "INTEGER",
+    },
+}
+
+# Secondary indexes created by the SQLite backend.
+INDEXES = {
+    "users": [("username", "role")],
+    "products": [("seller_id",), ("category",)],
+    "orders": [("customerid",), ("productid",)],
+}
+
+
+# Versions of the sheet around the change being announced, per thread (see
+# Storage._emit and advance_version)
+_change = threading.local()
+
+
+def empty_frame(sheet):
+    return pd.DataFrame(columns=list(SCHEMAS.get(sheet, {"id": "INTEGER"})))
+
+
+def _clean(value):
+    """Convert pandas/numpy scalars into plain Python values (NaN -> None)."""
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return value.item() if hasattr(value, "item") else value
+
+
+class Storage:
+    """Interface shared by every backend.
+
+    ``read``/``write`` work on whole sheets as DataFrames; ``get``/``insert``/
+    ``update``/``delete`` work on a single row addressed by its ``id``.
+
+    After every change the backend calls each of ``listeners`` with
+    ``(sheet, op, id, row)``: ``op`` is "insert", "update", "delete" or
+    "write" (whole sheet replaced, ``id``/``row`` are None) and ``row`` is
+    the full row after the change. Only the storage handed out by
+    ``get_storage`` has listeners; backends wrapped by another one are quiet.
+
+    Row changes also carry the sheet's version just before and just after
+    them, read while the write lock was held, so a listener can tell
+    whether anything besides this change happened (``advance_version``).
+    """
+
+    listeners = ()
+
+    def _emit(self, sheet, op, id=None, row=None, versions=None):
+        _change.last = versions
+        if not self.listeners:
+            return
+        outer = getattr(_change, "versions", None)
+        _change.versions = versions
+        try:
+            for listener in list(self.listeners):
+                listener(sheet, op, id, row)
+        finally:
+            _change.versions = outer
+
+    def _emit_rows(self, sheet, op, rows, versions=None):
+        """Emit one event per row of ``rows`` ({id: row}) for a single batch change.
+
+        The first event carries the batch's (before, after) versions, the
+        others (after, after): each applies on top of the previous one.
+        """
+        batch = versions
+        for id, row in rows.items():
+            self._emit(sheet, op, id, row, versions)
+            if versions is not None:
+                versions = (versions[1], versions[1])
+        _change.last = batch
+
+    def version(self, sheet):
+        """Opaque token that changes whenever ``sheet`` may have changed,
+        including changes made by other processes."""
+        raise NotImplementedError
+
+    def read(self, sheet):
+        raise NotImplementedError
+
+    def write(self, sheet, df):
+        raise NotImplementedError
+
+    def get(self, sheet, id):
+        raise NotImplementedError
+
+    def allocate_ids(self, sheet, count=1):
+        """Reserve ``count`` consecutive, never reused ids; return the first."""
+        raise NotImplementedError
+
+    def insert(self, sheet, row):
+        """Insert ``row`` (a dict) and return its id, allocating one if needed."""
+        raise NotImplementedError
+
+    def insert_many(self, sheet, rows):
+        """Insert every row of the DataFrame ``rows`` with freshly allocated
+        ids in a single write; return the list of ids.
+
+        Listeners see one "write" event for the whole batch.
+        """
+        raise NotImplementedError
+
+    def update(self, sheet, id, values):
+        """Update the row ``id`` with ``values``; return False if it is missing."""
+        raise NotImplementedError
+
+    def update_many(self, sheet, updates):
+        """Apply ``updates`` ({id: {column: value}}) in a single write.
+
+        Missing ids are skipped. Returns {id: row after the change} for the
+        rows that were updated; listeners get one "update" event per row.
+        """
+        raise NotImplementedError
+
+    def delete(self, sheet, id):
+        """Delete the row ``id``; return False if it is missing."""
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+# ---------- Excel ----------
+class ExcelStorage(Storage):
+    """Today's behaviour: every change rewrites the whole sheet.
+
+    Each read-modify-write runs under a cross-process lock file next to the
+    workbook, so several gunicorn workers can share it without lost updates.
+    """
+
+    def __init__(self, path=EXCEL_FILE, snapshot=True, shared=False):
+        self.path = path
+        self.cache = SheetCache(path, snapshot=snapshot, shared=shared)
+        self.lock = FileLock(path + ".lock")
+        self.ids = IdSequence(path + ".ids.json")
+        self.ids_lock = FileLock(path + ".ids.lock")
+
+    def read(self, sheet):
+        try:
+            return self.cache.read(sheet)
+        except KeyError:
+            return empty_frame(sheet)
+
+    def write(self, sheet, df):
+        with self.lock:
+            self.cache.write(sheet, df)
+        self._emit(sheet, "write")
+
+    def version(self, sheet):
+        return self.cache.version(sheet)
+
+    def get(self, sheet, id):
+        df = self.read(sheet)
+        rows = df[df["id"] == id]
+        if rows.empty:
+            return None
+        return rows.iloc[0].to_dict()
+
+    def _allocate(self, sheet, df, count=1):
+        current_max = int(df["id"].max()) if not df.empty else 0
+        with self.ids_lock:
+            return self.ids.allocate(sheet, current_max, count)
+
+    def allocate_ids(self, sheet, count=1):
+        # Only the id file's own lock: the sequence never goes below an id
+        # it handed out, so this need not wait for a write in progress.
+        return self._allocate(sheet, self.read(sheet), count)
+
+    def insert(self, sheet, row):
+        with self.lock:
+            before = self.version(sheet)
+            df = self.read(sheet)
+            row = dict(row)
+            if row.get("id") is None:
+                row["id"] = self._allocate(sheet, df)
+            new_row = pd.DataFrame([row], columns=df.columns if len(df.columns) else list(row))
+            df = pd.concat([df, new_row], ignore_index=True) if not df.empty else new_row
+            self.cache.write(sheet, df)
+            versions = (before, self.version(sheet))
+        self._emit(sheet, "insert", row["id"], row, versions)
+        return row["id"]
+
+    def insert_many(self, sheet, rows):
+        if rows.empty:
+            return []
+        rows = rows.drop(columns=["id"], errors="ignore").reset_index(drop=True)
+        with self.lock:
+            df = self.read(sheet)
+            first = self._allocate(sheet, df, len(rows))
+            ids = list(range(first, first + len(rows)))
+            rows.insert(0, "id", ids)
+            df = pd.concat([df, rows], ignore_index=True) if not df.empty else rows
+            self.cache.write(sheet, df)
+        self._emit(sheet, "write")
+        return ids
+
+    def update(self, sheet, id, values):
+        with self.lock:
+            before = self.version(sheet)
+            df = self.read(sheet)
+            idx = df.index[df["id"] == id].tolist()
+            if not idx:
+                return False
+            for col, value in values.items():
+                if col not in df.columns:
+                    df[col] = None
+                try:
+                    df.at[idx[0], col] = value
+                except (TypeError, ValueError):
+                    # e.g. a float price landing in an int64 column
+                    df[col] = df[col].astype(object)
+                    df.at[idx[0], col] = value
+            self.cache.write(sheet, df)
+            row = df.loc[idx[0]].to_dict()
+            versions = (before, self.version(sheet))
+        self._emit(sheet, "update", id, row, versions)
+        return True
+
+    def update_many(self, sheet, updates):
+        if not updates:
+            return {}
+        with self.lock:
+            before = self.version(sheet)
+            df = self.read(sheet)
+            # Like ``update``, only the first row carrying an id is changed
+            targets = df[df["id"].isin(list(updates)) & ~df["id"].duplicated()]
+            if targets.empty:
+                return {}
+            columns = {col for values in updates.values() for col in values}
+            for col in columns:
+                if col not in df.columns:
+                    df[col] = None
+                pairs = [(idx, updates[id][col]) for idx, id in targets["id"].items() if col in updates[id]]
+                idx, values = [p[0] for p in pairs], [p[1] for p in pairs]
+                try:
+                    df.loc[idx, col] = values
+                except (TypeError, ValueError):
+                    df[col] = df[col].astype(object)
+                    df.loc[idx, col] = values
+            self.cache.write(sheet, df)
+            rows = {_clean(df.at[idx, "id"]): df.loc[idx].to_dict() for idx in targets.index}
+            versions = (before, self.version(sheet))
+        self._emit_rows(sheet, "update", rows, versions)
+        return rows
+
+    def delete(self, sheet, id):
+        with self.lock:
+            before = self.version(sheet)
+            df = self.read(sheet)
+            keep = df["id"] != id
+            if keep.all():
+                return False
+            self.cache.write(sheet, df[keep].reset_index(drop=True))
+            versions = (before, self.version(sheet))
+        self._emit(sheet, "delete", id, versions=versions)
+        return True
+
+    def stats(self):
+        return dict(self.cache.stats(), backend="excel", lock=self.lock.stats())
+
+
+# ---------- SQLite ----------
+class SQLiteStorage(Storage):
+    """Row-level storage in a SQLite file with indexed tables.
+
+    Whole-sheet reads are cached and reused until this process writes or
+    another connection commits (tracked through ``PRAGMA data_version``).
+    """
+
+    def __init__(self, path=SQLITE_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._frames = {}
+        self._writes = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock_waits = 0
+        self.lock_wait_total = 0.0
+        self.lock_wait_max = 0.0
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS "_sequences" (sheet TEXT PRIMARY KEY, last INTEGER NOT NULL)'
+            )
+            for sheet in SCHEMAS:
+                self._create_table(sheet)
+
+    # ---------- Helpers ----------
+    def _create_table(self, sheet, extra_columns=()):
+        columns = dict(SCHEMAS.get(sheet, {"id": "INTEGER"}))
+        for col in extra_columns:
+            columns.setdefault(col, "")
+        # ``id`` is indexed but not a PRIMARY KEY: existing workbooks can
+        # contain duplicate ids and the import must not reject them.
+        defs = ", ".join(f'"{col}" {kind}'.rstrip() for col, kind in columns.items())
+        self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{sheet}" ({defs})')
+        for cols in [("id",)] + INDEXES.get(sheet, []):
+            name = f"idx_{sheet}_{'_'.join(cols)}"
+            col_list = ", ".join(f'"{c}"' for c in cols)
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{sheet}" ({col_list})')
+
+    def _columns(self, sheet):
+        return [r["name"] for r in self._conn.execute(f'PRAGMA table_info("{sheet}")')]
+
+    def version(self, sheet):
+        with self._lock:
+            return self._token(sheet)
+
+    def _token(self, sheet):
+        # data_version only moves when *another* connection commits; our own
+        # writes are tracked per sheet.
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        return (version, self._writes.get(sheet, 0))
+
+    def _versions(self, sheet, before):
+        """(before, after) of one write of ours. ``after`` keeps the data_version
+        read before the write, so a commit by another connection that slipped
+        in meanwhile still shows up as a different version later on."""
+        return (before, (before[0], self._writes.get(sheet, 0)))
+
+    def _begin(self):
+        """Open a write transaction, recording how long SQLite's lock took."""
+        started = time.perf_counter()
+        self._conn.execute("BEGIN IMMEDIATE")
+        waited = time.perf_counter() - started
+        self.lock_waits += 1
+        self.lock_wait_total += waited
+        self.lock_wait_max = max(self.lock_wait_max, waited)
+
+    def _changed(self, sheet):
+        self._writes[sheet] = self._writes.get(sheet, 0) + 1
+        self._frames.pop(sheet, None)
+
+    # ---------- Public API ----------
+    def read(self, sheet):
+        with self._lock:
+            token = self._token(sheet)
+            cached = self._frames.get(sheet)
+            if cached is not None and cached[0] == token:
+                self.hits += 1
+                return cached[1].copy()
+            self.misses += 1
+            if not self._columns(sheet):
+                return empty_frame(sheet)
+            with span("sqlite.read"):
+                df = pd.read_sql_query(f'SELECT * FROM "{sheet}" ORDER BY rowid', self._conn)
+            df = apply_dtypes(sheet, df)
+            self._frames[sheet] = (token, df)
+            count_rows("read", sheet, len(df))
+            return df.copy()
+
+    def write(self, sheet, df):
+        df = df.copy()
+        df.columns = df.columns.astype(str).str.strip().str.lower()
+        rows = [tuple(_clean(v) for v in rec) for rec in df.itertuples(index=False)]
+        with self._lock:
+            self._begin()
+            try:
+                self._create_table(sheet, df.columns)
+                missing = [c for c in df.columns if c not in self._columns(sheet)]
+                for col in missing:
+                    self._conn.execute(f'ALTER TABLE "{sheet}" ADD COLUMN "{col}"')
+                self._conn.execute(f'DELETE FROM "{sheet}"')
+                if rows:
+                    col_list = ", ".join(f'"{c}"' for c in df.columns)
+                    marks = ", ".join("?" for _ in df.columns)
+                    with span("sqlite.write"):
+                        self._conn.executemany(
+                            f'INSERT INTO "{sheet}" ({col_list}) VALUES ({marks})', rows
+                        )
+                self._conn.execute("COMMIT")
+                count_rows("written", sheet, len(rows))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._changed(sheet)
+        self._emit(sheet, "write")
+
+    def get(self, sheet, id):
+        with self._lock:
+            row = self._conn.execute(
+                f'SELECT * FROM "{sheet}" WHERE id = ? ORDER BY rowid LIMIT 1', (id,)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def _allocate(self, sheet, count):
+        """Bump the sheet's sequence; the caller must be inside a transaction."""
+        row = self._conn.execute('SELECT last FROM "_sequences" WHERE sheet = ?', (sheet,)).fetchone()
+        current_max = self._conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM "{sheet}"').fetchone()[0]
+        first = max(row[0] if row else 0, current_max) + 1
+        self._conn.execute(
+            'INSERT INTO "_sequences" (sheet, last) VALUES (?, ?) '
+            "ON CONFLICT(sheet) DO UPDATE SET last = excluded.last",
+            (sheet, first + count - 1),
+        )
+        return first
+
+    def allocate_ids(self, sheet, count=1):
+        with self._lock:
+            self._begin()
+            try:
+                first = self._allocate(sheet, count)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return first
+
+    def insert(self, sheet, row):
+        row = {k: _clean(v) for k, v in row.items()}
+        with self._lock:
+            before = self._token(sheet)
+            # BEGIN IMMEDIATE takes SQLite's write lock, so id allocation and
+            # the INSERT are atomic across processes.
+            self._begin()
+            try:
+                if row.get("id") is None:
+                    row["id"] = self._allocate(sheet, 1)
+                col_list = ", ".join(f'"{c}"' for c in row)
+                marks = ", ".join("?" for _ in row)
+                self._conn.execute(
+                    f'INSERT INTO "{sheet}" ({col_list}) VALUES ({marks})', tuple(row.values())
+                )
+                self._conn.execute("COMMIT")
+                count_rows("written", sheet, 1)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._changed(sheet)
+            versions = self._versions(sheet, before)
+        self._emit(sheet, "insert", row["id"], row, versions)
+        return row["id"]
+
+    def insert_many(self, sheet, rows):
+        if rows.empty:
+            return []
+        rows = rows.drop(columns=["id"], errors="ignore")
+        rows.columns = rows.columns.astype(str).str.strip().str.lower()
+        values = [tuple(_clean(v) for v in rec) for rec in rows.itertuples(index=False)]
+        with self._lock:
+            self._begin()
+            try:
+                self._create_table(sheet, rows.columns)
+                for col in [c for c in rows.columns if c not in self._columns(sheet)]:
+                    self._conn.execute(f'ALTER TABLE "{sheet}" ADD COLUMN "{col}"')
+                first = self._allocate(sheet, len(values))
+                ids = list(range(first, first + len(values)))
+                col_list = ", ".join(f'"{c}"' for c in ["id", *rows.columns])
+                marks = ", ".join("?" for _ in range(len(rows.columns) + 1))
+                self._conn.executemany(
+                    f'INSERT INTO "{sheet}" ({col_list}) VALUES ({marks})',
+                    [(id, *row) for id, row in zip(ids, values)],
+                )
+                self._conn.execute("COMMIT")
+                count_rows("written", sheet, len(values))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._changed(sheet)
+        self._emit(sheet, "write")
+        return ids
+
+    def update(self, sheet, id, values):
+        values = {k: _clean(v) for k, v in values.items()}
+        if not values:
+            return self.get(sheet, id) is not None
+        with self._lock:
+            before = self._token(sheet)
+            assignments = ", ".join(f'"{c}" = ?' for c in values)
+            cur = self._conn.execute(
+                f'UPDATE "{sheet}" SET {assignments} WHERE rowid = '
+                f'(SELECT rowid FROM "{sheet}" WHERE id = ? ORDER BY rowid LIMIT 1)',
+                (*values.values(), id),
+            )
+            self._changed(sheet)
+            versions = self._versions(sheet, before)
+        count_rows("written", sheet, cur.rowcount)
+        if cur.rowcount == 0:
+            return False
+        self._emit(sheet, "update", id, self.get(sheet, id) if self.listeners else None, versions)
+        return True
+
+    def update_many(self, sheet, updates):
+        if not updates:
+            return {}
+        # One executemany per distinct set of columns
+        groups = {}
+        for id, values in updates.items():
+            values = {k: _clean(v) for k, v in values.items()}
+            groups.setdefault(tuple(values), []).append((*values.values(), _clean(id)))
+        with self._lock:
+            before = self._token(sheet)
+            self._begin()
+            try:
+                for columns, params in groups.items():
+                    if not columns:
+                        continue
+                    assignments = ", ".join(f'"{c}" = ?' for c in columns)
+                    self._conn.executemany(
+                        f'UPDATE "{sheet}" SET {assignments} WHERE rowid = '
+                        f'(SELECT rowid FROM "{sheet}" WHERE id = ? ORDER BY rowid LIMIT 1)',
+                        params,
+                    )
+                self._conn.execute("COMMIT")
+                count_rows("written", sheet, len(updates))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._changed(sheet)
+            versions = self._versions(sheet, before)
+            ids = [_clean(id) for id in updates]
+            marks = ", ".join("?" for _ in ids)
+            rows = {
+                row["id"]: dict(row)
+                for row in self._conn.execute(
+                    f'SELECT * FROM "{sheet}" WHERE id IN ({marks}) ORDER BY rowid DESC', ids
+                )
+            }
+        self._emit_rows(sheet, "update", rows, versions)
+        return rows
+
+    def delete(self, sheet, id):
+        with self._lock:
+            before = self._token(sheet)
+            cur = self._conn.execute(f'DELETE FROM "{sheet}" WHERE id = ?', (id,))
+            self._changed(sheet)
+            versions = self._versions(sheet, before)
+        if cur.rowcount == 0:
+            return False
+        self._emit(sheet, "delete", id, versions=versions)
+        return True
+
+    def stats(self):
+        with self._lock:
+            lock = {
+                "acquisitions": self.lock_waits,
+                "wait_total_ms": round(self.lock_wait_total * 1000, 3),
+                "wait_max_ms": round(self.lock_wait_max * 1000, 3),
+            }
+            return {"backend": "sqlite", "hits": self.hits, "misses": self.misses, "lock": lock}
+
+
+def import_excel(excel_path=EXCEL_FILE, sqlite_path=SQLITE_FILE):
+    """One-shot copy of every sheet of ``excel_path`` into ``sqlite_path``."""
+    frames = pd.read_excel(excel_path, sheet_name=None)
+    target = SQLiteStorage(sqlite_path)
+    counts = {}
+    for sheet, df in frames.items():
+        sheet = sheet.strip().lower()
+        target.write(sheet, df)
+        counts[sheet] = len(df)
+    return counts
+
+
+# ---------- Backend selection ----------
+_storage = None
+_storage_lock = threading.Lock()
+_listeners = []
+
+
+def subscribe(listener):
+    """Call ``listener(sheet, op, id, row)`` after every change (see Storage)."""
+    _listeners.append(listener)
+    return listener
+
+
+def advance_version(version):
+    """Version to record after a listener applied the change being announced.
+
+    ``version`` is the storage version the listener's data was built at. If
+    it is the one the sheet had just before this change, applying the
+    change brings the data to the version just after it, which is returned.
+    Otherwise something else (usually another process) changed the sheet as
+    well, or the backend cannot tell, and None is returned: the data must
+    be rebuilt, since those other rows were never applied.
+    """
+    versions = getattr(_change, "versions", None)
+    if version is None or versions is None or versions[0] != version:
+        return None
+    return versions[1]
+
+
+def last_change_versions():
+    """(before, after) versions of the last change this thread made, if known.
+
+    Lets a wrapping backend pass on the versions of a change it delegated.
+    """
+    return getattr(_change, "last", None)
+
+
+def configure_storage(backend="excel", excel_file=EXCEL_FILE, sqlite_file=SQLITE_FILE,
+                      journal_file=None, journal_sheets=None, excel_snapshot=True,
+                      excel_shared=False):
+    """Select the storage backend used by every blueprint.
+
+    With ``journal_file`` set, row changes to ``journal_sheets`` (orders, users
+    and customers by default) go through an append-only journal that is
+    compacted into the backend in the background.
+    ``excel_snapshot`` keeps a binary sidecar of the parsed workbook for fast
+    cold starts and ``excel_shared`` lets every worker map one shared copy of
+    the parsed sheets (Excel backend only).
+    """
+    global _storage
+    backend = (backend or "excel").lower()
+    if backend == "excel":
+        storage = ExcelStorage(excel_file, snapshot=excel_snapshot, shared=excel_shared)
+    elif backend == "sqlite":
+        storage = SQLiteStorage(sqlite_file)
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    if journal_file:
+        from services.journal import JOURNAL_SHEETS, JournaledStorage
+        storage = JournaledStorage(storage, journal_file, sheets=journal_sheets or JOURNAL_SHEETS)
+    storage.listeners = _listeners
+    with _storage_lock:
+        _storage = storage
+    return storage
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = ExcelStorage(EXCEL_FILE)
+                _storage.listeners = _listeners
+    return _storage
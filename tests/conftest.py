@@ -0,0 +1,18 @@
+import pytest
+
+from services import storage as storage_module
+from services.jobs import jobs
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in its own directory with no storage configured yet.
+
+    Lock, journal and status files land in ``tmp_path`` instead of the
+    working tree, and a storage configured by one test never leaks into
+    the next.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(storage_module, "_storage", None)
+    jobs.configure(str(tmp_path / "jobs.journal"))
+    return tmp_path
@@ -0,0 +1,101 @@
+import multiprocessing
+import threading
+
+import pandas as pd
+import pytest
+
+from services.inventory import Inventory
+from services.storage import configure_storage
+
+STOCK = 10
+
+
+def open_counters(directory):
+    """The shared counters in ``directory``, as one worker opens them."""
+    return Inventory(str(directory / "stock.counters"), flush_interval=3600)
+
+
+@pytest.fixture
+def products(tmp_path):
+    storage = configure_storage("excel", excel_file=str(tmp_path / "data.xlsx"))
+    storage.write("products", pd.DataFrame({"id": [1, 2], "name": ["Lamp", "Desk"], "stock": [STOCK, 1]}))
+    return storage
+
+
+@pytest.fixture
+def worker(products, tmp_path):
+    """Opens the counters like another worker would; flushes them after the test."""
+    opened = []
+
+    def start():
+        opened.append(open_counters(tmp_path))
+        return opened[-1]
+
+    yield start
+    # While this test's storage is still configured, rather than at exit
+    for counters in opened:
+        counters.flush()
+
+
+def _reserve_in_process(directory, attempts, start, results):
+    configure_storage("excel", excel_file=str(directory / "data.xlsx"))
+    counters = open_counters(directory)
+    start.wait()
+    results.put(sum(counters.reserve(1, 1) for _ in range(attempts)))
+
+
+def test_concurrent_threads_never_oversell(worker):
+    counters = worker()
+    start = threading.Barrier(8)
+    taken = []
+
+    def buy():
+        start.wait()
+        taken.append(sum(counters.reserve(1, 1) for _ in range(5)))
+
+    threads = [threading.Thread(target=buy) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(taken) == STOCK
+    assert counters.available(1) == 0
+    assert counters.rejections == 8 * 5 - STOCK
+
+
+def test_concurrent_processes_never_oversell(products, worker, tmp_path):
+    context = multiprocessing.get_context("spawn")
+    start, results = context.Barrier(4), context.Queue()
+    processes = [
+        context.Process(target=_reserve_in_process, args=(tmp_path, 5, start, results))
+        for _ in range(4)
+    ]
+    for process in processes:
+        process.start()
+    taken = [results.get(timeout=120) for _ in processes]
+    for process in processes:
+        process.join()
+
+    assert sum(taken) == STOCK
+    assert worker().available(1) == 0
+    # Every process flushed at exit: the saved copy agrees with the counters
+    saved = products.read("stock")
+    assert saved["id"].tolist() == [1]
+    assert saved["stock"].tolist() == [0]
+
+
+def test_reserve_many_takes_nothing_when_one_product_is_short(worker):
+    counters = worker()
+    assert counters.reserve_many({1: 3, 2: 2}) == [2]
+    assert counters.available(1) == STOCK
+    assert counters.available(2) == 1
+
+
+def test_counters_survive_a_restart_through_the_stock_sheet(worker, tmp_path):
+    counters = worker()
+    assert counters.reserve(1, 4)
+    counters.flush()
+    (tmp_path / "stock.counters").unlink()
+
+    assert worker().available(1) == STOCK - 4
@@ -0,0 +1,90 @@
+from services.journal import JournaledStorage
+from services.storage import ExcelStorage
+
+
+def open_journal(directory):
+    """A journaled workbook in ``directory``, as a freshly started worker opens it."""
+    inner = ExcelStorage(str(directory / "data.xlsx"))
+    # Compaction only runs when a test asks for it
+    return JournaledStorage(inner, str(directory / "sheets.journal"), interval=3600)
+
+
+def crash(journal):
+    """Abandon ``journal`` the way a killed worker does: nothing more is compacted."""
+    journal._closed = True
+
+
+def order(customer, quantity=1):
+    return {"customerid": customer, "productid": 10, "quantity": quantity}
+
+
+def test_replays_uncompacted_records_after_a_crash(tmp_path):
+    journal = open_journal(tmp_path)
+    kept = journal.insert("orders", order(1))
+    dropped = journal.insert("orders", order(2))
+    journal.update("orders", kept, {"quantity": 5})
+    journal.delete("orders", dropped)
+    crash(journal)
+    assert journal.inner.read("orders").empty
+
+    restarted = open_journal(tmp_path)
+    assert restarted.replayed == 4
+    orders = restarted.read("orders")
+    assert orders["id"].tolist() == [kept]
+    assert orders["quantity"].tolist() == [5]
+    # Ids handed out before the crash are never handed out again
+    assert restarted.insert("orders", order(3)) > dropped
+
+
+def test_compaction_folds_records_into_the_workbook(tmp_path):
+    journal = open_journal(tmp_path)
+    ids = [journal.insert("orders", order(customer)) for customer in (1, 2, 3)]
+    crash(journal)
+
+    restarted = open_journal(tmp_path)
+    assert restarted.compact() == 3
+    assert restarted.inner.read("orders")["id"].tolist() == ids
+    assert open_journal(tmp_path).replayed == 0
+
+
+def test_crash_between_workbook_write_and_truncation_is_harmless(tmp_path):
+    journal = open_journal(tmp_path)
+    ids = [journal.insert("orders", order(customer)) for customer in (1, 2)]
+    journal.update("orders", ids[0], {"quantity": 7})
+    # What compact() does, minus truncating the journal afterwards
+    records = journal._snapshot()
+    folded = journal._overlay(journal.inner.read("orders"), journal._changes("orders", records))
+    journal.inner.write("orders", folded)
+    crash(journal)
+
+    restarted = open_journal(tmp_path)
+    assert restarted.replayed == 3
+    # Inserts are upserts by id, so replaying them adds no duplicates
+    assert restarted.read("orders")["id"].tolist() == ids
+    restarted.compact()
+    orders = restarted.inner.read("orders")
+    assert orders["id"].tolist() == ids
+    assert orders["quantity"].tolist() == [7, 1]
+
+
+def test_torn_last_record_is_ignored(tmp_path):
+    journal = open_journal(tmp_path)
+    id = journal.insert("orders", order(1))
+    crash(journal)
+    with open(journal.path, "ab") as f:
+        f.write(b'{"sheet": "orders", "op": "insert", "id": ')
+
+    restarted = open_journal(tmp_path)
+    assert restarted.replayed == 1
+    assert restarted.read("orders")["id"].tolist() == [id]
+    restarted.compact()
+    assert restarted.inner.read("orders")["id"].tolist() == [id]
+    assert open_journal(tmp_path).replayed == 0
+
+
+def test_appends_from_another_worker_are_visible(tmp_path):
+    ours, theirs = open_journal(tmp_path), open_journal(tmp_path)
+    id = theirs.insert("orders", order(4))
+    assert ours.get("orders", id)["customerid"] == 4
+    ours.compact()
+    assert theirs.read("orders")["id"].tolist() == [id]
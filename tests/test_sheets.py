@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+
+from services.storage import ExcelStorage
+
+
+def products(*names):
+    return pd.DataFrame({"id": range(1, len(names) + 1), "name": list(names), "stock": 1})
+
+
+@pytest.fixture(params=[False, True], ids=["private", "shared"])
+def workers(request, tmp_path):
+    """(ours, theirs): two workers' storage of one workbook, mapped or parsed each."""
+    path = str(tmp_path / "data.xlsx")
+    ExcelStorage(path).write("products", products("Lamp"))
+    return ExcelStorage(path, shared=request.param), ExcelStorage(path, shared=request.param)
+
+
+def test_a_write_is_seen_by_the_other_worker(workers):
+    ours, theirs = workers
+    assert theirs.read("products")["name"].tolist() == ["Lamp"]
+    before = theirs.version("products")
+
+    ours.write("products", products("Lamp", "Desk"))
+    assert theirs.version("products") != before
+    assert theirs.read("products")["name"].tolist() == ["Lamp", "Desk"]
+
+
+def test_writes_from_both_workers_are_kept(workers):
+    ours, theirs = workers
+    ours.read("products")
+    theirs.read("products")
+
+    ours.insert("products", {"name": "Desk", "stock": 1})
+    theirs.insert("products", {"name": "Chair", "stock": 1})
+    for storage in workers:
+        assert storage.read("products")["name"].tolist() == ["Lamp", "Desk", "Chair"]
+
+
+def test_other_sheets_keep_their_version(workers):
+    ours, theirs = workers
+    theirs.read("products")
+    before = theirs.version("orders")
+
+    ours.insert("products", {"name": "Desk", "stock": 1})
+    assert theirs.version("orders") == before